@@ -8,6 +8,7 @@ from django.conf import settings
 from django.template.loader import render_to_string
 from django.template import RequestContext
 from django.contrib.auth.models import User, AnonymousUser
+from django.db import transaction
 from django.utils import timezone
 from django.utils.translation import ugettext_noop, ugettext_lazy as _
 
@@ -16,6 +17,8 @@ from oioioi.rankings.controllers import DefaultRankingController, \
         CONTEST_RANKING_KEY
 from oioioi.contests.models import SubmissionReport, Submission, \
         ProblemInstance, UserResultForProblem
+from oioioi.acm.models import RoundFreezeSnapshot, \
+        FrozenUserResultForProblem
 from oioioi.acm.score import BinaryScore, format_time, ACMScore
 from oioioi.contests.utils import rounds_times
 from oioioi.participants.controllers import ParticipantsController, \
@@ -33,6 +36,10 @@ class ACMContestController(ProgrammingContestController):
     def registration_controller(self):
         return ParticipantsController(self.contest)
 
+    def supports_incremental_user_results(self):
+        # Penalties make ACM scores non-invertible.
+        return False
+
     def get_round_freeze_time(self, round):
         """Returns time after which any further updates should be non-public.
         """
@@ -137,11 +144,46 @@ class ACMContestController(ProgrammingContestController):
 
             if last_submission.status == 'OK':
                 # FIXME: May not ignore submissions with admin-hacked same-date
-                submissions.filter(date__gt=last_submission.date) \
-                        .update(status='IGN', score=None)
+                later_submissions = submissions \
+                        .filter(date__gt=last_submission.date)
+                if 'oioioi.statistics' in settings.INSTALLED_APPS:
+                    # QuerySet.update sends no signals, so the statistics
+                    # store has to be updated explicitly.
+                    from oioioi.statistics.models import \
+                            bulk_update_submission_status
+                    bulk_update_submission_status(later_submissions, 'IGN',
+                            score=None, score_sort_key=None)
+                else:
+                    later_submissions.update(status='IGN', score=None,
+                                             score_sort_key=None)
         else:
             result.submission_report = None
 
+    def update_user_results(self, user, problem_instance):
+        super(ACMContestController, self).update_user_results(user,
+                problem_instance)
+        self._update_frozen_result(user, problem_instance)
+
+    def _update_frozen_result(self, user, problem_instance):
+        """Updates the stored result of the frozen ranking (see
+           :class:`~oioioi.acm.models.RoundFreezeSnapshot`), e.g. after
+           a submission sent before the freeze was rejudged.
+        """
+        with transaction.atomic():
+            snapshot = RoundFreezeSnapshot.objects.select_for_update() \
+                    .filter(round=problem_instance.round_id).first()
+            if snapshot is None:
+                return
+            FrozenUserResultForProblem.objects.filter(user=user,
+                    problem_instance=problem_instance).delete()
+            FrozenUserResultForProblem.objects.bulk_create(
+                    FrozenUserResultForProblem(user_id=r.user_id,
+                            problem_instance_id=r.problem_instance_id,
+                            score=r.score)
+                    for r in self.ranking_controller()._get_old_results(
+                            snapshot.freeze_time, [problem_instance],
+                            [user]))
+
     def results_visible(self, request, submission):
         return False
 
@@ -251,12 +293,15 @@ class ACMRankingController(DefaultRankingController):
         return self.contest.controller.registration_controller() \
             .filter_participants(queryset)
 
-    def _get_old_results(self, freeze_time, pis, users):
+    def _get_old_results(self, freeze_time, pis, users=None):
         controller = self.contest.controller
         submissions = Submission.objects \
-                .filter(problem_instance__in=pis, user__in=users,
-                     kind='NORMAL', date__lt=freeze_time) \
-                .exclude(status__in=IGNORED_STATUSES) \
+                .filter(problem_instance__in=pis, kind='NORMAL',
+                        date__lt=freeze_time) \
+                .exclude(status__in=IGNORED_STATUSES)
+        if users is not None:
+            submissions = submissions.filter(user__in=users)
+        submissions = submissions \
                 .select_related('user', 'problem_instance') \
                 .order_by('user', 'problem_instance', 'date')
         results = []
@@ -270,6 +315,38 @@ class ACMRankingController(DefaultRankingController):
                 results.append(result)
         return results
 
+    def _get_frozen_results(self, round, freeze_time, pis, users):
+        """Returns the users' results for the problems of the round as of
+           the freeze time.
+
+           The results of all users are computed once and stored (see
+           :class:`~oioioi.acm.models.RoundFreezeSnapshot`), so later
+           rebuilds of the ranking only read them.
+        """
+        with transaction.atomic():
+            snapshot, created = RoundFreezeSnapshot.objects \
+                    .select_for_update() \
+                    .get_or_create(round=round,
+                                   defaults={'freeze_time': freeze_time})
+            if created or snapshot.freeze_time != freeze_time:
+                FrozenUserResultForProblem.objects \
+                        .filter(problem_instance__round=round).delete()
+                FrozenUserResultForProblem.objects.bulk_create(
+                        FrozenUserResultForProblem(user_id=r.user_id,
+                                problem_instance_id=r.problem_instance_id,
+                                score=r.score)
+                        for r in self._get_old_results(freeze_time, pis))
+                snapshot.freeze_time = freeze_time
+                snapshot.save()
+        return FrozenUserResultForProblem.objects \
+                .filter(problem_instance__in=pis, user__in=users) \
+                .select_related('problem_instance__round')
+
+    def update_ranking(self, key, data, changes):
+        # Results of frozen rounds are not based on UserResultForProblem,
+        # so we always rebuild the whole ranking.
+        return None
+
     def serialize_ranking(self, key):
         controller = self.contest.controller
         rounds = list(self._rounds_for_key(key))
@@ -310,7 +387,8 @@ class ACMRankingController(DefaultRankingController):
                     .select_related('submission_report', 'problem_instance',
                             'problem_instance__contest')
             else:
-                results += self._get_old_results(freeze_time, rpis, users)
+                results += self._get_frozen_results(round, freeze_time,
+                                                    rpis, users)
                 frozen = True
 
         data = self._get_users_results(pis, results, rounds, users)
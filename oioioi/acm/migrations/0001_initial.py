@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import oioioi.contests.fields
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contests', '0009_filefield'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FrozenUserResultForProblem',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('score', oioioi.contests.fields.ScoreField(max_length=255, null=True, blank=True)),
+                ('problem_instance', models.ForeignKey(to='contests.ProblemInstance')),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RoundFreezeSnapshot',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('freeze_time', models.DateTimeField()),
+                ('round', models.OneToOneField(related_name='acm_freeze_snapshot', to='contests.Round')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='frozenuserresultforproblem',
+            unique_together=set([('user', 'problem_instance')]),
+        ),
+    ]
@@ -1,9 +1,39 @@
+from django.contrib.auth.models import User
+from django.db import models
 from django.utils.translation import ugettext_lazy as _
 from oioioi.base.utils.deps import check_django_app_dependencies
-from oioioi.contests.models import submission_statuses
+from oioioi.contests.fields import ScoreField
+from oioioi.contests.models import submission_statuses, Round, \
+        ProblemInstance
+# pylint: disable=unused-import
+from oioioi.acm.score import ACMScore  # Registers the ACM score types
 
 
 check_django_app_dependencies(__name__, ['oioioi.participants'])
 
 
 submission_statuses.register('IGN', _("Ignored"))
+
+
+class RoundFreezeSnapshot(models.Model):
+    """Marks that the users' results for problems of the round as of
+       the ranking freeze time are stored as
+       :class:`FrozenUserResultForProblem` instances.
+
+       The results are computed once, when the frozen ranking is built for
+       the first time, and are recomputed only if the freeze time changes.
+    """
+    round = models.OneToOneField(Round, related_name='acm_freeze_snapshot')
+    freeze_time = models.DateTimeField()
+
+
+class FrozenUserResultForProblem(models.Model):
+    """User result for the problem, taking into account only submissions
+       sent before the ranking freeze (see :class:`RoundFreezeSnapshot`).
+    """
+    user = models.ForeignKey(User)
+    problem_instance = models.ForeignKey(ProblemInstance)
+    score = ScoreField(blank=True, null=True)
+
+    class Meta(object):
+        unique_together = ('user', 'problem_instance')
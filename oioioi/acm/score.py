@@ -47,6 +47,9 @@ class BinaryScore(ScoreValue):
     def to_int(self):
         return int(self.accepted)
 
+    def to_sort_key(self):
+        return int(self.accepted)
+
 
 class ACMScore(ScoreValue):
     """ACM style score consisting of number of solved problems, total time
@@ -154,3 +157,6 @@ class ACMScore(ScoreValue):
 
     def to_int(self):
         return self.problems_solved
+
+    def to_sort_key(self):
+        return 10**10 * self.problems_solved - self.total_time
@@ -4,8 +4,11 @@ import re
 from django.core.urlresolvers import reverse
 from django.utils.timezone import utc
 
+from django.contrib.auth.models import User
+
+from oioioi.acm.models import RoundFreezeSnapshot
 from oioioi.base.tests import TestCase, fake_timezone_now
-from oioioi.contests.models import Contest
+from oioioi.contests.models import Contest, ProblemInstance, Submission
 
 # The following tests use full-contest fixture, which may be changed this way:
 # 1. Create new database, do migrate
@@ -120,6 +123,32 @@ class TestACMRanking(TestCase):
             response = self.client.get(url)
             self.assertEqual(response.content.count('data-result_url'), 8)
 
+    def test_frozen_results_snapshot(self):
+        contest = Contest.objects.get()
+        rcontroller = contest.controller.ranking_controller()
+
+        def ranked_users():
+            data = rcontroller.serialize_ranking('regular#1')
+            self.assertTrue(data['frozen'])
+            return sorted(row['user'].id for row in data['rows'])
+
+        # round 1 is frozen at 00:40
+        with fake_timezone_now(datetime(2013, 12, 15, 1, 0, tzinfo=utc)):
+            self.assertEqual(ranked_users(), [2, 3])
+            self.assertTrue(RoundFreezeSnapshot.objects
+                            .filter(round_id=1).exists())
+
+            # Later rebuilds read the stored results...
+            Submission.objects.filter(user_id=2).update(
+                    date=datetime(2013, 12, 15, 1, 0, tzinfo=utc))
+            self.assertEqual(ranked_users(), [2, 3])
+
+            # ...which are updated together with the user's results.
+            user = User.objects.get(id=2)
+            for pi in ProblemInstance.objects.filter(round_id=1):
+                contest.controller.update_user_results(user, pi)
+            self.assertEqual(ranked_users(), [3])
+
     def test_model_solution_submission_view(self):
         contest = Contest.objects.get()
         url = reverse('submission',
@@ -4,13 +4,16 @@ import codecs
 import os.path
 import shutil
 
-from django.core.files.base import File
+from django.core.files.base import ContentFile
 
 from oioioi.base.utils.execute import execute
 from oioioi.filetracker.utils import stream_file
 
 
-def generate_pdf(tex_code, filename, extra_args=[], num_passes=3):
+def compile_latex(tex_code, extra_args=[], num_passes=3):
+    """Compiles the LaTeX code with pdflatex and returns the contents of
+       the produced PDF file.
+    """
     # Create temporary file and folder
     tmp_folder = tempfile.mkdtemp()
     try:
@@ -27,7 +30,12 @@ def generate_pdf(tex_code, filename, extra_args=[], num_passes=3):
             execute(command, cwd=tmp_folder)
 
         # Get PDF file contents
-        pdf_file = open(os.path.splitext(tex_path)[0] + '.pdf')
-        return stream_file(File(pdf_file), filename)
+        with open(os.path.splitext(tex_path)[0] + '.pdf', 'rb') as pdf_file:
+            return pdf_file.read()
     finally:
         shutil.rmtree(tmp_folder)
+
+
+def generate_pdf(tex_code, filename, extra_args=[], num_passes=3):
+    pdf = compile_latex(tex_code, extra_args, num_passes)
+    return stream_file(ContentFile(pdf), filename)
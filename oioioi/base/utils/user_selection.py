@@ -60,7 +60,7 @@ def _get_user_q_expression(substr, user_field_name=None):
     return q_expression
 
 
-def _get_user_hints(substr, queryset, user_field_name=None):
+def get_user_hints(substr, queryset, user_field_name=None):
     if substr is None:
         return None
     substr = unicode(substr)
@@ -81,7 +81,7 @@ def _get_user_hints(substr, queryset, user_field_name=None):
 @jsonify
 def get_user_hints_view(request, request_field_name, queryset=None,
         user_field_name=None):
-    user_hints = _get_user_hints(request.GET.get(request_field_name, ''),
+    user_hints = get_user_hints(request.GET.get(request_field_name, ''),
             queryset, user_field_name)
     if user_hints is None:
         raise Http404
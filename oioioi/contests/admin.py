@@ -12,7 +12,7 @@ from django.shortcuts import redirect, render
 from django.utils.translation import ugettext_lazy as _, ungettext_lazy
 from django.utils.html import conditional_escape
 from django.utils.encoding import force_unicode
-from django.db.models import Value
+from django.db.models import BigIntegerField, Value
 from django.db.models.functions import Coalesce
 
 from oioioi.base import admin
@@ -23,9 +23,10 @@ from oioioi.contests.menu import contest_admin_menu_registry, \
         contest_observer_menu_registry
 from oioioi.contests.models import Contest, Round, ProblemInstance, \
         Submission, ContestAttachment, RoundTimeExtension, ContestPermission, \
-        submission_kinds, ContestLink, SubmissionReport
+        submission_kinds, ContestLink, SubmissionReport, RejudgeJob
 from oioioi.contests.utils import is_contest_admin, is_contest_observer
 from oioioi.contests.current_contest import set_cc_id
+from oioioi.contests.tasks import rejudge_submissions_job
 from oioioi.programs.models import Test, TestReport
 from oioioi.problems.models import ProblemSite, ProblemPackage
 
@@ -477,23 +478,24 @@ class SubmissionAdmin(admin.ModelAdmin):
         tests = request.POST.getlist('tests', [])
         subs_ids = [int(x) for x in request.POST.getlist('submissions', [])]
         rejudge_type = request.POST['rejudge_type']
-        submissions = Submission.objects.in_bulk(subs_ids)
-        all_reports_exist = True
-        for sub in submissions.values():
-            if not SubmissionReport.objects.filter(submission=sub,
-                                                   status='ACTIVE') \
-                                           .exists():
-                all_reports_exist = False
-                break
+        submissions_count = Submission.objects.filter(id__in=subs_ids) \
+                .count()
+        with_active_reports = SubmissionReport.objects \
+                .filter(submission_id__in=subs_ids, status='ACTIVE') \
+                .values('submission_id').distinct().count()
+        all_reports_exist = with_active_reports == submissions_count
 
         if all_reports_exist or rejudge_type == 'FULL':
-            for sub in submissions.values():
-                sub.problem_instance.controller.judge(sub,
-                                 is_rejudge=True,
-                                 extra_args={'tests_to_judge': tests,
-                                             'rejudge_type': rejudge_type})
-
-            counter = len(submissions)
+            # Queueing may take long for many submissions, so it's done in
+            # background.
+            rejudge_submissions_job.delay(sorted(subs_ids),
+                                          {'tests_to_judge': tests,
+                                           'rejudge_type': rejudge_type},
+                                          contest_id=request.contest and
+                                                     request.contest.id,
+                                          creator_id=request.user.id)
+
+            counter = submissions_count
             self.message_user(
                 request,
                 ungettext_lazy("Queued one submission for rejudge.",
@@ -580,30 +582,24 @@ class SubmissionAdmin(admin.ModelAdmin):
         # order which is "newest first"
         queryset = queryset.order_by('id')
 
-        pis = {s.problem_instance for s in queryset}
-        pis_count = len(pis)
-        sub_count = len(queryset)
+        pis = ProblemInstance.objects.filter(submission__in=queryset) \
+                .distinct()
+        pis_count = pis.count()
+        sub_count = queryset.count()
         self.message_user(
             request,
             _("You have selected %(sub_count)d submission(s) from "
               "%(pis_count)d problem(s)") % {'sub_count': sub_count,
                                                 'pis_count': pis_count})
-        uses_is_active = False
-        for pi in pis:
-            if Test.objects.filter(problem_instance=pi,
-                                   is_active=False) \
-                           .exists():
-                uses_is_active = True
-                break
-        if not uses_is_active:
-            for sub in queryset:
-                if TestReport.objects.filter(
-                        submission_report__submission=sub,
+        uses_is_active = Test.objects.filter(problem_instance__in=pis,
+                                             is_active=False).exists() \
+                or TestReport.objects.filter(
+                        submission_report__submission__in=queryset,
                         submission_report__status='ACTIVE',
-                        test__is_active=False).exists():
-                    uses_is_active = True
-                    break
+                        test__is_active=False).exists()
 
+        queryset = queryset.select_related('problem_instance__problem',
+                                           'user')
         return render(request, 'contests/tests_choice.html',
                       {'form': TestsSelectionForm(request,
                                                   queryset,
@@ -623,10 +619,13 @@ class SubmissionAdmin(admin.ModelAdmin):
                        .filter(problem_instance__contest=request.contest)
         queryset = queryset.order_by('-id')
 
-        # Because nulls are treated as highest by default,
-        # this is a workaround to make them smaller than other values.
+        # Scores are ordered by their numeric sort keys, as serialized
+        # scores compare as strings. Because nulls are treated as highest
+        # by default, this is a workaround to make them smaller than other
+        # values.
         queryset = queryset.annotate(score_with_nulls_smallest=
-                                     Coalesce('score', Value('')))
+                Coalesce('score_sort_key',
+                         Value(-2 ** 63, output_field=BigIntegerField())))
         return queryset
 
     def lookup_allowed(self, key, value):
@@ -662,6 +661,41 @@ admin.system_admin_menu_registry.register('managesubmissions_admin',
                 kwargs={'contest_id': None}), order=50)
 
 
+class RejudgeJobAdmin(admin.ModelAdmin):
+    list_display = ['creation_date', 'creator', 'progress_display']
+    list_display_links = None
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        if obj:
+            return False
+        return is_contest_admin(request)
+
+    def has_delete_permission(self, request, obj=None):
+        return is_contest_admin(request)
+
+    def progress_display(self, instance):
+        return _("%(done)d of %(total)d submissions queued") % {
+                'done': instance.submissions_done,
+                'total': instance.submissions_total}
+    progress_display.short_description = _("Progress")
+
+    def get_queryset(self, request):
+        return super(RejudgeJobAdmin, self).get_queryset(request) \
+                .filter(contest=request.contest)
+
+    def get_custom_list_select_related(self):
+        return super(RejudgeJobAdmin, self) \
+                .get_custom_list_select_related() + ['creator']
+
+contest_site.contest_register(RejudgeJob, RejudgeJobAdmin)
+contest_admin_menu_registry.register('rejudgejob_admin', _("Rejudges"),
+        lambda request: reverse('oioioiadmin:contests_rejudgejob_changelist'),
+        order=45)
+
+
 class RoundTimeRoundListFilter(SimpleListFilter):
     title = _("round")
     parameter_name = 'round'
@@ -0,0 +1,140 @@
+"""Write-behind buffer of contest views.
+
+   When ``settings.BUFFER_CONTEST_VIEWS`` is enabled, views of contests by
+   logged in users are not saved to the database on every request.
+   Instead, they are kept in memory of the process and saved in bulk by
+   :func:`flush_contest_views`, at most every
+   ``settings.CONTEST_VIEWS_FLUSH_INTERVAL`` seconds or after
+   ``settings.CONTEST_VIEWS_BUFFER_SIZE`` views. The latest views of every
+   user are also stored in the cache, so that the recent contests menu of
+   any process may see them before they are saved (see
+   :func:`buffered_contest_views`).
+"""
+
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction, IntegrityError
+from django.db.models import Case, When, Value, F, DateTimeField
+
+from oioioi.contests.models import Contest, ContestView
+
+logger = logging.getLogger(__name__)
+
+_USER_VIEWS_CACHE_TIMEOUT = 24 * 60 * 60
+# Number of views whose timestamps are updated by a single query.
+_UPDATE_CHUNK_SIZE = 100
+
+_lock = threading.Lock()
+# Maps (user_id, contest_id) to the timestamp of the latest view.
+_pending = {}
+_last_flush = [time.time()]
+
+
+def _user_views_cache_key(user_id):
+    return 'contests/contest_views/%s' % (user_id,)
+
+
+def buffered_contest_views(user_id):
+    """Returns a dictionary mapping ids of contests to timestamps of
+       the latest views by the user, which may not be saved to the database
+       yet.
+    """
+    return cache.get(_user_views_cache_key(user_id)) or {}
+
+
+def record_contest_view(user_id, contest_id, timestamp):
+    """Records that the user viewed the contest at the given time.
+
+       The view is saved to the database by a later call to
+       :func:`flush_contest_views`, which is triggered automatically.
+    """
+    key = _user_views_cache_key(user_id)
+    views = cache.get(key) or {}
+    # Do not repeatedly update timestamp for latest contest.
+    if views and max(views, key=views.get) == contest_id:
+        return
+    views[contest_id] = timestamp
+    cache.set(key, views, _USER_VIEWS_CACHE_TIMEOUT)
+
+    with _lock:
+        _pending[(user_id, contest_id)] = timestamp
+        should_flush = len(_pending) >= settings.CONTEST_VIEWS_BUFFER_SIZE \
+                or time.time() - _last_flush[0] \
+                    >= settings.CONTEST_VIEWS_FLUSH_INTERVAL
+    if should_flush:
+        flush_contest_views()
+
+
+def _save_views(views):
+    user_ids = set(user_id for user_id, _contest_id in views)
+    contest_ids = set(contest_id for _user_id, contest_id in views)
+    # Users and contests may have been deleted in the meantime.
+    user_ids &= set(User.objects.filter(id__in=user_ids)
+                    .values_list('id', flat=True))
+    contest_ids &= set(Contest.objects.filter(id__in=contest_ids)
+                       .values_list('id', flat=True))
+    existing = dict(((cv.user_id, cv.contest_id), cv) for cv in
+                    ContestView.objects.filter(user_id__in=user_ids,
+                                               contest_id__in=contest_ids))
+    new_views = []
+    updated_views = []
+    for (user_id, contest_id), timestamp in views.iteritems():
+        if user_id not in user_ids or contest_id not in contest_ids:
+            continue
+        cv = existing.get((user_id, contest_id))
+        if cv is None:
+            new_views.append(ContestView(user_id=user_id,
+                    contest_id=contest_id, timestamp=timestamp))
+        elif cv.timestamp < timestamp:
+            updated_views.append((cv.id, timestamp))
+    for i in xrange(0, len(updated_views), _UPDATE_CHUNK_SIZE):
+        chunk = updated_views[i:i + _UPDATE_CHUNK_SIZE]
+        # Timestamps saved by other processes in the meantime are kept
+        # if they are later.
+        ids = [cv_id for cv_id, _timestamp in chunk]
+        ContestView.objects.filter(id__in=ids).update(timestamp=Case(
+                *[When(id=cv_id, timestamp__lt=timestamp,
+                       then=Value(timestamp, output_field=DateTimeField()))
+                  for cv_id, timestamp in chunk],
+                default=F('timestamp'), output_field=DateTimeField()))
+    ContestView.objects.bulk_create(new_views)
+
+
+def _save_views_one_by_one(views):
+    for (user_id, contest_id), timestamp in views.iteritems():
+        with transaction.atomic():
+            if not User.objects.filter(id=user_id).exists() or \
+                    not Contest.objects.filter(id=contest_id).exists():
+                continue
+            cv, created = ContestView.objects.get_or_create(user_id=user_id,
+                    contest_id=contest_id,
+                    defaults={'timestamp': timestamp})
+            if not created and cv.timestamp < timestamp:
+                cv.timestamp = timestamp
+                cv.save()
+
+
+def flush_contest_views():
+    """Saves the buffered contest views of this process to the database."""
+    with _lock:
+        views = dict(_pending)
+        _pending.clear()
+        _last_flush[0] = time.time()
+    if not views:
+        return
+    try:
+        with transaction.atomic():
+            _save_views(views)
+    except IntegrityError:
+        # Another process created some of the views at the same time.
+        _save_views_one_by_one(views)
+    logger.debug("Saved %d contest views", len(views))
+
+
+atexit.register(flush_contest_views)
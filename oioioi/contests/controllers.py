@@ -15,12 +15,13 @@ from oioioi.base.utils import RegisteredSubclassesBase, ObjectWithMixins, \
         get_user_display_name
 from oioioi.contests.models import Submission, Round, UserResultForRound, \
         UserResultForProblem, UserResultForContest, submission_kinds, \
-        ProblemStatementConfig, RoundTimeExtension
+        RoundTimeExtension, invalidate_user_problem_results
 from oioioi.contests.scores import ScoreValue
 from oioioi.contests.models import Contest
 from oioioi.contests.utils import visible_problem_instances, rounds_times, \
         generic_rounds_times, is_contest_admin, is_contest_observer, \
-        last_break_between_rounds, has_any_active_round
+        last_break_between_rounds, has_any_active_round, \
+        statements_visibility, contest_statements_visibility
 from oioioi.problems.controllers import ProblemController
 
 
@@ -446,9 +447,12 @@ class ContestController(RegisteredSubclassesBase, ObjectWithMixins):
         context = self.make_context(request_or_context)
         if context.is_admin:
             return True
-        psc = ProblemStatementConfig.objects.filter(contest=context.contest)
-        if psc.exists() and psc[0].visible != 'AUTO':
-            return psc[0].visible == 'YES'
+        if isinstance(request_or_context, ContestControllerContext):
+            visible = contest_statements_visibility(context.contest)
+        else:
+            visible = statements_visibility(request_or_context)
+        if visible != 'AUTO':
+            return visible == 'YES'
         else:
             return self.default_can_see_statement(request_or_context,
                     problem_instance)
@@ -508,6 +512,16 @@ class ContestController(RegisteredSubclassesBase, ObjectWithMixins):
         submission.problem_instance.problem.controller \
             .judge(submission, extra_args, is_rejudge)
 
+    def judge_many(self, submissions, extra_args=None, is_rejudge=False):
+        by_problem = {}
+        for submission in submissions:
+            problem = submission.problem_instance.problem
+            by_problem.setdefault(problem.id, (problem, []))[1] \
+                    .append(submission)
+        for problem, problem_submissions in by_problem.itervalues():
+            problem.controller.judge_many(problem_submissions, extra_args,
+                                          is_rejudge)
+
     def fill_evaluation_environ(self, environ, submission):
         pass
 
@@ -593,6 +607,59 @@ class ContestController(RegisteredSubclassesBase, ObjectWithMixins):
                 .values_list('score', flat=True)
         result.score = self._sum_scores(scores)
 
+    def supports_incremental_user_results(self):
+        """Tells whether :meth:`update_user_results` may update
+           :class:`~oioioi.contests.models.UserResultForRound` and
+           :class:`~oioioi.contests.models.UserResultForContest` by applying
+           the change of a single problem's (round's) score to them, instead
+           of recomputing them from scratch.
+
+           This is correct only if the scores are aggregated by summing them
+           (as in :meth:`update_user_result_for_round` and
+           :meth:`update_user_result_for_contest`), so controllers which
+           aggregate scores in a different way must return ``False``.
+           Score classes not supporting subtraction always fall back to the
+           full recomputation.
+        """
+        return True
+
+    def _apply_score_change(self, score, old, new):
+        """Returns ``score`` with its component ``old`` replaced by ``new``.
+
+           Raises :exc:`ValueError` if the result can't be computed this way
+           and the aggregate must be recomputed.
+        """
+        if isinstance(old, basestring):
+            old = ScoreValue.deserialize(old)
+        if isinstance(new, basestring):
+            new = ScoreValue.deserialize(new)
+        if old is None and new is None:
+            return score
+        if new is None:
+            # The aggregate may become None.
+            raise ValueError("Score removed")
+        if old is None:
+            return new if score is None else score + new
+        if score is None:
+            raise ValueError("Inconsistent aggregate")
+        try:
+            return score + new - old
+        except (NotImplementedError, TypeError):
+            raise ValueError("Score doesn't support subtraction")
+
+    def _update_result_incrementally(self, result, old, new, created):
+        """Applies the change of the component score to the aggregate
+           ``result`` and returns ``True``, or returns ``False`` if the
+           result must be recomputed.
+        """
+        if created or not self.supports_incremental_user_results():
+            return False
+        try:
+            result.score = self._apply_score_change(result.score, old, new)
+        except ValueError:
+            return False
+        return True
+
     def update_user_results(self, user, problem_instance):
         """Updates score for problem instance, round and contest.
 
@@ -602,6 +669,11 @@ class ContestController(RegisteredSubclassesBase, ObjectWithMixins):
            * :class:`~oioioi.contests.models.UserResultForContest`
 
            and then calls proper methods of ContestController to update them.
+
+           If :meth:`supports_incremental_user_results` allows it, the
+           round and contest results are updated by applying the change of
+           the problem's score, without querying the other problems' and
+           rounds' results.
         """
         round = problem_instance.round
         contest = round.contest
@@ -614,13 +686,19 @@ class ContestController(RegisteredSubclassesBase, ObjectWithMixins):
 
         # First: UserResultForProblem
 
-        problem.controller.update_user_results(user, problem_instance)
+        old_score, new_score = \
+                problem.controller.update_user_results(user, problem_instance)
+        invalidate_user_problem_results(contest.id, user.id)
 
         # Second: UserResultForRound
         with transaction.atomic():
             result, created = UserResultForRound.objects.select_for_update() \
                 .get_or_create(user=user, round=round)
-            self.update_user_result_for_round(result)
+            old_round_score = result.score
+            if not self._update_result_incrementally(result, old_score,
+                                                     new_score, created):
+                self.update_user_result_for_round(result)
+            new_round_score = result.score
             result.save()
 
         # Third: UserResultForContest
@@ -628,7 +706,13 @@ class ContestController(RegisteredSubclassesBase, ObjectWithMixins):
             result, created = UserResultForContest.objects \
                     .select_for_update() \
                     .get_or_create(user=user, contest=contest)
-            self.update_user_result_for_contest(result)
+            if round.is_trial:
+                # Trial rounds don't count to the contest result.
+                old_round_score = new_round_score = None
+            if not self._update_result_incrementally(result, old_round_score,
+                                                     new_round_score,
+                                                     created):
+                self.update_user_result_for_contest(result)
             result.save()
 
     def filter_my_visible_submissions(self, request, queryset):
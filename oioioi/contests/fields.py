@@ -1,5 +1,6 @@
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.signals import pre_save
 from django.utils.translation import ugettext_lazy as _
 from oioioi.contests.scores import ScoreValue
 
@@ -45,3 +46,57 @@ class ScoreField(models.CharField):
             return None
 
         return ScoreValue.deserialize(value)
+
+
+def score_sort_key(score):
+    """Returns the :meth:`~oioioi.contests.scores.ScoreValue.to_sort_key`
+       of a score, which may also be ``None`` or a serialized score.
+    """
+    if isinstance(score, basestring):
+        score = ScoreValue.deserialize(score)
+    if score is None:
+        return None
+    return score.to_sort_key()
+
+
+class ScoreSortKeyField(models.BigIntegerField):
+    """Model field holding the numeric sort key (see
+       :meth:`~oioioi.contests.scores.ScoreValue.to_sort_key`) of the score
+       stored in another field of the model, so that the scores may be
+       sorted and compared at db level.
+
+       The key is updated whenever the model is saved, including raw saves
+       (i.e. loading fixtures). When saving with ``update_fields`` or
+       updating a queryset, the key must be updated together with
+       the score.
+    """
+
+    def __init__(self, score_field='score', *args, **kwargs):
+        self.score_field = score_field
+        kwargs.setdefault('null', True)
+        kwargs.setdefault('blank', True)
+        kwargs.setdefault('editable', False)
+        super(ScoreSortKeyField, self).__init__(*args, **kwargs)
+
+    def deconstruct(self):
+        name, path, args, kwargs = super(ScoreSortKeyField, self) \
+                .deconstruct()
+        if self.score_field != 'score':
+            kwargs['score_field'] = self.score_field
+        return name, path, args, kwargs
+
+    def pre_save(self, model_instance, add):
+        value = score_sort_key(getattr(model_instance, self.score_field))
+        setattr(model_instance, self.attname, value)
+        return value
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super(ScoreSortKeyField, self).contribute_to_class(cls, name,
+                                                           **kwargs)
+        if not cls._meta.abstract:
+            pre_save.connect(self._update_on_raw_save, sender=cls)
+
+    def _update_on_raw_save(self, sender, instance, raw=False, **kwargs):
+        # Raw saves don't call pre_save() of the fields.
+        if raw:
+            self.pre_save(instance, False)
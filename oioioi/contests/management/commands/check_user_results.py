@@ -0,0 +1,69 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.translation import ugettext as _
+
+from oioioi.contests.models import Contest, UserResultForRound, \
+        UserResultForContest
+
+
+class Command(BaseCommand):
+    args = ""
+    help = _("Check whether users' results for rounds and contests match "
+             "the results recomputed from scratch and fix the inconsistent "
+             "ones. Results are updated incrementally after submissions get "
+             "judged, so this is meant to be run periodically.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('-c', '--contest',
+                    action='store',
+                    type='string',
+                    dest='contest_id',
+                    help=_("Check only this contest")),
+        make_option('-n', '--dry-run',
+                    action='store_true',
+                    default=False,
+                    dest='dry_run',
+                    help=_("Only report the inconsistent results")),
+    )
+
+    def _check(self, model, result_id, update, dry_run):
+        with transaction.atomic():
+            result = model.objects.select_for_update() \
+                    .select_related('user').get(id=result_id)
+            old_score = result.score
+            update(result)
+            if old_score == result.score:
+                return 0
+            self.stdout.write("%s (%s %s): %s -> %s\n" % (
+                    result.user.username, model._meta.verbose_name,
+                    result_id, old_score, result.score))
+            if not dry_run:
+                result.save()
+            return 1
+
+    def _check_contest(self, contest, dry_run):
+        controller = contest.controller
+        inconsistent = 0
+        for result_id in UserResultForRound.objects \
+                .filter(round__contest=contest).values_list('id', flat=True):
+            inconsistent += self._check(UserResultForRound, result_id,
+                    controller.update_user_result_for_round, dry_run)
+        for result_id in UserResultForContest.objects \
+                .filter(contest=contest).values_list('id', flat=True):
+            inconsistent += self._check(UserResultForContest, result_id,
+                    controller.update_user_result_for_contest, dry_run)
+        return inconsistent
+
+    def handle(self, *args, **options):
+        contests = Contest.objects.all()
+        if options['contest_id']:
+            contests = contests.filter(id=options['contest_id'])
+
+        inconsistent = 0
+        for contest in contests:
+            inconsistent += self._check_contest(contest,
+                                                options['dry_run'])
+        self.stdout.write(_("%d inconsistent results found.\n")
+                          % inconsistent)
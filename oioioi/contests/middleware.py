@@ -4,6 +4,7 @@ from django.core.urlresolvers import reverse, resolve, NoReverseMatch
 from django.core.exceptions import PermissionDenied
 from django.http import Http404, HttpResponseRedirect
 
+from oioioi.contests.contest_view_buffer import record_contest_view
 from oioioi.contests.models import Contest, ContestView
 from oioioi.contests.utils import visible_contests
 from oioioi.contests.current_contest import set_cc_id, ContestMode, contest_re
@@ -29,6 +30,10 @@ def activate_contest(request, contest):
 
     if not request.real_user.is_anonymous() \
             and not request.session.get('first_view_after_logging', False):
+        if settings.BUFFER_CONTEST_VIEWS:
+            record_contest_view(request.real_user.id, contest.id,
+                                request.timestamp)
+            return
         cv, created = ContestView.objects \
                 .get_or_create(user=request.real_user, contest=contest)
         # Do not repeatedly update timestamp for latest contest.
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import oioioi.contests.fields
+
+
+def fill_score_sort_keys(apps, schema_editor):
+    for model_name in ('Submission', 'ScoreReport', 'UserResultForProblem',
+                       'UserResultForRound', 'UserResultForContest'):
+        model = apps.get_model('contests', model_name)
+        scores = model.objects.exclude(score=None) \
+                .values_list('score', flat=True).distinct().order_by()
+        for score in scores:
+            model.objects.filter(score=score).update(
+                    score_sort_key=score.to_sort_key())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contests', '0009_filefield'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='submission',
+            name='score_sort_key',
+            field=oioioi.contests.fields.ScoreSortKeyField(db_index=True, null=True, editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='scorereport',
+            name='score_sort_key',
+            field=oioioi.contests.fields.ScoreSortKeyField(null=True, editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='userresultforproblem',
+            name='score_sort_key',
+            field=oioioi.contests.fields.ScoreSortKeyField(db_index=True, null=True, editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='userresultforround',
+            name='score_sort_key',
+            field=oioioi.contests.fields.ScoreSortKeyField(db_index=True, null=True, editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='userresultforcontest',
+            name='score_sort_key',
+            field=oioioi.contests.fields.ScoreSortKeyField(db_index=True, null=True, editable=False, blank=True),
+        ),
+        migrations.RunPython(fill_score_sort_keys,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contests', '0010_score_sort_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RejudgeJob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('creation_date', models.DateTimeField(default=django.utils.timezone.now, verbose_name='creation date')),
+                ('submissions_done', models.IntegerField(default=0, verbose_name='queued submissions')),
+                ('submissions_total', models.IntegerField(default=0, verbose_name='submissions')),
+                ('contest', models.ForeignKey(verbose_name='contest', blank=True, to='contests.Contest', null=True)),
+                ('creator', models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, verbose_name='creator', blank=True, to=settings.AUTH_USER_MODEL, null=True)),
+            ],
+            options={
+                'ordering': ('-creation_date',),
+                'verbose_name': 'rejudge',
+                'verbose_name_plural': 'rejudges',
+            },
+        ),
+    ]
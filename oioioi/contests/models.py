@@ -1,13 +1,15 @@
 import itertools
 import os.path
+from uuid import uuid4
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Max
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.module_loading import import_string
@@ -22,7 +24,7 @@ from oioioi.contests.problem_instance_controller import \
 from oioioi.base.utils.validators import validate_whitespaces, \
         validate_db_string_id
 from oioioi.contests.date_registration import date_registry
-from oioioi.contests.fields import ScoreField
+from oioioi.contests.fields import ScoreField, ScoreSortKeyField
 from oioioi.filetracker.fields import FileField
 
 
@@ -335,6 +337,7 @@ class Submission(models.Model):
             verbose_name=_("kind"))
     score = ScoreField(blank=True, null=True,
             verbose_name=_("score"))
+    score_sort_key = ScoreSortKeyField(db_index=True)
     status = EnumField(submission_statuses, default='?',
             verbose_name=_("status"))
     comment = models.TextField(blank=True,
@@ -403,6 +406,7 @@ class ScoreReport(models.Model):
     submission_report = models.ForeignKey(SubmissionReport)
     status = EnumField(submission_statuses, blank=True, null=True)
     score = ScoreField(blank=True, null=True)
+    score_sort_key = ScoreSortKeyField()
     max_score = ScoreField(blank=True, null=True)
     comment = models.TextField(blank=True, null=True)
 
@@ -432,6 +436,7 @@ class UserResultForProblem(models.Model):
     user = models.ForeignKey(User)
     problem_instance = models.ForeignKey(ProblemInstance)
     score = ScoreField(blank=True, null=True)
+    score_sort_key = ScoreSortKeyField(db_index=True)
     status = EnumField(submission_statuses, blank=True, null=True)
     submission_report = models.ForeignKey(SubmissionReport, blank=True,
             null=True)
@@ -440,6 +445,81 @@ class UserResultForProblem(models.Model):
         unique_together = ('user', 'problem_instance')
 
 
+def _problem_results_cache_version_key(contest_id, user_id):
+    return 'contests/problem_results_version/%s/%s' % (contest_id, user_id)
+
+
+def _problem_results_cache_key(contest_id, user_id, version):
+    return 'contests/problem_results/%s/%s/%s' % (contest_id, user_id,
+                                                  version)
+
+
+def get_user_problem_results(contest_id, user_id):
+    """Returns a dictionary mapping ids of problem instances of the contest
+       to the :class:`UserResultForProblem` instances of the user.
+
+       The results come with their submission reports, score reports and
+       submissions (with problem instances) loaded. The dictionary is cached
+       and the cache is invalidated whenever the user's results are updated
+       (see :func:`invalidate_user_problem_results`). The returned results
+       must not be modified.
+    """
+    version = _get_cache_version(
+            _problem_results_cache_version_key(contest_id, user_id))
+    key = _problem_results_cache_key(contest_id, user_id, version)
+    result = cache.get(key)
+    if result is None:
+        result = dict((r.problem_instance_id, r) for r in
+                UserResultForProblem.objects
+                    .filter(user_id=user_id,
+                            problem_instance__contest_id=contest_id)
+                    .select_related('submission_report__submission'
+                                    '__problem_instance__problem',
+                                    'submission_report__submission'
+                                    '__problem_instance__round')
+                    .prefetch_related('submission_report__scorereport_set'))
+        cache.set(key, result, settings.PROBLEM_RESULTS_CACHE_TIMEOUT)
+    return result
+
+
+def _get_cache_version(version_key):
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, uuid4().hex, None)
+        version = cache.get(version_key)
+    return version
+
+
+def _bump_cache_version(version_key):
+    def bump_version():
+        cache.set(version_key, uuid4().hex, None)
+    bump_version()
+    # The cache may have been filled again with the old data before
+    # the transaction was committed.
+    transaction.on_commit(bump_version)
+
+
+def invalidate_user_problem_results(contest_id, user_id):
+    """Invalidates the cache of :func:`get_user_problem_results`.
+
+       It's called by
+       :meth:`~oioioi.contests.controllers.ContestController.update_user_results`
+       and when a result is deleted. Must be called after changing the
+       results in any other way.
+    """
+    _bump_cache_version(_problem_results_cache_version_key(contest_id,
+                                                           user_id))
+
+
+@receiver(post_delete, sender=UserResultForProblem)
+def _invalidate_problem_results_on_delete(sender, instance, **kwargs):
+    contest_id = ProblemInstance.objects.filter(
+            id=instance.problem_instance_id) \
+            .values_list('contest_id', flat=True).first()
+    if contest_id is not None:
+        invalidate_user_problem_results(contest_id, instance.user_id)
+
+
 class UserResultForRound(models.Model):
     """User result (score) for the round.
 
@@ -448,6 +528,7 @@ class UserResultForRound(models.Model):
     user = models.ForeignKey(User)
     round = models.ForeignKey(Round)
     score = ScoreField(blank=True, null=True)
+    score_sort_key = ScoreSortKeyField(db_index=True)
 
     class Meta(object):
         unique_together = ('user', 'round')
@@ -462,6 +543,7 @@ class UserResultForContest(models.Model):
     user = models.ForeignKey(User)
     contest = models.ForeignKey(Contest)
     score = ScoreField(blank=True, null=True)
+    score_sort_key = ScoreSortKeyField(db_index=True)
 
     class Meta(object):
         unique_together = ('user', 'contest')
@@ -484,6 +566,111 @@ class RoundTimeExtension(models.Model):
     def __unicode__(self):
         return unicode(self.round) + ': ' + unicode(self.user)
 
+
+class RejudgeJob(models.Model):
+    """Progress of a rejudge queued in background by
+       :func:`~oioioi.contests.tasks.rejudge_submissions_job`.
+    """
+    contest = models.ForeignKey(Contest, null=True, blank=True,
+                                verbose_name=_("contest"))
+    creator = models.ForeignKey(User, null=True, blank=True,
+                                on_delete=models.SET_NULL,
+                                verbose_name=_("creator"))
+    creation_date = models.DateTimeField(default=timezone.now,
+                                         verbose_name=_("creation date"))
+    submissions_done = models.IntegerField(default=0,
+            verbose_name=_("queued submissions"))
+    submissions_total = models.IntegerField(default=0,
+            verbose_name=_("submissions"))
+
+    class Meta(object):
+        verbose_name = _("rejudge")
+        verbose_name_plural = _("rejudges")
+        ordering = ('-creation_date',)
+
+    def __unicode__(self):
+        return u'%s: %d/%d' % (self.creation_date, self.submissions_done,
+                               self.submissions_total)
+
+    @property
+    def progress(self):
+        """Percentage of the queued submissions."""
+        if not self.submissions_total:
+            return 100
+        return 100 * self.submissions_done // self.submissions_total
+
+
+def _rounds_cache_version_key(contest_id):
+    return 'contests/rounds_version/%s' % (contest_id,)
+
+
+def get_contest_rounds(contest_id):
+    """Returns a list of rounds of the contest, with the contest loaded.
+
+       The list is cached in a cache shared by all processes and the cache
+       is invalidated whenever a round or a round time extension of
+       the contest changes (see :func:`invalidate_contest_rounds`).
+       The returned rounds must not be modified.
+    """
+    version = _get_cache_version(_rounds_cache_version_key(contest_id))
+    key = 'contests/rounds/%s/%s' % (contest_id, version)
+    result = cache.get(key)
+    if result is None:
+        result = list(Round.objects.filter(contest_id=contest_id)
+                      .select_related('contest'))
+        cache.set(key, result, settings.ROUND_TIMES_CACHE_TIMEOUT)
+    return result
+
+
+def get_round_time_extensions(contest_id, user_id):
+    """Returns a dictionary mapping ids of rounds of the contest to the
+       extra time (in minutes) given to the user.
+
+       Cached like :func:`get_contest_rounds`.
+    """
+    version = _get_cache_version(_rounds_cache_version_key(contest_id))
+    key = 'contests/round_time_extensions/%s/%s/%s' % (contest_id, user_id,
+                                                       version)
+    result = cache.get(key)
+    if result is None:
+        result = dict(RoundTimeExtension.objects
+                      .filter(user_id=user_id, round__contest_id=contest_id)
+                      .values_list('round_id', 'extra_time'))
+        cache.set(key, result, settings.ROUND_TIMES_CACHE_TIMEOUT)
+    return result
+
+
+def invalidate_contest_rounds(contest_id):
+    """Invalidates the caches of :func:`get_contest_rounds` and
+       :func:`get_round_time_extensions`.
+
+       Must be called after changing rounds or round time extensions
+       in a way which doesn't send the ``post_save`` or ``post_delete``
+       signals, e.g. with ``QuerySet.update``.
+    """
+    _bump_cache_version(_rounds_cache_version_key(contest_id))
+
+
+@receiver(post_save, sender=Contest)
+@receiver(post_delete, sender=Contest)
+def _invalidate_rounds_on_contest_change(sender, instance, **kwargs):
+    invalidate_contest_rounds(instance.id)
+
+
+@receiver(post_save, sender=Round)
+@receiver(post_delete, sender=Round)
+def _invalidate_rounds_on_round_change(sender, instance, **kwargs):
+    invalidate_contest_rounds(instance.contest_id)
+
+
+@receiver(post_save, sender=RoundTimeExtension)
+@receiver(post_delete, sender=RoundTimeExtension)
+def _invalidate_rounds_on_extension_change(sender, instance, **kwargs):
+    contest_id = Round.objects.filter(id=instance.round_id) \
+            .values_list('contest_id', flat=True).first()
+    if contest_id is not None:
+        invalidate_contest_rounds(contest_id)
+
 contest_permissions = EnumRegistry()
 contest_permissions.register('contests.contest_admin', _("Admin"))
 contest_permissions.register('contests.contest_observer', _("Observer"))
@@ -505,6 +692,84 @@ class ContestPermission(models.Model):
         return u'%s/%s: %s' % (self.contest, self.permission, self.user)
 
 
+_CONTESTS_INDEX_VERSION_KEY = 'contests/contests_index_version'
+
+
+def _user_contests_version_key(user_id):
+    return 'contests/user_contests_version/%s' % (user_id,)
+
+
+def get_contests_index():
+    """Returns a dictionary mapping
+       :class:`~oioioi.contests.controllers.RegistrationController`
+       subclasses (without mixins) to sets of ids of contests using them.
+
+       The index is cached in a cache shared by all processes and rebuilt
+       only after a contest is changed. It contains only ids, so that
+       reading it doesn't depend on the number of contests much. The
+       returned object must not be modified.
+    """
+    version = _get_cache_version(_CONTESTS_INDEX_VERSION_KEY)
+    key = 'contests/contests_index/%s' % (version,)
+    rcontrollers = cache.get(key)
+    if rcontrollers is None:
+        rcontrollers = {}
+        for contest in Contest.objects.all():
+            rc = contest.controller.registration_controller()
+            rcontrollers.setdefault(rc.__class__.__unmixed_class__, set()) \
+                    .add(contest.id)
+        cache.set(key, rcontrollers, settings.CONTESTS_INDEX_CACHE_TIMEOUT)
+    return rcontrollers
+
+
+def visible_contests_cache_key(user_id):
+    """Returns the cache key of the set of ids of contests visible to
+       the user (``None`` for anonymous users).
+
+       The key changes whenever the contests index or the data the user's
+       visibility depends on is changed (see
+       :func:`invalidate_visible_contests`).
+    """
+    version = _get_cache_version(_CONTESTS_INDEX_VERSION_KEY)
+    if user_id is None:
+        return 'contests/visible_contests/%s/anonymous' % (version,)
+    user_version = _get_cache_version(_user_contests_version_key(user_id))
+    return 'contests/visible_contests/%s/%s/%s' % (version, user_id,
+                                                   user_version)
+
+
+def invalidate_visible_contests(user_id=None):
+    """Invalidates the cached sets of contests visible to the given user,
+       or the contests index and the sets of all users if ``user_id`` is
+       ``None``.
+
+       It's called when contests, contest permissions and participants are
+       saved or deleted. Must be called after changing them in a way which
+       doesn't send the ``post_save`` or ``post_delete`` signals, e.g. with
+       ``QuerySet.update``, or after changing other data used by
+       :meth:`~oioioi.contests.controllers.RegistrationController.filter_visible_contests`.
+    """
+    if user_id is None:
+        _bump_cache_version(_CONTESTS_INDEX_VERSION_KEY)
+    else:
+        _bump_cache_version(_user_contests_version_key(user_id))
+
+
+@receiver(post_save, sender=Contest)
+@receiver(post_delete, sender=Contest)
+def _invalidate_contests_index(sender, instance, **kwargs):
+    invalidate_visible_contests()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=ContestPermission)
+@receiver(post_delete, sender=ContestPermission)
+def _invalidate_user_visible_contests(sender, instance, **kwargs):
+    invalidate_visible_contests(instance.id if sender is User
+                                else instance.user_id)
+
+
 class ContestView(models.Model):
     user = models.ForeignKey(User)
     contest = models.ForeignKey(Contest)
@@ -2,6 +2,7 @@ from django.conf import settings
 from django.utils.functional import lazy
 
 from oioioi.base.utils import request_cached
+from oioioi.contests.contest_view_buffer import buffered_contest_views
 from oioioi.contests.models import Contest, ContestView
 from oioioi.contests.utils import visible_contests
 
@@ -29,6 +30,17 @@ def recent_contests(request):
         mapping = Contest.objects.in_bulk(ids)
         return [c for c in (mapping.get(id) for id in ids)
                 if c is not None and c != request.contest]
+    elif settings.BUFFER_CONTEST_VIEWS:
+        num_contests = getattr(settings, 'NUM_RECENT_CONTESTS', 5)
+        views = dict(ContestView.objects.filter(user=request.real_user)
+                     .values_list('contest_id', 'timestamp')[:num_contests])
+        for contest_id, timestamp in \
+                buffered_contest_views(request.real_user.id).iteritems():
+            if contest_id not in views or views[contest_id] < timestamp:
+                views[contest_id] = timestamp
+        visible = dict((c.id, c) for c in visible_contests(request))
+        ids = sorted(views, key=views.get, reverse=True)[:num_contests]
+        return [visible[id] for id in ids if id in visible]
     else:
         c_views = ContestView.objects.filter(user=request.real_user) \
                 .select_related('contest')
@@ -86,6 +86,17 @@ class ScoreValue(ClassInitBase):
         """
         raise NotImplementedError
 
+    def __sub__(self, other):
+        """Implementation of operator ``-``, inverse to ``+``.
+
+           Used for example when updating user result for round after
+           the score for one of its problems changes.
+
+           Optional, if not overridden, the results are recomputed from
+           scratch.
+        """
+        raise NotImplementedError
+
     def __cmp__(self, other):
         """Implementation of order. Used to produce ranking, being greater
            means better result.
@@ -121,6 +132,20 @@ class ScoreValue(ClassInitBase):
         """
         raise NotImplementedError
 
+    def to_sort_key(self):
+        """Returns an integer which may be used for sorting and comparing
+           scores at db level (it's stored in
+           :class:`~oioioi.contests.fields.ScoreSortKeyField`\ s).
+
+           If ``a < b``, then ``a.to_sort_key() <= b.to_sort_key()``, so
+           scores with equal keys may still need to be compared in Python.
+           The key must fit in a signed 64-bit integer.
+
+           Optional, if not overridden, ``None`` is returned and the score
+           can't be sorted at db level.
+        """
+        return None
+
 
 class IntegerScore(ScoreValue):
     """Score consisting of integer number.
@@ -139,6 +164,9 @@ class IntegerScore(ScoreValue):
     def __add__(self, other):
         return IntegerScore(self.value + other.value)
 
+    def __sub__(self, other):
+        return IntegerScore(self.value - other.value)
+
     def __cmp__(self, other):
         if not isinstance(other, IntegerScore):
             return cmp(self.value, other)
@@ -159,3 +187,6 @@ class IntegerScore(ScoreValue):
 
     def to_int(self):
         return self.value
+
+    def to_sort_key(self):
+        return self.value
@@ -0,0 +1,52 @@
+import logging
+
+from celery.task import task
+from django.conf import settings
+from django.db import transaction
+
+from oioioi.contests.models import Submission, RejudgeJob
+
+logger = logging.getLogger(__name__)
+
+
+def _judge_chunk(submission_ids, extra_args):
+    submissions = Submission.objects.filter(id__in=submission_ids) \
+            .select_related('problem_instance__problem',
+                            'problem_instance__contest', 'user') \
+            .order_by('id')
+    by_problem_instance = {}
+    for submission in submissions:
+        by_problem_instance.setdefault(submission.problem_instance_id,
+                (submission.problem_instance, []))[1].append(submission)
+    for problem_instance, submissions in by_problem_instance.itervalues():
+        problem_instance.controller.judge_many(submissions, extra_args,
+                                               is_rejudge=True)
+
+
+@task(ignore_result=True)
+def rejudge_submissions_job(submission_ids, extra_args=None, contest_id=None,
+                            creator_id=None):
+    """Queues submissions with the given ids for rejudging.
+
+       The submissions are loaded and queued (see
+       :meth:`~oioioi.problems.controllers.ProblemController.judge_many`)
+       in chunks of ``REJUDGE_CHUNK_SIZE``, each in a separate transaction.
+       Submissions deleted in the meantime are skipped.
+
+       The progress is stored in a
+       :class:`~oioioi.contests.models.RejudgeJob` of the given contest and
+       creator, updated after every chunk, so that it may be seen in
+       the admin panel.
+    """
+    chunk_size = settings.REJUDGE_CHUNK_SIZE
+    total = len(submission_ids)
+    job = RejudgeJob.objects.create(contest_id=contest_id,
+            creator_id=creator_id, submissions_total=total)
+    for i in xrange(0, total, chunk_size):
+        done = min(i + chunk_size, total)
+        with transaction.atomic():
+            _judge_chunk(submission_ids[i:i + chunk_size], extra_args)
+            RejudgeJob.objects.filter(id=job.id) \
+                    .update(submissions_done=done)
+        logger.info("Rejudge (id: %d): queued %d of %d submissions",
+                    job.id, done, total)
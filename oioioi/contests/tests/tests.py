@@ -2,7 +2,10 @@
 import re
 from datetime import datetime
 from functools import partial
+from StringIO import StringIO
+
 from django.core import mail
+from django.core.management import call_command
 
 from django.test import RequestFactory
 from django.test.utils import override_settings
@@ -15,6 +18,7 @@ from django.utils.timezone import utc, LocalTimezone
 from django.contrib.auth.models import User, AnonymousUser
 from django.contrib.admin.utils import quote
 from django.conf import settings
+from mock import patch
 from nose.tools import nottest
 
 from oioioi.base.tests import TestCase, check_not_accessible, fake_time, \
@@ -22,14 +26,18 @@ from oioioi.base.tests import TestCase, check_not_accessible, fake_time, \
 from oioioi.contests.models import Contest, Round, ProblemInstance, \
         UserResultForContest, Submission, ContestAttachment, \
         RoundTimeExtension, ContestPermission, UserResultForProblem, \
-        ContestView, ContestLink, ProblemStatementConfig
+        ContestView, ContestLink, ProblemStatementConfig, UserResultForRound, \
+        RejudgeJob
 from oioioi.contests.scores import IntegerScore, ScoreValue
 from oioioi.contests.date_registration import date_registry
 from oioioi.contests.utils import is_contest_admin, is_contest_observer, \
-        can_enter_contest, rounds_times, can_see_personal_data, \
-        administered_contests, all_public_results_visible, \
-        all_non_trial_public_results_visible
+        can_enter_contest, rounds_times, generic_rounds_times, \
+        can_see_personal_data, administered_contests, \
+        all_public_results_visible, \
+        all_non_trial_public_results_visible, visible_contests
+from oioioi.contests.contest_view_buffer import flush_contest_views
 from oioioi.contests.current_contest import ContestMode
+from oioioi.contests.tasks import rejudge_submissions_job
 from oioioi.contests.tests import SubmitFileMixin
 from oioioi.filetracker.tests import TestStreamingMixin
 from oioioi.problems.models import Problem, ProblemStatement, ProblemAttachment
@@ -106,6 +114,24 @@ class TestScores(TestCase):
         instance = UserResultForContest.objects.get(user=user)
         self.assertIsNone(instance.score)
 
+    def test_score_sort_key(self):
+        contest = Contest.objects.get()
+        users = User.objects.exclude(userresultforcontest__contest=contest)
+        for user, score in zip(users, [IntegerScore(-5), IntegerScore(42),
+                                       None]):
+            UserResultForContest(user=user, contest=contest,
+                                 score=score).save()
+        results = UserResultForContest.objects.exclude(score_sort_key=None) \
+                .order_by('score_sort_key')
+        # The result from the fixture gets its key as well.
+        self.assertEqual([r.score.value for r in results], [-5, 34, 42])
+
+        result = results[0]
+        result.score = IntegerScore(100)
+        result.save()
+        self.assertEqual(UserResultForContest.objects
+                         .get(id=result.id).score_sort_key, 100)
+
     def test_db_order(self):
         # Importing module-wide seems to break sinolpack tests.
         from oioioi.programs.models import TestReport
@@ -412,6 +438,31 @@ class TestContestController(TestCase):
         contest = Contest.objects.get()
         self.assertEqual(contest.controller.get_safe_exec_mode(), 'vcpu')
 
+    def test_incremental_user_results(self):
+        contest = Contest.objects.get()
+        user = User.objects.get(username='test_user')
+        pi = ProblemInstance.objects.get(id=1)
+
+        # Pretend there is a result for another problem of the round.
+        UserResultForRound.objects.filter(user=user, round=pi.round) \
+                .update(score=IntegerScore(100))
+        Submission.objects.filter(id=1).update(score=IntegerScore(50))
+        contest.controller.update_user_results(user, pi)
+
+        self.assertEqual(UserResultForRound.objects
+                         .get(user=user, round=pi.round).score,
+                         IntegerScore(116))
+        self.assertEqual(UserResultForContest.objects
+                         .get(user=user, contest=contest).score,
+                         IntegerScore(50))
+
+        out = StringIO()
+        call_command('check_user_results', stdout=out)
+        self.assertIn('1 inconsistent results found', out.getvalue())
+        self.assertEqual(UserResultForRound.objects
+                         .get(user=user, round=pi.round).score,
+                         IntegerScore(50))
+
 
 class TestContestViews(TestCase):
     fixtures = ['test_users', 'test_contest', 'test_full_package',
@@ -447,6 +498,34 @@ class TestContestViews(TestCase):
         contests = [cv.contest for cv in ContestView.objects.all()]
         self.assertEqual(contests, [invisible_contest, contest])
 
+    @override_settings(BUFFER_CONTEST_VIEWS=True,
+                       CONTEST_VIEWS_FLUSH_INTERVAL=24 * 60 * 60)
+    def test_buffered_recent_contests_list(self):
+        contest = Contest.objects.get()
+        contest2 = Contest(id='c2', name='Contest2',
+            controller_name=contest.controller_name)
+        contest2.save()
+
+        self.client.login(username='test_admin')
+        self.client.get('/c/%s/dashboard/' % contest.id)
+        self.client.get('/c/%s/dashboard/' % contest2.id)
+        self.assertFalse(ContestView.objects.exists())
+        response = self.client.get('/c/%s/dashboard/' % contest.id)
+        self.assertEqual(list(response.context['recent_contests']),
+                         [contest, contest2])
+
+        flush_contest_views()
+        contests = [cv.contest for cv in ContestView.objects.all()]
+        self.assertEqual(contests, [contest, contest2])
+        response = self.client.get('/c/%s/dashboard/' % contest.id)
+        self.assertEqual(list(response.context['recent_contests']),
+                         [contest, contest2])
+
+        self.client.get('/c/%s/dashboard/' % contest2.id)
+        flush_contest_views()
+        contests = [cv.contest for cv in ContestView.objects.all()]
+        self.assertEqual(contests, [contest2, contest])
+
     @override_settings(CONTEST_MODE=ContestMode.neutral)
     def test_contest_visibility(self):
         invisible_contest = Contest(id='invisible', name='Invisible Contest',
@@ -586,6 +665,27 @@ class TestManyRounds(TestsUtilsMixin, TestCase):
                 self.assertNotIn('zad2', response.content)
                 self.assertEqual(len(response.context['problem_instances']), 3)
 
+    def test_problems_list_results(self):
+        contest = Contest.objects.get()
+        url = reverse('problems_list', kwargs={'contest_id': contest.id})
+        user = User.objects.get(username='test_user')
+        self.client.login(username='test_user')
+        with fake_time(datetime(2015, 8, 5, tzinfo=utc)):
+            response = self.client.get(url)
+            count = self.remove_ws(response).count('>34<')
+            self.assertGreater(count, 0)
+
+            submission = Submission.objects.get(id=1)
+            submission.score = IntegerScore(17)
+            submission.save()
+            contest.controller.update_user_results(user,
+                    submission.problem_instance)
+
+            response = self.client.get(url)
+            self.assertEqual(self.remove_ws(response).count('>34<'),
+                             count - 1)
+            self.assertIn('>17<', self.remove_ws(response))
+
     def test_submissions_visibility(self):
         contest = Contest.objects.get()
         url = reverse('my_submissions', kwargs={'contest_id': contest.id})
@@ -902,6 +1002,51 @@ class TestRejudgeTypesView(TestCase):
         self.assertNotIn('Tests:', response.content)
 
 
+class TestRejudgeJob(TestCase):
+    fixtures = ['test_users', 'test_contest', 'test_full_package',
+                'test_problem_instance', 'test_submission',
+                'test_another_submission']
+
+    @override_settings(REJUDGE_CHUNK_SIZE=1)
+    def test_rejudge_in_chunks(self):
+        with patch.object(ProgrammingContestController, 'judge_many') \
+                as judge_many:
+            rejudge_submissions_job.delay([1, 2, 1000],
+                                          {'rejudge_type': 'FULL'},
+                                          contest_id='c', creator_id=1000)
+        self.assertEqual(judge_many.call_count, 2)
+        job = RejudgeJob.objects.get()
+        self.assertEqual((job.contest_id, job.creator_id), ('c', 1000))
+        self.assertEqual((job.submissions_done, job.submissions_total),
+                         (3, 3))
+        for (submissions, extra_args), kwargs in judge_many.call_args_list:
+            self.assertEqual(len(submissions), 1)
+            self.assertEqual(extra_args, {'rejudge_type': 'FULL'})
+            self.assertEqual(kwargs, {'is_rejudge': True})
+
+    def test_rejudge_view(self):
+        self.client.login(username='test_admin')
+        self.client.get('/c/c/')  # 'c' becomes the current contest
+        with patch.object(rejudge_submissions_job, 'delay') as delay:
+            response = self.client.post(
+                reverse('oioioiadmin:contests_submission_changelist') +
+                'rejudge/', {'submissions': ['1', '2'],
+                             'rejudge_type': 'JUDGED'}, follow=True)
+        self.assertIn('Queued 2 submissions for rejudge.', response.content)
+        delay.assert_called_once_with(
+                [1, 2], {'tests_to_judge': [], 'rejudge_type': 'JUDGED'},
+                contest_id='c', creator_id=1000)
+
+    def test_rejudge_progress_admin(self):
+        RejudgeJob.objects.create(contest_id='c', submissions_done=2,
+                                  submissions_total=5)
+        self.client.login(username='test_admin')
+        self.client.get('/c/c/')  # 'c' becomes the current contest
+        response = self.client.get(
+                reverse('oioioiadmin:contests_rejudgejob_changelist'))
+        self.assertContains(response, '2 of 5 submissions queued')
+
+
 class TestContestAdmin(TestCase):
     fixtures = ['test_users']
 
@@ -1210,6 +1355,34 @@ class TestRoundExtension(TestCase, SubmitFileMixin):
             self.assertEqual(200, response.status_code)
             self.assertIn('Sorry, there are no problems', response.content)
 
+    def test_round_times_cache(self):
+        contest = Contest.objects.get()
+        round1 = Round.objects.get(pk=1)
+        request = RequestFactory().request()
+        request.contest = contest
+        request.user = User.objects.get(username='test_user')
+
+        rtimes = generic_rounds_times(request)
+        self.assertEqual(rtimes[round1].get_end(), round1.end_date)
+        with self.assertNumQueries(0):
+            generic_rounds_times(request)
+
+        round1.end_date = datetime(2012, 8, 5, tzinfo=utc)
+        round1.save()
+        ext = RoundTimeExtension.objects.create(user=request.user,
+                                                round=round1, extra_time=10)
+        rtimes = generic_rounds_times(request)
+        self.assertEqual(rtimes[round1].get_end(),
+                         datetime(2012, 8, 5, 0, 10, tzinfo=utc))
+
+        ext.delete()
+        rtimes = generic_rounds_times(request)
+        self.assertEqual(rtimes[round1].get_end(),
+                         datetime(2012, 8, 5, tzinfo=utc))
+        rtimes = generic_rounds_times(None, contest)
+        self.assertEqual(rtimes[round1].get_end(),
+                         datetime(2012, 8, 5, tzinfo=utc))
+
     def test_round_extension_admin(self):
         self.client.login(username='test_admin')
 
@@ -1925,6 +2098,40 @@ class TestRegistrationController(TestCase):
         self.assertEquals(len(visible), 1)
         self.assertTrue(invisible_contest.id in visible)
 
+    def test_visible_contests_cache(self):
+        invisible_contest = Contest(id='invisible', name='Invisible Contest',
+            controller_name='oioioi.contests.tests.PrivateContestController')
+        invisible_contest.save()
+        factory = RequestFactory()
+
+        def get_visible(user):
+            request = factory.get('/')
+            request.user = user
+            return set(contest.id for contest in visible_contests(request))
+
+        self.assertEqual(get_visible(AnonymousUser()), set(['c1', 'c2']))
+        user = User.objects.get(username='test_user')
+        self.assertEqual(get_visible(user), set(['c1', 'c2']))
+        # Only the visible contests are fetched.
+        with self.assertNumQueries(1):
+            self.assertEqual(get_visible(user), set(['c1', 'c2']))
+
+        permission = ContestPermission.objects.create(user=user,
+                contest=invisible_contest,
+                permission='contests.contest_admin')
+        user = User.objects.get(username='test_user')
+        self.assertEqual(get_visible(user),
+                         set(['c1', 'c2', 'invisible']))
+        self.assertEqual(get_visible(AnonymousUser()), set(['c1', 'c2']))
+
+        permission.delete()
+        user = User.objects.get(username='test_user')
+        self.assertEqual(get_visible(user), set(['c1', 'c2']))
+
+        Contest.objects.get(id='c2').delete()
+        self.assertEqual(get_visible(user), set(['c1']))
+        self.assertEqual(get_visible(AnonymousUser()), set(['c1']))
+
 
 class TestAdministeredContests(TestCase):
     fixtures = ['test_two_empty_contests', 'test_users']
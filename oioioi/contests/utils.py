@@ -1,9 +1,13 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied
 from django.shortcuts import get_object_or_404
 from django.http import HttpRequest
 from oioioi.base.permissions import make_request_condition
 from oioioi.contests.models import Contest, Round, ProblemInstance, \
-        Submission, RoundTimeExtension
+        Submission, ProblemStatementConfig, \
+        get_contest_rounds, get_round_time_extensions, get_contests_index, \
+        visible_contests_cache_key
 from oioioi.base.utils import request_cached
 from datetime import timedelta
 from collections import defaultdict
@@ -87,19 +91,16 @@ def generic_rounds_times(request=None, contest=None):
         return {}
     contest = contest or request.contest
 
-    rounds = [r for r in Round.objects.filter(contest=contest)
-              .select_related('contest')]
-    rids = [r.id for r in rounds]
+    rounds = get_contest_rounds(contest.id)
     if not request or not hasattr(request, 'user') or \
             request.user.is_anonymous():
         rtexts = {}
     else:
-        rtexts = dict((x['round_id'], x) for x in RoundTimeExtension.objects
-                      .filter(user=request.user, round__id__in=rids).values())
+        rtexts = get_round_time_extensions(contest.id, request.user.id)
 
     return dict((r, RoundTimes(r.start_date, r.end_date, r.contest,
-        r.results_date, r.public_results_date,
-        rtexts[r.id]['extra_time'] if r.id in rtexts else 0)) for r in rounds)
+        r.results_date, r.public_results_date, rtexts.get(r.id, 0)))
+        for r in rounds)
 
 
 @request_cached
@@ -183,6 +184,21 @@ def visible_problem_instances(request):
     return [pi for pi in queryset if controller.can_see_problem(request, pi)]
 
 
+def contest_statements_visibility(contest):
+    """Returns the statements visibility option of the contest (see
+       :class:`~oioioi.contests.models.ProblemStatementConfig`), ``'AUTO'``
+       if it's not configured.
+    """
+    visible = ProblemStatementConfig.objects.filter(contest=contest) \
+            .values_list('visible', flat=True).first()
+    return visible or 'AUTO'
+
+
+@request_cached
+def statements_visibility(request):
+    return contest_statements_visibility(request.contest)
+
+
 @request_cached
 def visible_rounds(request):
     controller = request.contest.controller
@@ -208,27 +224,45 @@ def contests_by_registration_controller():
        RegistrationController subclasses to operate on contest querysets
        and filter many of them at once.
 
+       The mapping is built from the cached contests index (see
+       :func:`~oioioi.contests.models.get_contests_index`).
+
        :rtype: :class:`~collections.defaultdict` containing `set` objects
     """
     rcontrollers = defaultdict(set)
-    for contest in Contest.objects.all():
-        rc = contest.controller.registration_controller()
-        rcontrollers[rc.__class__].add(contest.id)
+    for rc_class, contest_ids in get_contests_index().iteritems():
+        rcontrollers[rc_class._get_mx_class()] |= contest_ids
     return rcontrollers
 
+
 @request_cached
 def visible_contests(request):
-    visible = set()
-    rc_mapping = contests_by_registration_controller()
-    for rcontroller, contest_ids in rc_mapping.iteritems():
-        contests = Contest.objects.filter(id__in=contest_ids)
-        # These querysets could be concatenated and evaluated in a single
-        # query, however it turns out, that it results in so big and complex
-        # WHERE clauses that Postgres doesn't even attempt to optimize it
-        # (which means ~100x longer execution times).
-        filtered = set(rcontroller.filter_visible_contests(request, contests))
-        visible = visible | filtered
-    return visible
+    """Returns a set of contests the user can enter.
+
+       Ids of the contests are cached for every user until the contests
+       or the user's permissions or participations change (see
+       :func:`~oioioi.contests.models.invalidate_visible_contests`).
+    """
+    user_id = None
+    if request.user.is_authenticated():
+        user_id = request.user.id
+    key = visible_contests_cache_key(user_id)
+    visible = cache.get(key)
+    if visible is None:
+        visible = set()
+        rc_mapping = contests_by_registration_controller()
+        for rcontroller, contest_ids in rc_mapping.iteritems():
+            contests_qs = Contest.objects.filter(id__in=contest_ids)
+            # These querysets could be concatenated and evaluated in
+            # a single query, however it turns out, that it results in so
+            # big and complex WHERE clauses that Postgres doesn't even
+            # attempt to optimize it (which means ~100x longer execution
+            # times).
+            filtered = rcontroller.filter_visible_contests(request,
+                                                           contests_qs)
+            visible.update(filtered.values_list('id', flat=True))
+        cache.set(key, visible, settings.CONTESTS_INDEX_CACHE_TIMEOUT)
+    return set(Contest.objects.filter(id__in=visible))
 
 
 @request_cached
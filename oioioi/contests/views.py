@@ -22,8 +22,9 @@ from oioioi.base.main_page import register_main_page_view
 from oioioi.contests.controllers import submission_template_context
 from oioioi.contests.forms import SubmissionForm, GetUserInfoForm
 from oioioi.contests.models import Contest, ProblemInstance, Submission, \
-        SubmissionReport, ContestAttachment, UserResultForProblem
+        SubmissionReport, ContestAttachment, get_user_problem_results
 from oioioi.contests.processors import recent_contests
+from oioioi.contests.tasks import rejudge_submissions_job
 from oioioi.contests.utils import visible_contests, can_enter_contest, \
         can_see_personal_data, is_contest_admin, has_any_submittable_problem, \
         visible_rounds, visible_problem_instances, contest_exists, \
@@ -68,6 +69,22 @@ def problems_list_view(request):
     controller = request.contest.controller
     problem_instances = visible_problem_instances(request)
 
+    # Because this view can be accessed by an anynomous user we can't
+    # use `user=request.user` (it would cause TypeError).
+    if request.user.is_authenticated():
+        results = get_user_problem_results(request.contest.id,
+                                           request.user.id)
+    else:
+        results = {}
+
+    def visible_result(pi):
+        r = results.get(pi.id)
+        if r and r.submission_report \
+                and controller.can_see_submission_score(request,
+                        r.submission_report.submission):
+            return r
+        return None
+
     # Problem statements in order
     # 1) problem instance
     # 2) statement_visible
@@ -79,17 +96,7 @@ def problems_list_view(request):
             pi,
             controller.can_see_statement(request, pi),
             controller.get_round_times(request, pi.round),
-
-            # Because this view can be accessed by an anynomous user we can't
-            # use `user=request.user` (it would cause TypeError). Suprisingly
-            # using request.user.id is ok since for AnynomousUser id is set
-            # to None.
-            next((r for r in UserResultForProblem.objects.filter(
-                        user__id=request.user.id, problem_instance=pi)
-                    if r and r.submission_report
-                        and controller.can_see_submission_score(request,
-                            r.submission_report.submission)),
-                 None)
+            visible_result(pi)
         )
         for pi in problem_instances
     ], key=lambda p: (p[2].get_start(), p[2].get_end(), p[0].round.name,
@@ -381,9 +388,11 @@ def rejudge_all_submissions_for_problem_view(request, problem_instance_id):
                                          id=problem_instance_id)
     count = problem_instance.submission_set.count()
     if request.POST:
-        for submission in problem_instance.submission_set.all():
-            problem_instance.controller.judge(submission, request.GET.dict(),
-                                              is_rejudge=True)
+        submission_ids = list(problem_instance.submission_set
+                              .order_by('id').values_list('id', flat=True))
+        rejudge_submissions_job.delay(submission_ids, request.GET.dict(),
+                contest_id=problem_instance.contest_id,
+                creator_id=request.user.id)
         messages.info(request,
                       ungettext_lazy("%(count)d rejudge request received.",
                       "%(count)d rejudge requests reveived.",
@@ -13,7 +13,7 @@ djcelery.setup_loader()
 import oioioi
 from oioioi.contests.current_contest import ContestMode
 
-INSTALLATION_CONFIG_VERSION = 21
+INSTALLATION_CONFIG_VERSION = 22
 
 DEBUG = False
 INTERNAL_IPS = ('127.0.0.1',)
@@ -238,9 +238,19 @@ NOSE_ARGS = (
 )
 
 SIOWORKERS_BACKEND = 'oioioi.sioworkers.backends.SioworkersdBackend'
+
+# Number of processes used by LocalBackend to run sioworkers jobs in
+# parallel. With 1, the jobs are executed one by one in the calling process.
+SIOWORKERS_LOCAL_BACKEND_PROCESSES = 1
+
 FILETRACKER_CLIENT_FACTORY = 'oioioi.filetracker.client.media_root_factory'
 DEFAULT_FILE_STORAGE = 'oioioi.filetracker.storage.FiletrackerStorage'
 
+# If True, files saved as a DeduplicatedFile (e.g. tests of a problem package)
+# are not sent to Filetracker again if a file with the same content and name
+# is already stored, the stored file is reused instead.
+FILETRACKER_DEDUPLICATE_UPLOADS = True
+
 SUPERVISOR_AUTORELOAD_PATTERNS = [".py", ".pyc", ".pyo"]
 
 # For linaro_django_pagination
@@ -260,6 +270,14 @@ NUM_DASHBOARD_MESSAGES = 8
 NUM_HINTS = 10
 NUM_RECENT_CONTESTS = 5
 
+# If set to True, views of contests by logged in users (shown in the recent
+# contests menu) are buffered in memory and saved to the database in bulk,
+# at most every CONTEST_VIEWS_FLUSH_INTERVAL seconds or after
+# CONTEST_VIEWS_BUFFER_SIZE views, instead of on every request.
+BUFFER_CONTEST_VIEWS = False
+CONTEST_VIEWS_FLUSH_INTERVAL = 60
+CONTEST_VIEWS_BUFFER_SIZE = 1000
+
 REPLY_TEMPLATE_VISIBLE_NAME_LENGTH = 15
 
 PROBLEM_SOURCES = (
@@ -291,6 +309,13 @@ USE_UNSAFE_CHECKER = True
 # execution (in a sandboxed environment, if USE_UNSAFE_EXEC is set to False).
 USE_SINOLPACK_MAKEFILES = True
 
+# When not using makefiles, sinolpack may process tests of a package
+# concurrently: test files are uploaded by SINOLPACK_UNPACK_THREADS threads
+# and inwer and outgen are run on batches of SINOLPACK_UNPACK_BATCH_SIZE tests
+# as soon as their inputs are uploaded. 1 means sequential processing.
+SINOLPACK_UNPACK_THREADS = 1
+SINOLPACK_UNPACK_BATCH_SIZE = 20
+
 # Scorers below are used for judging submissions without contests,
 # eg. submitting to problems from problemset.
 DEFAULT_TEST_SCORER = \
@@ -380,21 +405,39 @@ BROKER_URL = 'sqla+sqlite:///' + os.path.join(tempfile.gettempdir(),
 CELERY_IMPORTS += [
     'oioioi.evalmgr.tasks',
     'oioioi.problems.unpackmgr',
+    'oioioi.contests.tasks',
 ]
 
 CELERY_ROUTES.update({
     'oioioi.evalmgr.tasks.evalmgr_job': dict(queue='evalmgr'),
+    'oioioi.evalmgr.tasks.evalmgr_batch_job': dict(queue='evalmgr'),
     'oioioi.problems.unpackmgr.unpackmgr_job': dict(queue='unpackmgr'),
+    'oioioi.contests.tasks.rejudge_submissions_job': dict(queue='evalmgr'),
 })
 
 # Number of concurrently evaluated submissions
 EVALMGR_CONCURRENCY = 1
 
+# Maximum number of submissions evaluated by a single evalmgr task, when
+# many submissions are judged at once (e.g. rejudged).
+EVALMGR_BATCH_SIZE = 100
+
+# Number of submissions queued in a single transaction when many submissions
+# are rejudged in background (see oioioi.contests.tasks).
+REJUDGE_CHUNK_SIZE = 1000
+
 # Number of concurrently processed problem packages
 UNPACKMGR_CONCURRENCY = 1
 
+# Number of rankingsd worker processes
+RANKINGSD_CONCURRENCY = 1
+
 SIOWORKERSD_URL = 'http://localhost:7889/'
 
+# Maximum number of idle connections to sioworkersd kept open by
+# a single process.
+SIOWORKERSD_CONNECTION_POOL_SIZE = 10
+
 # ID of JotForm account for "Send Feedback" link.
 JOTFORM_ID = None
 
@@ -440,9 +483,18 @@ CACHES = {
 
 # Ranking
 RANKINGSD_POLLING_INTERVAL = 0.5  # seconds
+# Recalculations running longer than this are considered dead by other
+# rankingsd workers.
+RANKINGSD_MAX_RECALC_DURATION = 1800  # seconds
+# How often rankingsd logs its throughput and queue statistics.
+RANKINGSD_STATS_INTERVAL = 60  # seconds
 RANKING_COOLDOWN_FACTOR = 2  # seconds
 RANKING_MIN_COOLDOWN = 5  # seconds
 RANKING_MAX_COOLDOWN = 100  # seconds
+# If more (user, problem instance) results changed since the last
+# recalculation, the ranking is rebuilt from scratch instead of being
+# updated incrementally.
+RANKING_MAX_INCREMENTAL_CHANGES = 500
 
 # Notifications configuration (client)
 # This one is for JavaScript socket.io client.
@@ -469,6 +521,33 @@ BALLOON_ACCESS_COOKIE_EXPIRES_DAYS = 7
 # admins or observers.
 LIVEDATA_CACHE_TIMEOUT = 30
 
+# Cache timeout (in seconds) for tests of problem instances, used when
+# preparing the evaluation of submissions. The cache is invalidated when
+# the tests change.
+TESTS_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Cache timeout (in seconds) for users' results for problems, shown on
+# the problems list. The cache is invalidated when the results change.
+PROBLEM_RESULTS_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Cache timeout (in seconds) for rounds of contests and round time
+# extensions, shared by all processes. The cache is invalidated when they
+# change.
+ROUND_TIMES_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Cache timeout (in seconds) for the index of contests and the sets of
+# contests visible to users. The cache is invalidated when contests,
+# contest permissions or participants change.
+CONTESTS_INDEX_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Printing reports (oioioi.oireports). Reports of more than
+# OIREPORTS_SYNC_LIMIT users are generated in the background. Results are
+# loaded for OIREPORTS_CHUNK_SIZE users at once and OIREPORTS_WORKERS source
+# files are fetched (and PDF files compiled) concurrently.
+OIREPORTS_SYNC_LIMIT = 100
+OIREPORTS_CHUNK_SIZE = 100
+OIREPORTS_WORKERS = 4
+
 # Submissions by (snail) mail
 MAILSUBMIT_CONFIRMATION_HASH_LENGTH = 5
 
@@ -505,3 +584,8 @@ NON_CONTEST_WEIGHT = 1000
 # Interval [in seconds] for mailnotifyd to wait before scanning the database
 # for new messages to notify about
 MAILNOTIFYD_INTERVAL = 60
+
+# Number of e-mails mailnotifyd sends over a single SMTP connection and
+# the number of connections used in parallel
+MAILNOTIFYD_CHUNK_SIZE = 100
+MAILNOTIFYD_WORKERS = 4
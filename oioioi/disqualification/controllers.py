@@ -251,6 +251,20 @@ class WithDisqualificationRankingControllerMixin(object):
             return data
         return self._annotate_disqualified(key, data)
 
+    def update_ranking(self, key, data, changes):
+        if self._show_disqualified(key):
+            # New rows would lack the disqualification annotations.
+            return None
+        return super(WithDisqualificationRankingControllerMixin, self) \
+            .update_ranking(key, data, changes)
+
+    def _encode_row(self, row):
+        encoded = super(WithDisqualificationRankingControllerMixin, self) \
+            ._encode_row(row)
+        if 'disqualified' in row:
+            encoded['disqualified'] = row['disqualified']
+        return encoded
+
     def _annotate_disqualified(self, key, data):
         users_ids = [row['user'].id for row in data['rows']]
         not_disqualified = self.contest.controller \
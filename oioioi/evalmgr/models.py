@@ -48,3 +48,16 @@ class SavedEnviron(models.Model):
         return cls.objects.create(
                 queued_job=QueuedJob.objects.get(job_id=environ['job_id']),
                 environ=json.dumps(environ))
+
+    @classmethod
+    def save_environs(cls, environs):
+        """Saves many environs at once and sets their ``saved_environ_id``.
+        """
+        cls.objects.bulk_create([cls(queued_job_id=environ['job_id'],
+                                     environ=json.dumps(environ))
+                                 for environ in environs])
+        ids = dict(cls.objects.filter(queued_job_id__in=[environ['job_id']
+                                        for environ in environs])
+                   .values_list('queued_job_id', 'id'))
+        for environ in environs:
+            environ['saved_environ_id'] = ids[environ['job_id']]
@@ -3,6 +3,7 @@ import sys
 import pprint
 from uuid import uuid4
 
+from django.conf import settings
 from django.db import transaction
 from django.utils.module_loading import import_string
 
@@ -12,12 +13,15 @@ from celery.exceptions import Ignore
 from oioioi.base.utils.db import require_transaction
 from oioioi.evalmgr import logger
 from oioioi.evalmgr.models import SavedEnviron, QueuedJob
-from oioioi.evalmgr.utils import mark_job_state
+from oioioi.evalmgr.utils import mark_job_state, mark_jobs_state
 from oioioi.base.utils.loaders import load_modules
 
 
 loaded_controllers = False
 
+# handler name -> handler function, see _get_handler
+_handlers = {}
+
 
 def _placeholder(environ, **kwargs):
     return environ
@@ -136,6 +140,13 @@ def replace_recipe_entry(environ, name, new_entry):
     recipe[index] = new_entry
 
 
+def _get_handler(name):
+    handler = _handlers.get(name)
+    if handler is None:
+        handler = _handlers[name] = import_string(name)
+    return handler
+
+
 def _run_phase(env, phase, extra_kwargs=None):
     phaseName = phase[0]
     handlerName = phase[1]
@@ -148,7 +159,7 @@ def _run_phase(env, phase, extra_kwargs=None):
         kwargs = phase[2].copy()
     if extra_kwargs:
         kwargs.update(extra_kwargs)
-    handler_func = import_string(handlerName)
+    handler_func = _get_handler(handlerName)
     env = handler_func(env, **kwargs)
     if env is None:
         raise RuntimeError('Evaluation handler "%s" (%s) '
@@ -205,6 +216,34 @@ def _transfer_job(environ, transfer_func, transfer_kwargs):
     return environ
 
 
+def _transfer_jobs(environs):
+    """Batch version of ``_transfer_job``.
+
+       Saves all the environs in a single transaction and then transfers
+       them one by one. Returns a list of processed environs, including
+       ones which failed to transfer and were handled by their error
+       handlers.
+    """
+    with transaction.atomic():
+        environs = mark_jobs_state(environs, 'WAITING')
+        transfers = [environ.pop('transfer') for environ in environs]
+        SavedEnviron.save_environs(environs)
+    results = []
+    for environ, transfer in zip(environs, transfers):
+        try:
+            import_string(transfer['transfer_func'])(environ,
+                    **transfer['transfer_kwargs'])
+        # pylint: disable=broad-except
+        except Exception:
+            exc_info = sys.exc_info()
+            with transaction.atomic():
+                SavedEnviron.objects.filter(
+                        id=environ.pop('saved_environ_id')).delete()
+            environ = _run_batch_error_handlers(environ, exc_info)
+        results.append(environ)
+    return results
+
+
 def _mark_job_state(environ, state):
     with transaction.atomic():
         marked = mark_job_state(environ, state)
@@ -230,6 +269,18 @@ def _run_error_handlers(env, exc_info):
     return env
 
 
+def _run_batch_error_handlers(env, exc_info):
+    """Like ``_run_error_handlers``, but doesn't propagate the exception, so
+       that it doesn't interrupt processing of other jobs in the batch.
+    """
+    try:
+        return _run_error_handlers(env, exc_info)
+    # pylint: disable=broad-except
+    except Exception:
+        # Already logged by _run_error_handlers
+        return env
+
+
 @require_transaction
 def delay_environ(environ, **evalmgr_extra_args):
     """Inserts environ into evalmgr queue with marking it as queued, resuming
@@ -250,6 +301,65 @@ def delay_environ(environ, **evalmgr_extra_args):
     return async_result
 
 
+@require_transaction
+def delay_environs(environs, **evalmgr_extra_args):
+    """Batch version of ``delay_environ`` for new (not resumed) environs.
+
+       Marks all the environs as queued using a few queries and inserts
+       them into evalmgr queue in batches of ``EVALMGR_BATCH_SIZE``
+       environs, each of them evaluated by a single ``evalmgr_batch_job``.
+       Returns a list of async results of the batches.
+
+       The jobs aren't associated with their celery tasks, as many jobs
+       share a single task. Once transferred and resumed, the jobs are
+       evaluated separately, like ones queued by ``delay_environ``.
+
+       Requires to be called from transaction.
+    """
+    assert not any('saved_environ_id' in environ for environ in environs)
+    environs = mark_jobs_state(environs, 'QUEUED')
+    batch_size = settings.EVALMGR_BATCH_SIZE
+    return [evalmgr_batch_job.apply_async((environs[i:i + batch_size],),
+                                          **evalmgr_extra_args)
+            for i in xrange(0, len(environs), batch_size)]
+
+
+def _load_controllers():
+    # pylint: disable=global-statement
+    global loaded_controllers
+
+    # load controllers to avoid late mix-ins to them
+    if not loaded_controllers:
+        load_modules('controllers')
+        loaded_controllers = True
+
+
+def _check_environ(env):
+    if 'job_id' not in env:
+        raise RuntimeError('No job_id found in environ')
+    if 'recipe' not in env:
+        raise RuntimeError('No recipe found in job environment. '
+                'Did you forget to set environ["run_externally"]?')
+    if 'error' in env:
+        raise RuntimeError('Error from workers:\n%s\nTB:\n%s' %
+            (env['error']['message'], env['error']['traceback']))
+
+
+def _run_phases(env):
+    """Runs the recipe of the environ until it's finished, or the job needs
+       to be transferred (i.e. ``env['transfer']`` is set).
+    """
+    while True:
+        recipe = env.get('recipe')
+        if not recipe:
+            return env
+        phase = recipe[0]
+        env['recipe'] = recipe[1:]
+        env = _run_phase(env, phase)
+        if 'transfer' in env:
+            return env
+
+
 @task
 def evalmgr_job(env):
     r"""Takes environment and evaluates it according to its recipe.
@@ -300,37 +410,18 @@ def evalmgr_job(env):
         Returns environment (a processed copy of given environment).
     """
 
-    # pylint: disable=global-statement,broad-except
-    global loaded_controllers
-
-    # load controllers to avoid late mix-ins to them
-    if not loaded_controllers:
-        load_modules('controllers')
-        loaded_controllers = True
+    _load_controllers()
 
     env = copy.deepcopy(env)
 
     try:
-        if 'job_id' not in env:
-            raise RuntimeError('No job_id found in environ')
-        if 'recipe' not in env:
-            raise RuntimeError('No recipe found in job environment. '
-                    'Did you forget to set environ["run_externally"]?')
-        if 'error' in env:
-            raise RuntimeError('Error from workers:\n%s\nTB:\n%s' %
-                (env['error']['message'], env['error']['traceback']))
+        _check_environ(env)
         _mark_job_state(env, 'PROGRESS')
-        while True:
-            recipe = env.get('recipe')
-            if not recipe:
-                env = _job_finished(env)
-                break
-            phase = recipe[0]
-            env['recipe'] = recipe[1:]
-            env = _run_phase(env, phase)
-            if 'transfer' in env:
-                env = _transfer_job(env, **env.pop('transfer'))
-                break
+        env = _run_phases(env)
+        if 'transfer' in env:
+            env = _transfer_job(env, **env.pop('transfer'))
+        else:
+            env = _job_finished(env)
         return env
 
     # Throwing up celery.exceptions.Ignore is necessary for our custom revoke
@@ -342,3 +433,51 @@ def evalmgr_job(env):
     # pylint: disable=broad-except
     except Exception:
         return _run_error_handlers(env, sys.exc_info())
+
+
+@task
+def evalmgr_batch_job(envs):
+    """Evaluates many environments in a single task, like ``evalmgr_job``
+       evaluates one.
+
+       To queue environments use ``delay_environs``.
+
+       Database bookkeeping (``QueuedJob`` states, saving environs before
+       transfer, removing finished jobs) is done for the whole batch at
+       once. An error in one of the jobs is handled by its error handlers
+       and doesn't stop the evaluation of the others; jobs raising
+       celery.exceptions.Ignore are skipped.
+
+       Returns a list of processed environments.
+    """
+    _load_controllers()
+
+    envs = copy.deepcopy(envs)
+    with transaction.atomic():
+        envs = mark_jobs_state(envs, 'PROGRESS')
+
+    results = []
+    finished = []
+    transferred = []
+    for env in envs:
+        try:
+            _check_environ(env)
+            env = _run_phases(env)
+        except Ignore:
+            continue
+        # pylint: disable=broad-except
+        except Exception:
+            results.append(_run_batch_error_handlers(env, sys.exc_info()))
+            continue
+        if 'transfer' in env:
+            transferred.append(env)
+        else:
+            finished.append(env)
+
+    with transaction.atomic():
+        QueuedJob.objects.filter(job_id__in=[finished_env['job_id']
+                for finished_env in finished]).delete()
+    results.extend(finished)
+    if transferred:
+        results.extend(_transfer_jobs(transferred))
+    return results
@@ -8,7 +8,8 @@ from django.core.urlresolvers import reverse
 
 from oioioi.base.tests import TestCase
 from oioioi.contests.models import Submission, Contest
-from oioioi.evalmgr.tasks import transfer_job, create_environ, delay_environ
+from oioioi.evalmgr.tasks import transfer_job, create_environ, \
+        delay_environ, delay_environs
 from oioioi.evalmgr.models import SavedEnviron
 from oioioi.filetracker.client import get_client
 from oioioi.programs.controllers import ProgrammingContestController
@@ -83,6 +84,39 @@ class TestLocalJobs(TestCase):
         self.assertEqual('Epic fail.', city_result.get()['output'])
         self.assertEqual('Epic fail.', jungle_result.get()['output'])
 
+    @override_settings(EVALMGR_BATCH_SIZE=2)
+    def test_batch_jobs(self):
+        envs = []
+        for area in ['forest', 'city', 'elevator', 'jungle', 'forest']:
+            env = create_environ()
+            env.update(dict(recipe=hunting, area=area))
+            envs.append(env)
+        with transaction.atomic():
+            results = delay_environs(envs)
+        self.assertEqual(len(results), 3)
+        outputs = dict((env['job_id'], env.get('output'))
+                       for result in results for env in result.get())
+        self.assertEqual(len(outputs), 5)
+        self.assertEqual(outputs[envs[0]['job_id']], 'Hedgehog hunted.')
+        self.assertEqual(outputs[envs[1]['job_id']], 'Epic fail.')
+        # A failed job doesn't stop the rest of its batch.
+        self.assertIsNone(outputs[envs[2]['job_id']])
+        self.assertEqual(outputs[envs[3]['job_id']], 'Epic fail.')
+        self.assertEqual(outputs[envs[4]['job_id']], 'Hedgehog hunted.')
+        self.assertFalse(QueuedJob.objects.exists())
+
+    def test_batch_jobs_cancelled(self):
+        envs = [create_environ(), create_environ()]
+        for env in envs:
+            env.update(dict(recipe=hunting, area='forest'))
+        QueuedJob.objects.create(job_id=envs[0]['job_id'], state='CANCELLED')
+        with transaction.atomic():
+            results = delay_environs(envs)
+        processed = [env['job_id'] for result in results
+                     for env in result.get()]
+        self.assertEqual(processed, [envs[1]['job_id']])
+        self.assertFalse(QueuedJob.objects.exists())
+
 
 def upload_source(env, **kwargs):
     fc = get_client()
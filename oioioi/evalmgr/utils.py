@@ -1,5 +1,7 @@
 import logging
 
+from django.utils.encoding import force_text
+
 from oioioi.base.utils.db import require_transaction
 from oioioi.evalmgr.models import QueuedJob
 from oioioi.contests.models import Submission
@@ -33,3 +35,52 @@ def mark_job_state(environ, state, **kwargs):
                 setattr(qj, k, v)
             qj.save()
     return True
+
+
+@require_transaction
+def mark_jobs_state(environs, state):
+    """Batch version of ``mark_job_state``.
+
+       Sets status of all the given environs in job queue using a constant
+       number of queries. Returns a list of environs, which should be
+       continued (i.e. ones which weren't cancelled).
+    """
+    job_ids = [environ['job_id'] for environ in environs]
+    jobs = QueuedJob.objects.in_bulk(job_ids)
+    submission_ids = set(Submission.objects.filter(
+            id__in=[environ['submission_id'] for environ in environs
+                    if 'submission_id' in environ])
+            .values_list('id', flat=True))
+
+    cancelled = [job_id for job_id, qj in jobs.iteritems()
+                 if qj.state == 'CANCELLED']
+    if cancelled:
+        QueuedJob.objects.filter(job_id__in=cancelled).delete()
+        for job_id in cancelled:
+            logger.info('Job %s cancelled.', str(job_id))
+
+    result = []
+    new_jobs = []
+    to_update = {}
+    for environ in environs:
+        job_id = environ['job_id']
+        qj = jobs.get(force_text(job_id))
+        if qj is not None and qj.state == 'CANCELLED':
+            continue
+        result.append(environ)
+        submission_id = environ.get('submission_id')
+        if submission_id not in submission_ids:
+            submission_id = None
+        if qj is None:
+            new_jobs.append(QueuedJob(job_id=job_id, state=state,
+                                      submission_id=submission_id))
+        else:
+            to_update.setdefault(submission_id, []).append(job_id)
+
+    QueuedJob.objects.bulk_create(new_jobs)
+    for submission_id, ids in to_update.iteritems():
+        update = {'state': state}
+        if submission_id is not None:
+            update['submission'] = submission_id
+        QueuedJob.objects.filter(job_id__in=ids).update(**update)
+    return result
@@ -53,6 +53,13 @@ class TestSubmissionsWithUserDataCollector(TestCase):
         self.assertEqual(submissions, [1, 2, 3, 4])
         self.assert_correct_submission_data(submission_data_list)
 
+    def test_queries_independent_of_submissions_count(self):
+        contest = Contest.objects.get(id="c")
+        collector = SubmissionsWithUserDataCollector(contest)
+        with self.assertNumQueriesLessThan(4):
+            submission_data_list = collector.collect_list()
+        self.assertEqual(len(submission_data_list), 4)
+
     def test_specific_round(self):
         contest = Contest.objects.get(id="c")
         round = Round.objects.get(id=3)
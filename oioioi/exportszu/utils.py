@@ -1,15 +1,12 @@
 import csv
-import os
-import shutil
 import tarfile
-import tempfile
+import time
+from cStringIO import StringIO
 
 from django.db.models import Q
 from django.utils.encoding import force_text
-from django.core.exceptions import ObjectDoesNotExist
 
 from oioioi.programs.models import ProgramSubmission
-from oioioi.participants.models import Participant
 from oioioi.filetracker.utils import django_to_filetracker_path
 from oioioi.filetracker.client import get_client
 
@@ -66,6 +63,7 @@ class SubmissionsWithUserDataCollector(object):
         submissions_list = []
         psubmissions = ProgramSubmission.objects.filter(q_expressions) \
                 .select_related()
+        registrations = self._get_registrations()
 
         for s in psubmissions:
             data = SubmissionData()
@@ -82,10 +80,8 @@ class SubmissionsWithUserDataCollector(object):
 
             # here we try to get some optional data, it just may not be there
             # and it's ok
-            try:
-                registration = Participant.objects.select_related() \
-                    .get(contest_id=self.contest.id, user=s.user) \
-                    .registration_model
+            registration = registrations.get(s.user_id)
+            if registration is not None:
                 try:
                     data.city = registration.city
                 except AttributeError:
@@ -95,56 +91,144 @@ class SubmissionsWithUserDataCollector(object):
                     data.school_city = registration.school.city
                 except AttributeError:
                     pass
-            except (Participant.DoesNotExist, ObjectDoesNotExist):
-                pass
 
             submissions_list.append(data)
         return submissions_list
 
-    def get_submission_source(self, out_file_path, source):
+    def _get_registrations(self):
+        """Returns a dictionary mapping user ids to registration models of
+           the contest participants, all loaded with a single query.
+        """
+        rcontroller = self.contest.controller.registration_controller()
+        get_model_class = getattr(rcontroller, 'get_model_class', None)
+        model_class = get_model_class() if get_model_class else None
+        if model_class is None:
+            return {}
+        related = [f.name for f in model_class._meta.concrete_fields
+                   if f.is_relation]
+        registrations = model_class.objects \
+                .filter(participant__contest=self.contest) \
+                .select_related(*related)
+        return dict((r.participant.user_id, r) for r in registrations)
+
+    def get_submission_source_stream(self, source):
+        """Returns a pair (file-like object, size) with the contents of
+           the submission source.
+        """
         ft_file = django_to_filetracker_path(source)
-        self.filetracker.get_file(ft_file, out_file_path, add_to_cache=False)
+        reader, _version = self.filetracker.get_stream(ft_file)
+        return reader, self.filetracker.file_size(ft_file)
+
+
+INDEX_HEADER = ['submission_id', 'user_id', 'username', 'first_name',
+    'last_name', 'city', 'school', 'school_city', 'problem_short_name',
+    'score']
+
+
+def _make_index(submission_list):
+    f = StringIO()
+    index_csv = csv.writer(f)
+    index_csv.writerow(INDEX_HEADER)
+    for s in submission_list:
+        index_entry = [s.submission_id, s.user_id, s.username,
+            s.first_name, s.last_name, s.city, s.school, s.school_city,
+            s.problem_short_name, s.score]
+
+        def encode(obj):
+            if obj is None:
+                return 'NULL'
+            else:
+                return force_text(obj).encode('utf8')
+
+        index_csv.writerow([encode(col) for col in index_entry])
+    return f.getvalue()
+
+
+def _add_archive_members(tar, submission_collector, submission_list):
+    """Adds the index and sources of the submissions to ``tar``, yielding
+       after each of the members. Sources are copied straight from
+       Filetracker streams, without storing them on disk.
+    """
+    contest_id = submission_collector.get_contest_id()
+    now = time.time()
+
+    info = tarfile.TarInfo(contest_id)
+    info.type = tarfile.DIRTYPE
+    info.mode = 0700
+    info.mtime = now
+    tar.addfile(info)
+
+    index = _make_index(submission_list)
+    info = tarfile.TarInfo('%s/INDEX' % contest_id)
+    info.size = len(index)
+    info.mtime = now
+    tar.addfile(info, StringIO(index))
+    yield
+
+    for s in submission_list:
+        filename = '%s:%s:%s.%s' % (
+                s.submission_id, s.username, s.problem_short_name,
+                s.solution_language)
+        reader, size = \
+            submission_collector.get_submission_source_stream(s.source_file)
+        try:
+            info = tarfile.TarInfo('%s/%s' % (contest_id, filename))
+            info.size = size
+            info.mtime = now
+            tar.addfile(info, reader)
+        finally:
+            reader.close()
+        yield
 
 
 def build_submissions_archive(out_file, submission_collector):
     """
     Builds submissions archive, in szubrawcy format, in out_file from data
     provided by submission_collector. Argument out_file should be a file-like
-    object.
+    object, it is written sequentially.
     """
     submission_list = submission_collector.collect_list()
-    tmpdir = tempfile.mkdtemp()
-    try:
-        contest_id = submission_collector.get_contest_id()
-        files_dir = os.path.join(tmpdir, contest_id)
-        os.mkdir(files_dir, 0700)
-        with open(os.path.join(files_dir, 'INDEX'), 'w') as f:
-            index_csv = csv.writer(f)
-            header = ['submission_id', 'user_id', 'username', 'first_name',
-                'last_name', 'city', 'school', 'school_city',
-                'problem_short_name', 'score']
-            index_csv.writerow(header)
-            for s in submission_list:
-                index_entry = [s.submission_id, s.user_id, s.username,
-                    s.first_name, s.last_name, s.city, s.school, s.school_city,
-                    s.problem_short_name, s.score]
-
-                def encode(obj):
-                    if obj is None:
-                        return 'NULL'
-                    else:
-                        return force_text(obj).encode('utf8')
-
-                index_csv.writerow([encode(col) for col in index_entry])
-
-        for s in submission_list:
-            filename = '%s:%s:%s.%s' % (
-                    s.submission_id, s.username, s.problem_short_name,
-                    s.solution_language)
-            dest = os.path.join(files_dir, filename)
-            submission_collector.get_submission_source(dest, s.source_file)
-
-        with tarfile.open(fileobj=out_file, mode='w:gz') as tar:
-            tar.add(files_dir, arcname=contest_id)
-    finally:
-        shutil.rmtree(tmpdir)
+    with tarfile.open(fileobj=out_file, mode='w|gz',
+                      encoding='utf-8') as tar:
+        for _member in _add_archive_members(tar, submission_collector,
+                                            submission_list):
+            pass
+
+
+class _ChunksBuffer(object):
+    """A write-only file-like object collecting data until it is taken."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(data)
+
+    def take(self):
+        data = ''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_submissions_archive(submission_collector):
+    """
+    Like :func:`build_submissions_archive`, but returns an iterator over
+    consecutive chunks of the archive, suitable for
+    :class:`~django.http.StreamingHttpResponse`.
+
+    Submissions are collected before this function returns, so that
+    the database is not queried while the response is streamed.
+    """
+    submission_list = submission_collector.collect_list()
+
+    def chunks():
+        buf = _ChunksBuffer()
+        with tarfile.open(fileobj=buf, mode='w|gz', encoding='utf-8') as tar:
+            for _member in _add_archive_members(tar, submission_collector,
+                                                submission_list):
+                data = buf.take()
+                if data:
+                    yield data
+        yield buf.take()
+
+    return chunks()
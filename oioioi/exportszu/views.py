@@ -1,14 +1,11 @@
-import tempfile
-import os
-
 from django.template.response import TemplateResponse
-from django.http import FileResponse
+from django.http import StreamingHttpResponse
 
 from oioioi.contests.utils import contest_exists, is_contest_admin
 from oioioi.base.permissions import enforce_condition
 from oioioi.exportszu.forms import ExportSubmissionsForm
 from oioioi.exportszu.utils import SubmissionsWithUserDataCollector, \
-        build_submissions_archive
+        stream_submissions_archive
 
 
 @enforce_condition(contest_exists & is_contest_admin)
@@ -20,16 +17,11 @@ def export_submissions_view(request):
             only_final = form.cleaned_data['only_final']
             collector = SubmissionsWithUserDataCollector(request.contest,
                 round=round, only_final=only_final)
-            # TemporaryFile promises removal of the file when it is closed.
-            # Note that we cannot use with, because we want to keep it beyond
-            # this function call.
-            tmp_file = tempfile.TemporaryFile()
-            build_submissions_archive(tmp_file, collector)
-            # We send a large file with django. Usually it isn't a good idea,
-            # but letting the web server do it leads to problems with when to
-            # delete this file and from where.
-            tmp_file.seek(0, os.SEEK_SET)  # go to the beginning of the file
-            response = FileResponse(tmp_file)
+            # The archive is built while it is being sent, so neither
+            # the archive nor the sources are stored on disk.
+            response = StreamingHttpResponse(
+                    stream_submissions_archive(collector),
+                    content_type='application/gzip')
             response['Content-Disposition'] = ('attachment; filename="%s.tgz"'
                 % request.contest.id)
             return response
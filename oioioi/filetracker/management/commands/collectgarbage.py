@@ -1,14 +1,121 @@
 import datetime
-import itertools
 import optparse
+import os
+import sqlite3
+import tempfile
+import time
 
 from django.core.management.base import BaseCommand
 from django.db.models.loading import cache
 from django.utils.translation import ugettext as _, ungettext
 
 from oioioi.filetracker.client import get_client
+from oioioi.filetracker.storage import DIGESTS_DIR
 from filetracker import split_name
 
+# SQLite limits the number of parameters of a single query.
+_MAX_QUERY_PARAMS = 500
+
+
+def _file_name(name):
+    """Returns the name of a file without the leading slash and
+       the version.
+    """
+    return split_name(name)[0].lstrip('/')
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class GarbageCollectionState(object):
+    """On-disk state of the garbage collection, kept in an SQLite database.
+
+       The ``needed`` table is an index of names of the files referenced
+       from the database, rebuilt by every run. The ``candidates`` table
+       contains orphaned files scheduled for deletion, together with
+       the information whether they were already deleted. It is kept
+       until all the candidates are deleted, so that an interrupted
+       deletion may be resumed.
+    """
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        self.db.text_factory = str
+        self.db.execute('CREATE TABLE IF NOT EXISTS needed '
+                        '(name TEXT PRIMARY KEY)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS candidates '
+                        '(name TEXT PRIMARY KEY, '
+                        'deleted INTEGER NOT NULL DEFAULT 0)')
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def clear_needed(self):
+        self.db.execute('DELETE FROM needed')
+        self.db.commit()
+
+    def add_needed(self, names):
+        self.db.executemany('INSERT OR IGNORE INTO needed VALUES (?)',
+                            ((name,) for name in names))
+        self.db.commit()
+
+    def filter_not_needed(self, names):
+        names = list(names)
+        needed = set()
+        for chunk in _chunks(names, _MAX_QUERY_PARAMS):
+            needed.update(row[0] for row in self.db.execute(
+                'SELECT name FROM needed WHERE name IN (%s)'
+                % ','.join('?' * len(chunk)), chunk))
+        return [name for name in names if name not in needed]
+
+    def count_pending(self):
+        return self.db.execute('SELECT COUNT(*) FROM candidates '
+                               'WHERE deleted = 0').fetchone()[0]
+
+    def add_candidates(self, names):
+        self.db.executemany('INSERT OR IGNORE INTO candidates (name) '
+                            'VALUES (?)', ((name,) for name in names))
+        self.db.commit()
+
+    def drop_needed_candidates(self):
+        """Removes the pending candidates which got referenced since they
+           were scheduled for deletion.
+        """
+        self.db.execute('DELETE FROM candidates WHERE deleted = 0 AND name '
+                        'IN (SELECT name FROM needed)')
+        self.db.commit()
+
+    def pending_candidates(self, chunk_size):
+        """Yields chunks of names of the files not deleted yet."""
+        last_rowid = 0
+        while True:
+            rows = self.db.execute('SELECT rowid, name FROM candidates '
+                                   'WHERE deleted = 0 AND rowid > ? '
+                                   'ORDER BY rowid LIMIT ?',
+                                   (last_rowid, chunk_size)).fetchall()
+            if not rows:
+                return
+            last_rowid = rows[-1][0]
+            yield [name for _rowid, name in rows]
+
+    def mark_deleted(self, name):
+        self.db.execute('UPDATE candidates SET deleted = 1 WHERE name = ?',
+                        (name,))
+        self.db.commit()
+
+    def clear_candidates(self):
+        self.db.execute('DELETE FROM candidates')
+        self.db.commit()
+
 
 class Command(BaseCommand):
     help = _("Delete all orphaned files older than specified number of days.")
@@ -22,11 +129,50 @@ class Command(BaseCommand):
                              dest='pretend', default=False,
                              help=_("If set, the orphaned files will only be "
                                     "displayed, not deleted.")),
+        optparse.make_option('-s', '--state-file', action='store',
+                             dest='state_file', default=None,
+                             help=_("File to keep the state of the garbage "
+                                    "collection in. If a previous run using "
+                                    "the same file was interrupted, "
+                                    "the deletion is resumed."),
+                             metavar=_("FILE")),
+        optparse.make_option('-r', '--rate', action='store', type='float',
+                             dest='rate', default=0,
+                             help=_("Delete at most RATE files per second. "
+                                    "By default the rate is not limited."),
+                             metavar=_("RATE")),
+        optparse.make_option('-c', '--chunk-size', action='store',
+                             type='int', dest='chunk_size', default=1000,
+                             help=_("Number of files processed at once. "
+                                    "Default value is 1000."),
+                             metavar=_("SIZE")),
     )
     option_list = BaseCommand.option_list + base_options
 
-    def _get_needed_files(self):
-        result = []
+    def _progress(self, message):
+        if self.verbosity > 1:
+            print message
+
+    def _iter_needed_files(self, model, file_fields, chunk_size):
+        """Yields names of the files referenced by ``model``, reading
+           ``chunk_size`` rows at a time.
+        """
+        last_pk = None
+        while True:
+            qs = model.objects.order_by('pk')
+            if last_pk is not None:
+                qs = qs.filter(pk__gt=last_pk)
+            rows = list(qs.values_list('pk', *file_fields)[:chunk_size])
+            if not rows:
+                return
+            last_pk = rows[-1][0]
+            for row in rows:
+                for file in row[1:]:
+                    if file:
+                        yield _file_name(file)
+
+    def _mark_needed_files(self, state, chunk_size):
+        state.clear_needed()
         for app in cache.get_apps():
             model_list = cache.get_models(app)
             for model in model_list:
@@ -34,47 +180,145 @@ class Command(BaseCommand):
                                if field.get_internal_type() == 'FileField']
 
                 if len(file_fields) > 0:
-                    files = model.objects.all().values_list(*file_fields)
-                    result.extend([split_name(file)[0] for file in itertools.
-                                  chain.from_iterable(files) if file])
-        return result
+                    count = 0
+                    for names in _chunks(self._iter_needed_files(model,
+                            file_fields, chunk_size), chunk_size):
+                        state.add_needed(names)
+                        count += len(names)
+                    self._progress(_("Marked %(count)d files referenced by "
+                                     "%(model)s.") % {
+                                        'count': count,
+                                        'model': model._meta.label})
 
-    def handle(self, *args, **options):
-        needed_files = self._get_needed_files()
-        all_files = get_client().list_local_files()
+    def _find_orphaned_files(self, state, days, chunk_size):
         max_date_to_delete = datetime.datetime.now() - datetime. \
-            timedelta(days=options['days'])
+            timedelta(days=days)
+        # The files are not collected into a list, as there may be millions
+        # of them.
+        local_store = get_client().local_store
+        all_files = local_store.list_files() if local_store else []
+        old_files = (_file_name(f.name) for f in all_files
+                     if datetime.datetime.fromtimestamp(f.mtime)
+                        < max_date_to_delete)
+        checked = 0
+        for names in _chunks(old_files, chunk_size):
+            files = []
+            digests = []
+            for name in names:
+                if name.startswith(DIGESTS_DIR + '/'):
+                    digests.append(name)
+                else:
+                    files.append(name)
+            state.add_candidates(state.filter_not_needed(files))
+            state.add_candidates(self._stale_digests(state, digests))
+            checked += len(names)
+            self._progress(_("Checked %d old files.") % checked)
+
+    def _stale_digests(self, state, digests):
+        """Returns the digests (see
+           :meth:`~oioioi.filetracker.storage.FiletrackerStorage._find_duplicate`)
+           of the files which are no longer referenced or present.
+        """
+        client = get_client()
+        stale = []
+        targets = {}
+        for digest in digests:
+            try:
+                reader, _version = client.get_stream('/' + digest)
+                try:
+                    versioned_path = reader.read().strip().decode('utf-8')
+                finally:
+                    reader.close()
+                path, version = split_name(versioned_path)
+                if client.file_version(path) != version:
+                    stale.append(digest)
+                    continue
+            # pylint: disable=broad-except
+            except Exception:
+                stale.append(digest)
+                continue
+            targets[digest] = _file_name(path)
+        not_needed = set(state.filter_not_needed(targets.values()))
+        stale.extend(digest for digest, target in targets.iteritems()
+                     if target in not_needed)
+        return stale
+
+    def _delete_files(self, state, files_count, rate, chunk_size):
+        start = time.time()
+        deleted = 0
+        for names in state.pending_candidates(chunk_size):
+            for file in names:
+                if rate:
+                    delay = start + deleted / rate - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                if self.verbosity > 1:
+                    print " ", file
+                get_client().delete_file('/' + file)
+                # Marked one by one, so that a resumed deletion doesn't
+                # repeat any.
+                state.mark_deleted(file)
+                deleted += 1
+            if self.verbosity > 0:
+                print _("Deleted %(deleted)d of %(all)d files.") % {
+                            'deleted': deleted, 'all': files_count}
+
+    def handle(self, *args, **options):
+        self.verbosity = int(options['verbosity'])
+        chunk_size = options['chunk_size']
+        state_file = options['state_file']
+        if state_file is None:
+            fd, state_path = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(fd)
+        else:
+            state_path = state_file
 
-        diff = set([f[0] for f in all_files]) - set(needed_files)
-        to_delete = [f[0] for f in all_files if f[0] in diff and datetime.
-                     datetime.fromtimestamp(f[1]) < max_date_to_delete]
+        state = GarbageCollectionState(state_path)
+        try:
+            self._mark_needed_files(state, chunk_size)
+            resumed = state.count_pending() > 0
+            if resumed:
+                state.drop_needed_candidates()
+                if self.verbosity > 0:
+                    print _("Resuming interrupted deletion.")
+            else:
+                self._find_orphaned_files(state, options['days'], chunk_size)
+            self._handle_candidates(state, resumed, options)
+        finally:
+            state.close()
+            if state_file is None:
+                os.unlink(state_path)
 
-        files_count = len(to_delete)
-        if files_count == 0 and int(options['verbosity']) > 0:
+    def _handle_candidates(self, state, resumed, options):
+        files_count = state.count_pending()
+        if files_count == 0 and self.verbosity > 0:
             print _("No files to delete.")
         elif options['pretend']:
-            if int(options['verbosity']) > 1:
+            if self.verbosity > 1:
                 print ungettext("The following %d file is scheduled for "
                                 "deletion:",
                                 "The following %d files are scheduled for "
                                 "deletion:",
                                 files_count) % files_count
-                for file in to_delete:
-                    print " ", file
-            elif int(options['verbosity']) == 1:
+                for names in state.pending_candidates(options['chunk_size']):
+                    for file in names:
+                        print " ", file
+            elif self.verbosity == 1:
                 print ungettext("%d file scheduled for deletion.",
                                 "%d files scheduled for deletion.",
                                 files_count) % files_count
+            if resumed:
+                # Keep the interrupted deletion for the next run.
+                return
         else:
-            if int(options['verbosity']) > 1:
+            if self.verbosity > 1:
                 print ungettext("Deleting the following %d file:",
                                 "Deleting the following %d files:",
                                 files_count) % files_count
-            if int(options['verbosity']) == 1:
+            if self.verbosity == 1:
                 print ungettext("Deleting %d file",
                                 "Deleting %d files",
                                 files_count) % files_count
-            for file in to_delete:
-                if int(options['verbosity']) > 1:
-                    print " ", file
-                get_client().delete_file('/' + file)
+            self._delete_files(state, files_count, options['rate'],
+                               options['chunk_size'])
+        state.clear_candidates()
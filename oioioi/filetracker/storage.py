@@ -1,15 +1,36 @@
+from django.conf import settings
 from django.core.files.storage import Storage
 from django.core.files import File
 from django.core.urlresolvers import reverse
+from oioioi.base.utils import strip_num_or_hash
 from oioioi.filetracker.client import get_client
-from oioioi.filetracker.utils import FileInFiletracker
+from oioioi.filetracker.utils import FileInFiletracker, DeduplicatedFile
 from oioioi.filetracker.filename import FiletrackerFilename
+from filetracker import split_name
 
+import hashlib
+import logging
 import os
 import os.path
 import tempfile
 import datetime
 
+logger = logging.getLogger(__name__)
+
+#: Filetracker directory (without the leading slash) with the digests of
+#: :class:`~oioioi.filetracker.utils.DeduplicatedFile`s saved by
+#: :class:`FiletrackerStorage`, see
+#: :meth:`FiletrackerStorage._find_duplicate`.
+DIGESTS_DIR = 'content_digests'
+
+
+def _file_digest(filename):
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), ''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
 
 class FiletrackerStorage(Storage):
     def __init__(self, prefix='/', client=None):
@@ -68,14 +89,66 @@ class FiletrackerStorage(Storage):
                 f.write(chunk)
             f.flush()
             filename = f.name
+        digest = None
+        if isinstance(content, DeduplicatedFile) and \
+                settings.FILETRACKER_DEDUPLICATE_UPLOADS:
+            digest = _file_digest(filename)
+            duplicate = self._find_duplicate(path, digest)
+            if duplicate is not None:
+                content.close()
+                return duplicate
         # If there will be only local store, filetracker will ignore
         # 'to_local_store' argument.
-        name = self._cut_prefix(self.client.put_file(path, filename,
-            to_local_store=False))
-        name = FiletrackerFilename(name)
+        versioned_path = self.client.put_file(path, filename,
+            to_local_store=False)
+        if digest is not None:
+            self._save_digest(path, digest, versioned_path)
+        name = FiletrackerFilename(self._cut_prefix(versioned_path))
         content.close()
         return name
 
+    def _digest_path(self, path, digest):
+        # Names differing only in the suffix added by get_available_name
+        # are considered the same.
+        return '/%s/%s%s' % (DIGESTS_DIR, digest, strip_num_or_hash(path))
+
+    def _find_duplicate(self, path, digest):
+        """Returns the name of an already stored file with the same content
+           and (up to the suffix added by ``get_available_name``) name, or
+           ``None`` if there is no such file.
+
+           This way re-uploading unchanged files (e.g. tests of a problem
+           package) doesn't transfer them to Filetracker again.
+        """
+        try:
+            reader, _version = self.client.get_stream(
+                    self._digest_path(path, digest))
+            try:
+                versioned_path = reader.read().strip().decode('utf-8')
+            finally:
+                reader.close()
+            unversioned_path, version = split_name(versioned_path)
+            # The file may have been deleted or overwritten since.
+            if not unversioned_path.startswith(self.prefix) or \
+                    self.client.file_version(unversioned_path) != version:
+                return None
+        # pylint: disable=broad-except
+        except Exception:
+            return None
+        return FiletrackerFilename(self._cut_prefix(versioned_path))
+
+    def _save_digest(self, path, digest, versioned_path):
+        try:
+            with tempfile.NamedTemporaryFile() as f:
+                f.write(unicode(versioned_path).encode('utf-8'))
+                f.flush()
+                self.client.put_file(self._digest_path(path, digest), f.name,
+                                     to_local_store=False)
+        # pylint: disable=broad-except
+        except Exception:
+            logger.warning("Failed to save the digest of %s", versioned_path,
+                           exc_info=True)
+
     def read_using_cache(self, name):
         """Opens a file using a cache (if it's possible)"""
         path = self._make_filetracker_path(name)
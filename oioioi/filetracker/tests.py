@@ -1,21 +1,30 @@
 # coding: utf-8
 
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
 from django.core.files.base import ContentFile
 from django.db.models.fields.files import FieldFile, FileField
 from django.core.files.storage import default_storage
+from django.test.utils import override_settings
 
 from oioioi.base.tests import TestCase
+from oioioi.filetracker.client import get_client
+from oioioi.filetracker.management.commands.collectgarbage import \
+        GarbageCollectionState
 from oioioi.filetracker.models import TestFileModel
 from oioioi.filetracker.storage import FiletrackerStorage
 from oioioi.filetracker.utils import django_to_filetracker_path, \
-        filetracker_to_django_file, make_content_disposition_header
+        filetracker_to_django_file, make_content_disposition_header, \
+        DeduplicatedFile
 import filetracker
 import filetracker.dummy
+import mock
 
+import os
 import tempfile
 import shutil
 import datetime
+from StringIO import StringIO
 
 
 class TestFileField(TestCase):
@@ -120,6 +129,137 @@ class TestFileStorage(TestCase):
             shutil.rmtree(dir)
 
 
+class TestFileDeduplication(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        client = filetracker.Client(cache_dir=self.dir, remote_store=None)
+        self.storage = FiletrackerStorage(client=client)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _save(self, name, content):
+        return self.storage.save(name, DeduplicatedFile(StringIO(content)))
+
+    def test_deduplication(self):
+        name = self._save('tests/abc0.in', '1 2')
+        self.assertEqual(name, 'tests/abc0.in')
+
+        same = self._save('tests/abc0.in', '1 2')
+        self.assertEqual(same.versioned_name, name.versioned_name)
+
+        changed = self._save('tests/abc0.in', '2 3')
+        self.assertNotEqual(changed, name)
+        self.assertEqual(self.storage.open(changed, 'rb').read(), '2 3')
+
+        other = self._save('tests/abc1.in', '1 2')
+        self.assertEqual(other, 'tests/abc1.in')
+
+        self.storage.delete(name)
+        name = self._save('tests/abc0.in', '1 2')
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.storage.open(name, 'rb').read(), '1 2')
+
+    def test_not_deduplicated_file(self):
+        name = self.storage.save('tests/abc0.in', ContentFile('1 2'))
+        other = self.storage.save('tests/abc0.in', ContentFile('1 2'))
+        self.assertNotEqual(other, name)
+        self.assertFalse([f for f in self.storage.client.list_local_files()
+                          if f[0].startswith('/content_digests/')])
+
+    @override_settings(FILETRACKER_DEDUPLICATE_UPLOADS=False)
+    def test_deduplication_disabled(self):
+        name = self._save('tests/abc0.in', '1 2')
+        other = self._save('tests/abc0.in', '1 2')
+        self.assertNotEqual(other, name)
+
+
+class TestCollectGarbage(TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        store_dir = os.path.join(self.dir, 'store')
+        self.settings_override = override_settings(
+                FILETRACKER_CLIENT_FACTORY=lambda: filetracker.Client(
+                    cache_dir=store_dir, remote_store=None))
+        self.settings_override.enable()
+
+        source = os.path.join(self.dir, 'source')
+        with open(source, 'w') as f:
+            f.write('whatever')
+        self.client = get_client()
+        for name in ('needed', 'orphaned', 'orphaned2'):
+            self.client.put_file('/tests/%s@1000' % name, source)
+        self.client.put_file('/tests/fresh', source)
+        for name in ('needed', 'orphaned', 'missing'):
+            with open(source, 'w') as f:
+                f.write('/tests/%s@1000' % name)
+            self.client.put_file('/content_digests/abc/tests/%s@1000' % name,
+                                 source)
+        TestFileModel.objects.create(file_field='tests/needed@1000')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.dir)
+
+    def _stored_files(self):
+        return sorted(filetracker.split_name(f[0])[0].lstrip('/')
+                      for f in self.client.list_local_files())
+
+    def test_collect_garbage(self):
+        call_command('collectgarbage', days=1, pretend=True, verbosity=0)
+        self.assertEqual(len(self._stored_files()), 7)
+
+        call_command('collectgarbage', days=1, chunk_size=1, verbosity=0)
+        self.assertEqual(self._stored_files(),
+                ['content_digests/abc/tests/needed', 'tests/fresh',
+                 'tests/needed'])
+
+    def test_resume(self):
+        state_file = os.path.join(self.dir, 'state')
+        state = GarbageCollectionState(state_file)
+        state.add_candidates(['tests/needed', 'tests/orphaned'])
+        state.close()
+
+        call_command('collectgarbage', days=1, state_file=state_file,
+                     verbosity=0)
+        self.assertEqual(self._stored_files(),
+                ['content_digests/abc/tests/missing',
+                 'content_digests/abc/tests/needed',
+                 'content_digests/abc/tests/orphaned', 'tests/fresh',
+                 'tests/needed', 'tests/orphaned2'])
+
+        call_command('collectgarbage', days=1, state_file=state_file,
+                     verbosity=0)
+        self.assertNotIn('tests/orphaned2', self._stored_files())
+
+    def test_interrupted_deletion(self):
+        state_file = os.path.join(self.dir, 'state')
+        delete_file = filetracker.Client.delete_file
+        deleted = []
+
+        def failing_delete_file(client, name):
+            if deleted:
+                raise RuntimeError("Interrupted")
+            delete_file(client, name)
+            deleted.append(name)
+
+        with mock.patch.object(filetracker.Client, 'delete_file',
+                               autospec=True,
+                               side_effect=failing_delete_file):
+            with self.assertRaises(RuntimeError):
+                call_command('collectgarbage', days=1, state_file=state_file,
+                             verbosity=0)
+        state = GarbageCollectionState(state_file)
+        self.assertEqual(state.count_pending(), 3)
+        state.close()
+
+        call_command('collectgarbage', days=1, state_file=state_file,
+                     verbosity=0)
+        self.assertEqual(self._stored_files(),
+                ['content_digests/abc/tests/needed', 'tests/fresh',
+                 'tests/needed'])
+
+
 class TestStreamingMixin(object):
     def assertStreamingEqual(self, response, content):
         self.assertEqual(self.streamingContent(response), content)
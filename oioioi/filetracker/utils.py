@@ -33,6 +33,20 @@ class FileInFiletracker(File):
         pass
 
 
+class DeduplicatedFile(File):
+    """A :class:`django.core.files.File` which
+       :class:`~oioioi.filetracker.storage.FiletrackerStorage` does not
+       send to Filetracker again if a file with the same content and name
+       is already stored there. The stored file is reused instead.
+
+       Usage::
+
+           some_model_instance.file_field.save(name,
+                   DeduplicatedFile(open(path, 'rb')))
+    """
+    pass
+
+
 def django_to_filetracker_path(django_file):
     """Returns the filetracker path of a :class:`django.core.files.File`."""
     storage = getattr(django_file, 'storage', None)
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import oioioi.base.fields
+import oioioi.filetracker.fields
+import oioioi.oireports.models
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('contests', '0010_score_sort_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GeneratedReport',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('creation_date', models.DateTimeField(default=django.utils.timezone.now, verbose_name='creation date')),
+                ('name', models.CharField(max_length=255, verbose_name='name')),
+                ('state', oioioi.base.fields.EnumField(default=b'QUEUED', max_length=64, verbose_name='state', choices=[(b'QUEUED', 'Queued'), (b'RUNNING', 'In progress'), (b'SUCCESS', 'Ready'), (b'FAILURE', 'Failed')])),
+                ('users_done', models.IntegerField(default=0)),
+                ('users_total', models.IntegerField(default=0)),
+                ('file', oioioi.filetracker.fields.FileField(max_length=255, null=True, upload_to=oioioi.oireports.models._make_report_filename, blank=True)),
+                ('contest', models.ForeignKey(to='contests.Contest')),
+                ('creator', models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, null=True)),
+            ],
+            options={
+                'ordering': ('-creation_date',),
+                'verbose_name': 'generated report',
+                'verbose_name_plural': 'generated reports',
+            },
+        ),
+    ]
@@ -1,3 +1,152 @@
+import io
+import itertools
+import logging
+import os.path
+import zipfile
+
+from celery.task import task
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.db import models
+from django.utils import timezone, translation
+from django.utils.text import get_valid_filename
+from django.utils.translation import ugettext_lazy as _
+
+from oioioi.base.fields import EnumField, EnumRegistry
 from oioioi.base.utils.deps import check_django_app_dependencies
+from oioioi.contests.models import Contest, ProblemInstance
+from oioioi.filetracker.fields import FileField
+from oioioi.oireports.reports import serialize_reports, render_report, \
+        compile_pdf_reports
 
 check_django_app_dependencies(__name__, ['oioioi.oi'])
+
+logger = logging.getLogger(__name__)
+
+
+report_states = EnumRegistry()
+report_states.register('QUEUED', _("Queued"))
+report_states.register('RUNNING', _("In progress"))
+report_states.register('SUCCESS', _("Ready"))
+report_states.register('FAILURE', _("Failed"))
+
+
+def _make_report_filename(instance, filename):
+    return 'oireports/%s/%s' % (instance.contest.id,
+            get_valid_filename(os.path.basename(filename)))
+
+
+class GeneratedReport(models.Model):
+    """A report generated in the background by :func:`oireports_job`."""
+    contest = models.ForeignKey(Contest)
+    creator = models.ForeignKey(User, null=True, on_delete=models.SET_NULL)
+    creation_date = models.DateTimeField(default=timezone.now,
+            verbose_name=_("creation date"))
+    name = models.CharField(max_length=255, verbose_name=_("name"))
+    state = EnumField(report_states, default='QUEUED',
+                      verbose_name=_("state"))
+    users_done = models.IntegerField(default=0)
+    users_total = models.IntegerField(default=0)
+    file = FileField(upload_to=_make_report_filename, null=True, blank=True)
+
+    class Meta(object):
+        verbose_name = _("generated report")
+        verbose_name_plural = _("generated reports")
+        ordering = ('-creation_date',)
+
+    def __unicode__(self):
+        return self.name
+
+    @property
+    def progress(self):
+        """Percentage of the processed users."""
+        if not self.users_total:
+            return 100 if self.state == 'SUCCESS' else 0
+        return 100 * self.users_done // self.users_total
+
+
+def _zip_files(files):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, content in files:
+            archive.writestr(name, content)
+    return buf.getvalue()
+
+
+@task(ignore_result=True)
+def oireports_job(report_id, params):
+    """Generates a :class:`GeneratedReport`.
+
+       Used ``params`` keys:
+         ``form_type``: ``'pdf_report'`` or ``'xml_report'``
+
+         ``title``: title of the report
+
+         ``timestamp``: date shown in the report
+
+         ``user_ids``: ids of the users to generate the report for
+
+         ``test_groups``: a list of pairs of a problem instance id and
+         a list of names of test groups to include
+
+         ``language``: code of the language of the report
+
+       PDF reports of more than ``OIREPORTS_CHUNK_SIZE`` users are split
+       into several files, compiled concurrently and packed into
+       a ZIP archive.
+    """
+    prefix = "Report generation (id: %s): " % (report_id,)
+    try:
+        report = GeneratedReport.objects.get(id=report_id)
+    except GeneratedReport.DoesNotExist:
+        return logger.info(prefix + "report doesn't exist")
+
+    def progress(done, total):
+        GeneratedReport.objects.filter(id=report_id) \
+                .update(users_done=done, users_total=total)
+
+    GeneratedReport.objects.filter(id=report_id).update(state='RUNNING')
+    try:
+        pis = ProblemInstance.objects.in_bulk(
+                [pi_id for pi_id, _groups in params['test_groups']])
+        test_groups = dict((pis[pi_id], groups)
+                           for pi_id, groups in params['test_groups']
+                           if pi_id in pis)
+        users = User.objects.filter(id__in=params['user_ids'])
+        title = params['title']
+        timestamp = params['timestamp']
+        base_name = os.path.splitext(report.name)[0]
+
+        with translation.override(params['language']):
+            chunks = list(serialize_reports(users, test_groups.keys(),
+                                            test_groups, progress))
+            if params['form_type'] == 'xml_report':
+                rows = list(itertools.chain.from_iterable(chunks))
+                content = render_report('oireports/xmlreport.xml', title,
+                                        rows, timestamp).encode('utf-8')
+                name = base_name + '.xml'
+            else:
+                chunks = [rows for rows in chunks if rows] or [[]]
+                pdfs = compile_pdf_reports(
+                        [render_report('oireports/pdfreport.tex', title,
+                                       rows, timestamp)
+                         for rows in chunks])
+                if len(pdfs) == 1:
+                    content = pdfs[0]
+                    name = base_name + '.pdf'
+                else:
+                    content = _zip_files(('%s-%03d.pdf' % (base_name, i + 1),
+                                          pdf)
+                                         for i, pdf in enumerate(pdfs))
+                    name = base_name + '.zip'
+
+        report = GeneratedReport.objects.get(id=report_id)
+        report.name = name
+        report.file.save(name, ContentFile(content), save=False)
+        report.state = 'SUCCESS'
+        report.save()
+        logger.info(prefix + "success")
+    except Exception:
+        logger.error(prefix + "failure", exc_info=True)
+        GeneratedReport.objects.filter(id=report_id).update(state='FAILURE')
+
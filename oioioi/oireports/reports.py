@@ -0,0 +1,178 @@
+import itertools
+from multiprocessing.pool import ThreadPool
+from operator import attrgetter
+
+from django.conf import settings
+from django.template.loader import render_to_string
+
+from oioioi.base.utils.pdf import compile_latex
+from oioioi.contests.models import UserResultForProblem
+from oioioi.programs.models import CompilationReport, GroupReport, \
+        TestReport
+
+
+def _map_concurrently(fn, items):
+    """Like :func:`map`, but calls ``fn`` in ``OIREPORTS_WORKERS`` threads.
+
+       ``fn`` must not use the database.
+    """
+    items = list(items)
+    workers = min(settings.OIREPORTS_WORKERS, len(items))
+    if workers <= 1:
+        return map(fn, items)
+    pool = ThreadPool(workers)
+    try:
+        return pool.map(fn, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _read_source(source_file):
+    try:
+        return source_file.read()
+    finally:
+        source_file.close()
+
+
+def _sum_scores(scores):
+    total = None
+    for score in scores:
+        if total is None:
+            total = score
+        elif score is not None:
+            total += score
+    return total
+
+
+def _serialize_chunk(users, problem_instances, test_groups):
+    """Generates dictionaries representing reports of the given users,
+       using a constant number of database queries.
+
+       The source files are read from filetracker concurrently.
+
+       :type users: list of :cls:`django.contrib.auth.User`
+       :param users: users to generate the reports for
+       :type problem_instances: list of
+                                 :cls:`oioioi.contests.ProblemInstance`
+       :param problem_instances: problem instances to include in the reports
+       :type test_groups: dict(:cls:`oioioi.contests.ProblemInstance`
+                           -> list of str)
+       :param test_groups: dictionary mapping problem instances into lists
+                           of names of test groups to include
+    """
+    groups_by_pi = dict((pi.id, set(groups))
+                        for pi, groups in test_groups.iteritems())
+    all_groups = set(itertools.chain.from_iterable(groups_by_pi.values()))
+
+    results = list(UserResultForProblem.objects
+            .filter(user__in=users,
+                    problem_instance__in=list(problem_instances),
+                    submission_report__isnull=False)
+            .select_related('problem_instance__problem',
+                            'submission_report__submission__programsubmission')
+            .order_by('id'))
+    submission_ids = [r.submission_report.submission_id for r in results]
+
+    compilation_reports = dict((cr.submission_report_id, cr)
+            for cr in CompilationReport.objects.filter(
+                submission_report__in=[r.submission_report_id
+                                       for r in results]).order_by('id'))
+
+    test_reports = {}
+    for tr in TestReport.objects \
+            .filter(submission_report__submission__in=submission_ids) \
+            .filter(submission_report__status='ACTIVE') \
+            .filter(submission_report__kind__in=['INITIAL', 'NORMAL']) \
+            .filter(test_group__in=all_groups) \
+            .select_related('submission_report') \
+            .order_by('test__kind', 'test__order', 'test_name'):
+        test_reports.setdefault(tr.submission_report.submission_id, []) \
+                .append(tr)
+
+    group_reports = {}
+    for gr in GroupReport.objects \
+            .filter(submission_report__submission__in=submission_ids) \
+            .filter(submission_report__status='ACTIVE') \
+            .filter(submission_report__kind__in=['INITIAL', 'NORMAL']) \
+            .filter(group__in=all_groups) \
+            .select_related('submission_report') \
+            .order_by('id'):
+        group_reports.setdefault(gr.submission_report.submission_id, {})[
+                gr.group] = gr
+
+    source_files = [r.submission_report.submission.programsubmission
+                    .source_file for r in results]
+    sources = _map_concurrently(_read_source, source_files)
+
+    resultsets = {}
+    for r, source_file, code in zip(results, source_files, sources):
+        submission_id = r.submission_report.submission_id
+        groups = groups_by_pi[r.problem_instance_id]
+        submission_group_reports = group_reports.get(submission_id, {})
+        tests = [tr for tr in test_reports.get(submission_id, [])
+                 if tr.test_group in groups]
+        groups = []
+        for group_name, group_tests in itertools.groupby(tests,
+                attrgetter('test_group')):
+            groups.append({'tests': list(group_tests),
+                'report': submission_group_reports[group_name]})
+
+        resultsets.setdefault(r.user_id, []).append(dict(
+            result=r,
+            score=_sum_scores(g['report'].score for g in groups),
+            max_score=_sum_scores(g['report'].max_score for g in groups),
+            compilation_report=compilation_reports.get(
+                    r.submission_report_id),
+            groups=groups,
+            code=code,
+            codefile=source_file.file.name
+        ))
+
+    rows = []
+    for user in users:
+        user_resultsets = resultsets.get(user.id, [])
+        rows.append({
+            'user': user,
+            'resultsets': user_resultsets,
+            'sum': _sum_scores(rs['score'] for rs in user_resultsets),
+        })
+    return rows
+
+
+def serialize_reports(users, problem_instances, test_groups,
+                      progress=None):
+    """Generates dictionaries representing reports of a number of users.
+
+       Yields lists of reports of at most ``OIREPORTS_CHUNK_SIZE`` users,
+       sorted by user's last name and first name. Users without any results
+       are skipped.
+
+       If ``progress`` is given, it's called after every chunk with
+       the number of processed users and the number of all users.
+    """
+    users = list(users.order_by('last_name', 'first_name', 'username'))
+    chunk_size = settings.OIREPORTS_CHUNK_SIZE
+    for i in xrange(0, len(users), chunk_size):
+        rows = _serialize_chunk(users[i:i + chunk_size], problem_instances,
+                                test_groups)
+        if progress is not None:
+            progress(min(i + chunk_size, len(users)), len(users))
+        yield [row for row in rows if row['resultsets']]
+
+
+def render_report(template_name, title, rows, timestamp):
+    return render_to_string(template_name, {
+        'rows': rows,
+        'title': title,
+        'timestamp': timestamp,
+    })
+
+
+def compile_pdf_reports(tex_codes):
+    """Compiles the LaTeX code of reports into PDF files, running
+       ``OIREPORTS_WORKERS`` instances of pdflatex concurrently.
+
+       Returns a list of contents of the PDF files.
+    """
+    return _map_concurrently(compile_latex, tex_codes)
@@ -4,11 +4,13 @@ from datetime import datetime
 import slate
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
+from django.test.utils import override_settings
 from django.utils.timezone import utc
 
-from oioioi.base.tests import TestCase, fake_time
+from oioioi.base.tests import TestCase, fake_time, check_not_accessible
 from oioioi.contests.models import Contest
 from oioioi.filetracker.tests import TestStreamingMixin
+from oioioi.oireports.models import GeneratedReport
 from oioioi.oireports.views import CONTEST_REPORT_KEY
 from oioioi.participants.models import Participant
 
@@ -82,6 +84,39 @@ class TestReportViews(TestCase, TestStreamingMixin):
             self.assertIn("<testcomment>program exited with", content)
             self.assertNotIn("test_user2", content)
 
+    @override_settings(OIREPORTS_SYNC_LIMIT=0, OIREPORTS_CHUNK_SIZE=1)
+    def test_background_report(self):
+        contest = Contest.objects.get()
+        url = reverse('oireports', kwargs={'contest_id': contest.id})
+        post_vars = {
+            'report_round': CONTEST_REPORT_KEY,
+            'report_region': CONTEST_REPORT_KEY,
+            'testgroup[zad1]': ['0', '1', '2', '3'],
+            'form_type': 'xml_report',
+            'single_report_user': ''
+        }
+
+        self.client.login(username='test_admin')
+        with fake_time(datetime(2015, 8, 5, tzinfo=utc)):
+            response = self.client.post(url, post_vars, follow=True)
+            self.assertContains(response, 'queued for generation')
+            report = GeneratedReport.objects.get()
+            self.assertEqual(report.state, 'SUCCESS')
+            self.assertEqual(report.users_done, 2)
+            self.assertEqual(report.name, 'c-all-all.xml')
+
+            download_url = reverse('oireports_download',
+                    kwargs={'contest_id': contest.id, 'report_id': report.id})
+            self.assertContains(response, download_url)
+            response = self.client.get(download_url)
+            content = self.streamingContent(response)
+            self.assertIn("<user>Test User (test_user)", content)
+            self.assertIn("<result>34</result>", content)
+            self.assertNotIn("test_user2", content)
+
+        self.client.login(username='test_user')
+        check_not_accessible(self, download_url)
+
     def test_single_report(self):
         contest = Contest.objects.get()
         url = reverse('oireports', kwargs={'contest_id': contest.id})
@@ -6,4 +6,6 @@ contest_patterns = [
     url(r'^oireports/$', views.oireports_view, name='oireports'),
     url(r'^get_report_users/$', views.get_report_users_view,
         name='get_report_users'),
+    url(r'^oireports/download/(?P<report_id>\d+)/$',
+        views.download_report_view, name='oireports_download'),
 ]
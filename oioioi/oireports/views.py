@@ -1,13 +1,14 @@
 import itertools
-from operator import attrgetter
 
-from django.template.loader import render_to_string
+from django.conf import settings
+from django.contrib import messages
 from django.template.response import TemplateResponse
-from django.template import RequestContext
 from django.core.exceptions import SuspiciousOperation
 from django.core.urlresolvers import reverse
 from django.core.files.base import ContentFile
-from django.utils.translation import ugettext_lazy as _
+from django.db import transaction
+from django.shortcuts import get_object_or_404, redirect
+from django.utils.translation import ugettext_lazy as _, get_language
 from django.contrib.auth.models import User
 
 from oioioi.base.permissions import enforce_condition
@@ -15,12 +16,12 @@ from oioioi.base.utils.pdf import generate_pdf
 from oioioi.base.utils.user_selection import get_user_hints_view
 from oioioi.contests.menu import contest_admin_menu_registry
 from oioioi.filetracker.utils import stream_file
-from oioioi.contests.models import Round, UserResultForProblem, Submission
+from oioioi.contests.models import Round, Submission
 from oioioi.contests.utils import is_contest_admin, contest_exists, \
         has_any_rounds
 from oioioi.oireports.forms import OIReportForm, CONTEST_REPORT_KEY
-from oioioi.programs.models import CompilationReport, GroupReport, \
-        TestReport
+from oioioi.oireports.models import GeneratedReport, oireports_job
+from oioioi.oireports.reports import serialize_reports, render_report
 from oioioi.participants.models import Region
 
 
@@ -35,6 +36,7 @@ def _users_in_contest(request, region=None):
     return queryset
 
 
+@transaction.non_atomic_requests
 @contest_admin_menu_registry.register_decorator(_("Printing reports"),
     lambda request: reverse('oireports',
         kwargs={'contest_id': request.contest.id}),
@@ -47,143 +49,35 @@ def oireports_view(request):
 
         if form.is_valid():
             form_type = form.cleaned_data['form_type']
-
-            if form_type == 'pdf_report':
-                return generate_pdfreport(request, form)
-            elif form_type == 'xml_report':
-                return generate_xmlreport(request, form)
-            else:
+            if form_type not in ('pdf_report', 'xml_report'):
                 raise SuspiciousOperation
+            title, users, testgroups, filename = \
+                    _report_params(request, form)
+
+            # Reports of many users are generated in the background,
+            # as it would take too long for an HTTP request.
+            if users.count() > settings.OIREPORTS_SYNC_LIMIT:
+                return queue_report(request, form_type, title, users,
+                                    testgroups, filename)
+            elif form_type == 'pdf_report':
+                return generate_pdfreport(request, title, users, testgroups,
+                                          filename)
+            else:
+                return generate_xmlreport(request, title, users, testgroups,
+                                          filename)
     else:
         form = OIReportForm(request)
+    reports = GeneratedReport.objects.filter(contest=request.contest)
     return TemplateResponse(request, 'oireports/report-options.html', {
             'form': form,
-            'CONTEST_REPORT_KEY': CONTEST_REPORT_KEY
+            'CONTEST_REPORT_KEY': CONTEST_REPORT_KEY,
+            'reports': reports,
+            'reports_pending': any(r.state in ('QUEUED', 'RUNNING')
+                                   for r in reports),
     })
 
 
-def _render_report(request, template_name, title, users,
-        problem_instances, test_groups):
-    rows = _serialize_reports(users, problem_instances, test_groups)
-    return render_to_string(template_name,
-            context_instance=RequestContext(request, {
-                'rows': rows,
-                'title': title,
-            }))
-
-
-def _serialize_report(user, problem_instances, test_groups):
-    """Generates a dictionary representing a single report.
-
-
-       :param request: Django request
-       :type user: :cls:`django.contrib.auth.User`
-       :param user: user to generate the report for
-       :type problem_instances: list of
-                                 :cls:`oioioi.contests.ProblemInstance`
-       :param problem_instances: problem instances to include in the report
-       :type test_groups: dict(:cls:`oioioi.contests.ProblemInstance`
-                           -> list of str)
-       :param test_groups: dictionary mapping problem instances into lists
-                           of names of test groups to include
-    """
-
-    resultsets = []
-    total_score = None
-
-    results = UserResultForProblem.objects.filter(
-            user=user,
-            problem_instance__in=list(problem_instances),
-            submission_report__isnull=False)
-    for r in results:
-        problem_instance = r.problem_instance
-        submission_report = r.submission_report
-        submission = submission_report.submission
-        source_file = submission.programsubmission.source_file
-        groups = list(test_groups[problem_instance])
-
-        try:
-            compilation_report = CompilationReport.objects \
-                    .get(submission_report=submission_report)
-        except CompilationReport.DoesNotExist:
-            compilation_report = None
-
-        try:
-            test_reports = TestReport.objects \
-                    .filter(submission_report__submission=submission) \
-                    .filter(submission_report__status='ACTIVE') \
-                    .filter(submission_report__kind__in=['INITIAL',
-                                                         'NORMAL']) \
-                    .filter(test_group__in=groups) \
-                    .order_by('test__kind', 'test__order', 'test_name')
-        except TestReport.DoesNotExist:
-            test_reports = []
-
-        group_reports = GroupReport.objects \
-                .filter(submission_report__submission=submission) \
-                .filter(submission_report__status='ACTIVE') \
-                .filter(submission_report__kind__in=['INITIAL', 'NORMAL']) \
-                .filter(group__in=groups)
-        group_reports = dict((g.group, g) for g in group_reports)
-        groups = []
-        for group_name, tests in itertools.groupby(test_reports,
-                attrgetter('test_group')):
-            groups.append({'tests': list(tests),
-                'report': group_reports[group_name]})
-
-        problem_score = None
-        max_problem_score = None
-        for group in groups:
-            group_score = group['report'].score
-            group_max_score = group['report'].max_score
-
-            if problem_score is None:
-                problem_score = group_score
-            elif group_score is not None:
-                problem_score += group_score
-
-            if max_problem_score is None:
-                max_problem_score = group_max_score
-            elif group_max_score is not None:
-                max_problem_score += group_max_score
-
-        resultsets.append(dict(
-            result=r,
-            score=problem_score,
-            max_score=max_problem_score,
-            compilation_report=compilation_report,
-            groups=groups,
-            code=source_file.read(),
-            codefile=source_file.file.name
-        ))
-        source_file.close()
-        if total_score is None:
-            total_score = problem_score
-        elif problem_score is not None:
-            total_score += problem_score
-    return {
-        'user': user,
-        'resultsets': resultsets,
-        'sum': total_score,
-    }
-
-
-def _serialize_reports(users, problem_instances, test_groups):
-    """Runs :meth:`serialize_report` for a number of users.
-
-       Returns a list of objects produced by serialize_report, sorted
-       by user's last name and first name.
-    """
-    data = []
-    for user in users.order_by('last_name', 'first_name', 'username'):
-        user_data = _serialize_report(user, problem_instances,
-                test_groups)
-        if user_data['resultsets']:
-            data.append(user_data)
-    return data
-
-
-def _report_text(request, template_file, report_form):
+def _report_params(request, report_form):
     round_key = report_form.cleaned_data['report_round']
     if round_key == CONTEST_REPORT_KEY:
         round = None
@@ -208,33 +102,55 @@ def _report_text(request, template_file, report_form):
     else:
         users = _users_in_contest(request, region)
 
-    # Generate report
-    testgroups = report_form.get_testgroups(request)
-    return _render_report(
-        request,
-        template_file,
-        title,
-        users,
-        testgroups.keys(),
-        testgroups
-    )
-
-
-def generate_pdfreport(request, report_form):
-    report = _report_text(request, 'oireports/pdfreport.tex', report_form)
-    filename = '%s-%s-%s.pdf' % (request.contest.id,
-            report_form.cleaned_data['report_round'],
-            report_form.cleaned_data['report_region'])
-
-    return generate_pdf(report, filename)
-
-
-def generate_xmlreport(request, report_form):
-    report = _report_text(request, 'oireports/xmlreport.xml', report_form)
-    filename = '%s-%s-%s.xml' % (request.contest.id,
-        report_form.cleaned_data['report_round'],
-        report_form.cleaned_data['report_region'])
-    return stream_file(ContentFile(report.encode('utf-8')), filename)
+    filename = '%s-%s-%s' % (request.contest.id, round_key, region_key)
+    return title, users, report_form.get_testgroups(request), filename
+
+
+def _report_text(request, template_file, title, users, testgroups):
+    rows = list(itertools.chain.from_iterable(
+            serialize_reports(users, testgroups.keys(), testgroups)))
+    return render_report(template_file, title, rows, request.timestamp)
+
+
+def generate_pdfreport(request, title, users, testgroups, filename):
+    report = _report_text(request, 'oireports/pdfreport.tex', title, users,
+                          testgroups)
+    return generate_pdf(report, filename + '.pdf')
+
+
+def generate_xmlreport(request, title, users, testgroups, filename):
+    report = _report_text(request, 'oireports/xmlreport.xml', title, users,
+                          testgroups)
+    return stream_file(ContentFile(report.encode('utf-8')),
+                       filename + '.xml')
+
+
+def queue_report(request, form_type, title, users, testgroups, filename):
+    """Queues generation of the report by
+       :func:`~oioioi.oireports.models.oireports_job`.
+    """
+    user_ids = list(users.values_list('id', flat=True))
+    report = GeneratedReport.objects.create(contest=request.contest,
+            creator=request.user, name=filename, users_total=len(user_ids))
+    oireports_job.delay(report.id, {
+        'form_type': form_type,
+        'title': title,
+        'timestamp': request.timestamp,
+        'user_ids': user_ids,
+        'test_groups': [(pi.id, groups)
+                        for pi, groups in testgroups.iteritems()],
+        'language': get_language(),
+    })
+    messages.success(request, _("The report was queued for generation. "
+                                "It will be available for download below."))
+    return redirect('oireports', contest_id=request.contest.id)
+
+
+@enforce_condition(contest_exists & is_contest_admin)
+def download_report_view(request, report_id):
+    report = get_object_or_404(GeneratedReport, contest=request.contest,
+                               id=report_id, state='SUCCESS')
+    return stream_file(report.file, name=report.name)
 
 
 @enforce_condition(contest_exists & is_contest_admin)
@@ -90,3 +90,8 @@ class PAScore(ScoreValue):
 
     def to_int(self):
         return self.points.to_int()
+
+    def to_sort_key(self):
+        # Ties are broken by the distribution, which is not a part of
+        # the key.
+        return self.points.to_sort_key()
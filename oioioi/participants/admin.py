@@ -14,7 +14,8 @@ from oioioi.contests.menu import contest_admin_menu_registry
 from oioioi.participants.forms import ParticipantForm, ExtendRoundForm, \
         RegionForm
 from oioioi.participants.models import Participant, OnsiteRegistration, Region
-from oioioi.contests.models import RoundTimeExtension
+from oioioi.contests.models import RoundTimeExtension, \
+        invalidate_contest_rounds, invalidate_visible_contests
 from oioioi.participants.utils import contest_has_participants, \
         is_contest_with_participants, has_participants_admin, \
         contest_is_onsite
@@ -93,11 +94,17 @@ class ParticipantAdmin(admin.ModelAdmin):
                 .formfield_for_foreignkey(db_field, request, **kwargs)
 
     def make_active(self, request, queryset):
+        user_ids = list(queryset.values_list('user_id', flat=True))
         queryset.update(status='ACTIVE')
+        for user_id in user_ids:
+            invalidate_visible_contests(user_id)
     make_active.short_description = _("Mark selected participants as active")
 
     def make_banned(self, request, queryset):
+        user_ids = list(queryset.values_list('user_id', flat=True))
         queryset.update(status='BANNED')
+        for user_id in user_ids:
+            invalidate_visible_contests(user_id)
     make_banned.short_description = _("Mark selected participants as banned")
 
     def extend_round(self, request, queryset):
@@ -122,6 +129,8 @@ class ParticipantAdmin(admin.ModelAdmin):
                         extra_time=extra_time) for user in users
                         if not existing_extensions.filter(user=user).exists()]
                 RoundTimeExtension.objects.bulk_create(new_extensions)
+                if new_extensions:
+                    invalidate_contest_rounds(round.contest_id)
 
                 if existing_count:
                     if existing_count > 1:
@@ -15,7 +15,8 @@ from oioioi.base.utils import RegisteredSubclassesBase, ObjectWithMixins
 from oioioi.contests.models import Submission, SubmissionReport, \
         UserResultForProblem, FailureReport
 from oioioi.contests.scores import IntegerScore
-from oioioi.evalmgr.tasks import create_environ, delay_environ
+from oioioi.evalmgr.tasks import create_environ, delay_environ, \
+        delay_environs
 from oioioi.problems.utils import can_admin_problem
 from django.utils.translation import ugettext_lazy as _
 
@@ -131,6 +132,32 @@ class ProblemController(RegisteredSubclassesBase, ObjectWithMixins):
         return ['C', 'C++', 'Pascal']
 
     def judge(self, submission, extra_args=None, is_rejudge=False):
+        environ = self._prepare_judge_environ(submission, extra_args,
+                                              is_rejudge)
+        evalmgr_extra_args = environ.get('evalmgr_extra_args', {})
+        delay_environ(environ, **evalmgr_extra_args)
+
+    def judge_many(self, submissions, extra_args=None, is_rejudge=False):
+        """Judges many submissions at once, like :meth:`judge`.
+
+           The submissions are queued in batches, which are evaluated by
+           single evalmgr tasks (see
+           :func:`oioioi.evalmgr.tasks.delay_environs`), so this should be
+           preferred over calling :meth:`judge` in a loop, for example when
+           rejudging all submissions to a problem.
+        """
+        batches = {}
+        for submission in submissions:
+            environ = self._prepare_judge_environ(submission, extra_args,
+                                                  is_rejudge)
+            evalmgr_extra_args = environ.get('evalmgr_extra_args', {})
+            key = json.dumps(evalmgr_extra_args, sort_keys=True)
+            batches.setdefault(key, (evalmgr_extra_args, []))[1] \
+                    .append(environ)
+        for evalmgr_extra_args, environs in batches.itervalues():
+            delay_environs(environs, **evalmgr_extra_args)
+
+    def _prepare_judge_environ(self, submission, extra_args, is_rejudge):
         environ = create_environ()
         environ['extra_args'] = extra_args or {}
         environ['is_rejudge'] = is_rejudge
@@ -171,10 +198,9 @@ class ProblemController(RegisteredSubclassesBase, ObjectWithMixins):
         environ['recipe'].insert(0, ('wait_for_submission_in_db',
                 'oioioi.contests.handlers.wait_for_submission_in_db'))
 
-        evalmgr_extra_args = environ.get('evalmgr_extra_args', {})
         logger.debug("Judging submission #%d with environ:\n %s",
                 submission.id, pprint.pformat(environ, indent=4))
-        delay_environ(environ, **evalmgr_extra_args)
+        return environ
 
     def mixins_for_admin(self):
         """Returns an iterable of mixins to add to the default
@@ -271,14 +297,18 @@ class ProblemController(RegisteredSubclassesBase, ObjectWithMixins):
            * :class:`~oioioi.contests.models.UserResultForProblem`
 
            and then calls proper methods of ProblemController to update them.
+
+           Returns a pair of the previous and the new score of the result.
         """
 
         with transaction.atomic():
             result, created = UserResultForProblem.objects \
                 .select_for_update() \
                 .get_or_create(user=user, problem_instance=problem_instance)
+            old_score = result.score
             problem_instance.controller.update_user_result_for_problem(result)
             result.save()
+        return old_score, result.score
 
     def validate_submission_form(self, request, problem_instance, form,
             cleaned_data):
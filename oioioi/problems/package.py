@@ -106,7 +106,7 @@ class ProblemPackageBackend(RegisteredSubclassesBase, ObjectWithMixins):
             self.unpack(env)
             problem = Problem.objects.get(id=env['problem_id'])
             pp.problem = problem
-            pp.save()
+            pp.save(update_fields=['problem'])
         return problem
 
     def pack(self, problem):
@@ -41,7 +41,8 @@ def unpackmgr_job(env):
             problem = Problem.objects.get(id=env['problem_id'])
             package.celery_task_id = unpackmgr_job.request.id
             package.problem = problem
-            package.save()
+            # Don't overwrite the fields (e.g. info) set by the backend.
+            package.save(update_fields=['celery_task_id', 'problem'])
 
             for h in env['post_upload_handlers']:
                 handler = import_string(h)
@@ -17,10 +17,10 @@ from oioioi.contests.models import Submission, SubmissionReport, \
         ScoreReport
 from oioioi.contests.handlers import _get_submission_or_skip
 from oioioi.programs.models import CompilationReport, TestReport, \
-        GroupReport, Test, UserOutGenStatus
+        GroupReport, Test, UserOutGenStatus, get_test_environs, \
+        make_test_environ
 from oioioi.filetracker.client import get_client
-from oioioi.filetracker.utils import django_to_filetracker_path, \
-        filetracker_to_django_file
+from oioioi.filetracker.utils import filetracker_to_django_file
 
 logger = logging.getLogger(__name__)
 
@@ -122,55 +122,39 @@ def collect_tests(env, **kwargs):
 
     env.setdefault('tests', {})
 
+    problem_instance = env['problem_instance_id']
+    all_tests = get_test_environs(problem_instance)
+    active_tests = [test_env for is_active, test_env in all_tests
+                    if is_active]
+
     if 'tests_subset' in env['extra_args']:
-        tests = Test.objects.in_bulk(env['extra_args']['tests_subset']) \
-                                                                    .values()
+        tests = [make_test_environ(test) for test in Test.objects.in_bulk(
+                    env['extra_args']['tests_subset']).values()]
     else:
-        tests = Test.objects.filter(
-            problem_instance__id=env['problem_instance_id'],
-            is_active=True)
+        tests = active_tests
 
-    problem_instance = env['problem_instance_id']
     if env['is_rejudge']:
         submission = env['submission_id']
         rejudge_type = env['extra_args'].setdefault('rejudge_type', 'FULL')
         tests_to_judge = env['extra_args'].setdefault('tests_to_judge', [])
-        test_reports = TestReport.objects.filter(
+        tests_used = set(TestReport.objects.filter(
             submission_report__submission__id=submission,
             submission_report__status='ACTIVE')
-        tests_used = [report.test_name for report in test_reports]
+            .values_list('test_name', flat=True))
         if rejudge_type == 'NEW':
-            tests_to_judge = [t.name for t in
-                              Test.objects.filter(
-                                  problem_instance__id=problem_instance,
-                                  is_active=True)
-                              .exclude(name__in=tests_used)]
+            tests_to_judge = [t['name'] for t in active_tests
+                              if t['name'] not in tests_used]
         elif rejudge_type == 'JUDGED':
-            tests = Test.objects.filter(
-                problem_instance__id=problem_instance,
-                name__in=tests_used)
+            tests = [test_env for _is_active, test_env in all_tests
+                     if test_env['name'] in tests_used]
             tests_to_judge = [t for t in tests_to_judge if t in tests_used]
         elif rejudge_type == 'FULL':
-            tests_to_judge = [t.name for t in tests]
+            tests_to_judge = [t['name'] for t in tests]
     else:
-        tests_to_judge = [t.name for t in tests]
-
-    for test in tests:
-        test_env = {}
-        test_env['id'] = test.id
-        test_env['name'] = test.name
-        test_env['in_file'] = django_to_filetracker_path(test.input_file)
-        test_env['hint_file'] = django_to_filetracker_path(test.output_file)
-        test_env['kind'] = test.kind
-        test_env['group'] = test.group or test.name
-        test_env['max_score'] = test.max_score
-        test_env['order'] = test.order
-        if test.time_limit:
-            test_env['exec_time_limit'] = test.time_limit
-        if test.memory_limit:
-            test_env['exec_mem_limit'] = test.memory_limit
-        test_env['to_judge'] = False
-        env['tests'][test.name] = test_env
+        tests_to_judge = [t['name'] for t in tests]
+
+    for test_env in tests:
+        env['tests'][test_env['name']] = dict(test_env, to_judge=False)
 
     for test in tests_to_judge:
         env['tests'][test]['to_judge'] = True
@@ -272,6 +256,20 @@ def run_tests_end(env, **kwargs):
     return env
 
 
+def _get_active_test_reports(submission_id, test_names):
+    """Returns a dictionary mapping the given test names to test reports of
+       the active submission reports of the submission, loaded with a
+       single query.
+    """
+    if not test_names:
+        return {}
+    return dict((report.test_name, report) for report
+                in TestReport.objects.filter(
+                    submission_report__submission__id=submission_id,
+                    submission_report__status='ACTIVE',
+                    test_name__in=test_names))
+
+
 @_skip_on_compilation_error
 def grade_tests(env, **kwargs):
     """Grades tests using a scoring function.
@@ -295,6 +293,9 @@ def grade_tests(env, **kwargs):
     fun = import_string(env.get('test_scorer')
             or settings.DEFAULT_TEST_SCORER)
     tests = env['tests']
+    not_judged = [test_name for test_name in env['test_results']
+                  if not tests[test_name]['to_judge']]
+    old_reports = _get_active_test_reports(env['submission_id'], not_judged)
     for test_name, test_result in env['test_results'].iteritems():
         if tests[test_name]['to_judge']:
             score, max_score, status = fun(tests[test_name], test_result)
@@ -304,10 +305,12 @@ def grade_tests(env, **kwargs):
             test_result['max_score'] = max_score and max_score.serialize()
             test_result['status'] = status
         else:
-            report = TestReport.objects.get(
-                submission_report__submission__id=env['submission_id'],
-                submission_report__status='ACTIVE',
-                test_name=test_name)
+            try:
+                report = old_reports[test_name]
+            except KeyError:
+                raise TestReport.DoesNotExist("No active report for test "
+                        "%s of submission %s" % (test_name,
+                                                 env['submission_id']))
             score = report.score
             max_score = IntegerScore(report.test_max_score)
             status = report.status
@@ -485,6 +488,7 @@ def make_report(env, kind='NORMAL', save_scores=True, **kwargs):
         return env
     tests = env['tests']
     test_results = env.get('test_results', {})
+    test_reports = []
     for test_name, result in test_results.iteritems():
         test = tests[test_name]
         if 'report_id' in result:
@@ -506,10 +510,17 @@ def make_report(env, kind='NORMAL', save_scores=True, **kwargs):
         if env.get('save_outputs', False):
             test_report.output_file = filetracker_to_django_file(
                                                             result['out_file'])
-        test_report.save()
-        result['report_id'] = test_report.id
+        test_reports.append(test_report)
+    if test_reports:
+        TestReport.objects.bulk_create(test_reports)
+        report_ids = TestReport.objects \
+                .filter(submission_report=submission_report) \
+                .values_list('test_name', 'id')
+        for test_name, report_id in report_ids:
+            test_results[test_name]['report_id'] = report_id
 
     group_results = env.get('group_results', {})
+    group_reports = []
     for group_name, group_result in group_results.iteritems():
         if 'report_id' in group_result:
             continue
@@ -519,8 +530,14 @@ def make_report(env, kind='NORMAL', save_scores=True, **kwargs):
         group_report.max_score = \
                 group_result['max_score'] if save_scores else None
         group_report.status = group_result['status']
-        group_report.save()
-        group_result['result_id'] = group_report.id
+        group_reports.append(group_report)
+    if group_reports:
+        GroupReport.objects.bulk_create(group_reports)
+        result_ids = GroupReport.objects \
+                .filter(submission_report=submission_report) \
+                .values_list('group', 'id')
+        for group_name, result_id in result_ids:
+            group_results[group_name]['result_id'] = result_id
 
     if kind == 'INITIAL':
         if submission.user is not None and not env.get('is_rejudge', False):
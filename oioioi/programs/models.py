@@ -1,10 +1,13 @@
+from uuid import uuid4
+
 from nose.tools import nottest
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
 from django.utils.translation import ugettext_lazy as _
 from django.dispatch import receiver
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from oioioi.base.fields import EnumRegistry, EnumField
 from oioioi.problems.models import Problem, make_problem_filename
 from oioioi.filetracker.fields import FileField
@@ -12,6 +15,7 @@ from oioioi.contests.models import Submission, SubmissionReport, \
         submission_statuses, submission_report_kinds, ProblemInstance, \
         submission_kinds
 from oioioi.contests.fields import ScoreField
+from oioioi.filetracker.utils import django_to_filetracker_path
 from oioioi.programs.problem_instance_utils import get_language_by_extension
 
 import os.path
@@ -68,6 +72,83 @@ class Test(models.Model):
         unique_together = ('problem_instance', 'name')
 
 
+def _tests_cache_version_key(problem_instance_id):
+    return 'programs/tests_version/%d' % problem_instance_id
+
+
+def _tests_cache_key(problem_instance_id, version):
+    return 'programs/tests/%d/%s' % (problem_instance_id, version)
+
+
+def make_test_environ(test):
+    """Converts the test to an evaluation environment of a single test,
+       as used in ``environ['tests']``.
+    """
+    test_env = {}
+    test_env['id'] = test.id
+    test_env['name'] = test.name
+    test_env['in_file'] = django_to_filetracker_path(test.input_file)
+    test_env['hint_file'] = django_to_filetracker_path(test.output_file)
+    test_env['kind'] = test.kind
+    test_env['group'] = test.group or test.name
+    test_env['max_score'] = test.max_score
+    test_env['order'] = test.order
+    if test.time_limit:
+        test_env['exec_time_limit'] = test.time_limit
+    if test.memory_limit:
+        test_env['exec_mem_limit'] = test.memory_limit
+    return test_env
+
+
+@nottest
+def get_test_environs(problem_instance_id):
+    """Returns a list of ``(is_active, test_env)`` pairs for all the tests
+       of the problem instance, where ``test_env`` is the result of
+       :func:`make_test_environ`.
+
+       The list is cached and the cache is invalidated whenever a test
+       of the problem instance changes (see
+       :func:`invalidate_tests_cache`). The returned environments must not
+       be modified.
+    """
+    version_key = _tests_cache_version_key(problem_instance_id)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, uuid4().hex, None)
+        version = cache.get(version_key)
+    key = _tests_cache_key(problem_instance_id, version)
+    result = cache.get(key)
+    if result is None:
+        result = [(test.is_active, make_test_environ(test))
+                  for test in Test.objects
+                        .filter(problem_instance__id=problem_instance_id)]
+        cache.set(key, result, settings.TESTS_CACHE_TIMEOUT)
+    return result
+
+
+@nottest
+def invalidate_tests_cache(problem_instance_id):
+    """Invalidates the cache of :func:`get_test_environs`.
+
+       Must be called after changing tests in a way which doesn't send
+       the ``post_save`` or ``post_delete`` signals of :class:`Test`,
+       e.g. with ``QuerySet.update``.
+    """
+    def bump_version():
+        cache.set(_tests_cache_version_key(problem_instance_id),
+                  uuid4().hex, None)
+    bump_version()
+    # The cache may have been filled again with the old data before
+    # the transaction was committed.
+    transaction.on_commit(bump_version)
+
+
+@receiver(post_save, sender=Test)
+@receiver(post_delete, sender=Test)
+def _invalidate_tests_cache_on_test_change(sender, instance, **kwargs):
+    invalidate_tests_cache(instance.problem_instance_id)
+
+
 class OutputChecker(models.Model):
     problem = models.OneToOneField(Problem)
     exe_file = FileField(upload_to=make_problem_filename,
@@ -5,7 +5,9 @@ from datetime import datetime
 import re
 
 from django.conf import settings
+from django.db import connection
 from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import utc
 from django.utils.html import strip_tags, escape
 from django.utils.http import urlencode
@@ -18,17 +20,19 @@ from oioioi.base.tests import TestCase
 from oioioi.filetracker.tests import TestStreamingMixin
 from oioioi.programs import utils
 from oioioi.base.tests import check_not_accessible, fake_time
-from oioioi.contests.models import Submission, ProblemInstance, Contest, Round
+from oioioi.contests.models import Submission, ProblemInstance, Contest, \
+        Round, SubmissionReport
 from oioioi.contests.tests import PrivateRegistrationController, \
         SubmitFileMixin
 from oioioi.programs.models import Test, ModelSolution, ProgramSubmission, \
-        TestReport, ReportActionsConfig
+        TestReport, ReportActionsConfig, get_test_environs, \
+        invalidate_tests_cache
 from oioioi.programs.controllers import ProgrammingContestController
 from oioioi.sinolpack.tests import get_test_filename
 from oioioi.contests.scores import IntegerScore
 from oioioi.base.utils import memoized_property
 from oioioi.base.notification import NotificationHandler
-from oioioi.programs.handlers import make_report
+from oioioi.programs.handlers import make_report, grade_tests, grade_groups
 from oioioi.programs.views import _testreports_to_generate_outs
 
 
@@ -681,6 +685,40 @@ class TestNotifications(TestCase):
         NotificationHandler.send_notification = send_notification_backup
 
 
+class TestReportsQueries(TestCase):
+    fixtures = ['test_users', 'test_contest', 'test_full_package',
+            'test_problem_instance', 'test_submission']
+
+    def _count_queries(self, num_tests):
+        submission_report = SubmissionReport.objects.get(id=2)
+        TestReport.objects.filter(submission_report=submission_report) \
+                .delete()
+        tests = {}
+        for i in xrange(num_tests):
+            name = 'bench%d' % i
+            TestReport.objects.create(submission_report=submission_report,
+                    test_name=name, test_group=name, test_max_score=10,
+                    score=IntegerScore(10), status='OK', time_used=10)
+            tests[name] = {'name': name, 'group': name, 'kind': 'NORMAL',
+                           'max_score': 10, 'to_judge': False}
+        env = {'submission_id': 1, 'tests': tests,
+               'test_results': dict((name, {}) for name in tests),
+               'compilation_result': 'OK', 'compilation_message': '',
+               'status': 'OK', 'score': None, 'max_score': None}
+
+        with CaptureQueriesContext(connection) as queries:
+            env = grade_groups(grade_tests(env))
+            make_report(env)
+        self.assertEqual(len(env['test_results']), num_tests)
+        for result in env['test_results'].itervalues():
+            self.assertEqual(result['status'], 'OK')
+            self.assertIn('report_id', result)
+        return len(queries)
+
+    def test_queries_independent_of_tests_count(self):
+        self.assertEqual(self._count_queries(10), self._count_queries(150))
+
+
 class TestScorers(TestCase):
     t_results_ok = (
         ({'exec_time_limit': 100, 'max_score': 100},
@@ -1076,6 +1114,34 @@ class TestRejudge(TestCase, SubmitFileMixin):
                            ['1a', '2'])
 
 
+class TestTestsCache(TestCase):
+    fixtures = ['test_contest', 'test_full_package', 'test_problem_instance']
+
+    def test_tests_cache(self):
+        pi = ProblemInstance.objects.get(id=1)
+        tests = get_test_environs(pi.id)
+        self.assertEqual(len(tests), pi.test_set.count())
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_test_environs(pi.id), tests)
+
+        test = pi.test_set.get(name='0')
+        test.time_limit = 1234
+        test.save()
+        test_envs = dict((test_env['name'], test_env)
+                         for _is_active, test_env in get_test_environs(pi.id))
+        self.assertEqual(test_envs['0']['exec_time_limit'], 1234)
+
+        pi.test_set.filter(name='0').update(is_active=False)
+        invalidate_tests_cache(pi.id)
+        active = dict((test_env['name'], is_active)
+                      for is_active, test_env in get_test_environs(pi.id))
+        self.assertFalse(active['0'])
+
+        pi.test_set.get(name='0').delete()
+        self.assertEqual(len(get_test_environs(pi.id)), len(tests) - 1)
+
+
 class TestLimitsLimits(TestCase):
     fixtures = ['test_users', 'test_contest', 'test_full_package',
                 'test_problem_instance', 'test_submission']
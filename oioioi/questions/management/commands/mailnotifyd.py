@@ -1,23 +1,26 @@
 import logging
 import time
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
 
 from django.db.models import Q
 from django.conf import settings
-from django.core.mail import EmailMessage
+from django.contrib.auth.models import User
+from django.core.mail import EmailMessage, get_connection
 from django.core.management.base import BaseCommand
 from django.template.loader import render_to_string
 from django.test import RequestFactory
 from django.utils.timezone import utc
 from django.utils.translation import ugettext as _
 
+from oioioi.contests.models import ContestPermission, RoundTimeExtension
 from oioioi.questions.models import Message, QuestionSubscription
 from oioioi.questions.views import visible_messages
 
 logger = logging.getLogger(__name__)
 
 
-def generate_notification(msg, user, mail):
+def _render_notification(msg, user):
     m_id = msg.top_reference.id \
         if msg.top_reference and allowed_to_see(msg.top_reference, user) \
         else msg.id
@@ -36,10 +39,95 @@ def generate_notification(msg, user, mail):
         'questions/reply_notification_body.txt',
         context
     )
+    return subject, body
+
 
+def generate_notification(msg, user, mail):
+    subject, body = _render_notification(msg, user)
     return EmailMessage(subject=subject, body=body, to=[mail])
 
 
+def _send_chunk(emails):
+    connection = get_connection(fail_silently=True)
+    connection.send_messages(emails)
+
+
+def send_notifications(emails):
+    """Sends the e-mails in chunks of ``MAILNOTIFYD_CHUNK_SIZE``, each over
+       a single SMTP connection. Up to ``MAILNOTIFYD_WORKERS`` chunks are
+       sent in parallel.
+    """
+    chunk_size = settings.MAILNOTIFYD_CHUNK_SIZE
+    chunks = [emails[i:i + chunk_size]
+              for i in xrange(0, len(emails), chunk_size)]
+    workers = min(settings.MAILNOTIFYD_WORKERS, len(chunks))
+    if workers <= 1:
+        for chunk in chunks:
+            _send_chunk(chunk)
+        return
+    pool = ThreadPool(workers)
+    try:
+        pool.map(_send_chunk, chunks)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _individual_user_ids(msg):
+    """Returns ids of users who may see ``msg`` differently than a regular
+       participant of the contest: contest admins and observers (including
+       superusers and the contest's teachers), users with round time
+       extensions and the author of the question.
+    """
+    user_ids = set(ContestPermission.objects.filter(contest=msg.contest)
+                   .values_list('user_id', flat=True))
+    user_ids.update(User.objects.filter(is_superuser=True)
+                    .values_list('id', flat=True))
+    if 'oioioi.teachers' in settings.INSTALLED_APPS:
+        # Teachers are contest admins (see oioioi.teachers.auth).
+        from oioioi.teachers.models import ContestTeacher
+        user_ids.update(ContestTeacher.objects
+                        .filter(contest=msg.contest, teacher__is_active=True)
+                        .values_list('teacher__user_id', flat=True))
+    user_ids.update(RoundTimeExtension.objects
+                    .filter(round__contest=msg.contest)
+                    .values_list('user_id', flat=True))
+    if msg.top_reference:
+        user_ids.add(msg.top_reference.author_id)
+    return user_ids
+
+
+def notify_public(msg, users):
+    """Notifies the users about a public message.
+
+       Visibility of the message and the notification are computed once for
+       all regular participants and separately only for the users returned
+       by :func:`_individual_user_ids`.
+    """
+    individual_ids = _individual_user_ids(msg)
+    shared_notification = None
+    emails = []
+    for user in users:
+        if user.id in individual_ids:
+            if allowed_to_see(msg, user):
+                emails.append(generate_notification(msg, user, user.email))
+            else:
+                log_omitted(msg, user)
+            continue
+        if shared_notification is None:
+            if allowed_to_see(msg, user):
+                shared_notification = _render_notification(msg, user)
+            else:
+                shared_notification = False
+        if shared_notification:
+            subject, body = shared_notification
+            emails.append(EmailMessage(subject=subject, body=body,
+                                       to=[user.email]))
+        else:
+            log_omitted(msg, user)
+    send_notifications(emails)
+
+
 def mailnotify(instance):
     # We should only pass messages with unsent mail here, published in the past
     # We check the visible_messages just to be fail safe.
@@ -55,15 +143,12 @@ def mailnotify(instance):
 
     if instance.kind == 'PUBLIC':
         # There may be users without an e-mail, filter them out
-        mails = [
-            (sub.user, sub.user.email)
-            for sub in subscriptions
+        users = [
+            sub.user
+            for sub in subscriptions.select_related('user').order_by('id')
             if sub.user.email
         ]
-
-        # if there are any users with e-mails
-        for (user, mail) in mails:
-            try_sending(instance, user, mail)
+        notify_public(instance, users)
 
     elif instance.kind == 'PRIVATE':
         author = instance.top_reference.author
@@ -81,12 +166,16 @@ def try_sending(msg, user, mail):
         email = generate_notification(msg, user, mail)
         email.send(fail_silently=True)
     else:
-        # For some reason some message from the past is not
-        # visible for a user. We omit this, but make sure to
-        # mark this in the logs.
-        logmsg = ("Omitting message {} to {}, since"
-            "they are not allowed to see it").format(msg, user)
-        logger.info(logmsg)
+        log_omitted(msg, user)
+
+
+def log_omitted(msg, user):
+    # For some reason some message from the past is not
+    # visible for a user. We omit this, but make sure to
+    # mark this in the logs.
+    logmsg = ("Omitting message {} to {}, since"
+        "they are not allowed to see it").format(msg, user)
+    logger.info(logmsg)
 
 
 def allowed_to_see(msg, user):
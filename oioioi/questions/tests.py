@@ -3,6 +3,7 @@ import mock
 from copy import deepcopy
 
 from django.core import mail
+from django.core.mail import get_connection
 from django.core.urlresolvers import reverse
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -11,13 +12,15 @@ from django.test import RequestFactory
 from oioioi.base.tests import TestCase, check_not_accessible, fake_time
 from oioioi.contests.models import Contest, ProblemInstance
 from oioioi.programs.controllers import ProgrammingContestController
-from oioioi.questions.models import Message, ReplyTemplate
+from oioioi.questions.models import Message, ReplyTemplate, \
+    QuestionSubscription
 from oioioi.questions.forms import FilterMessageForm
 from oioioi.questions.utils import unanswered_questions
 from oioioi.base.notification import NotificationHandler
 from .views import visible_messages
 from oioioi.questions.management.commands.mailnotifyd import \
-    mailnotify, candidate_messages
+    mailnotify, candidate_messages, _individual_user_ids
+from oioioi.teachers.models import Teacher, ContestTeacher
 
 from datetime import datetime
 
@@ -567,6 +570,43 @@ class TestQuestions(TestCase):
         # the non-author should receive the link to the answer
         assertMessageId(pubmsg.id, mm.body)
 
+    def test_mailnotify_many_subscribers(self):
+        contest = Contest.objects.get()
+        for username in ['test_user3', 'test_admin']:
+            QuestionSubscription.objects.create(contest=contest,
+                    user=User.objects.get(username=username))
+        pubmsg = Message.objects.get(pk=4)
+
+        mailnotifyd_module = 'oioioi.questions.management.commands.mailnotifyd'
+        with mock.patch(mailnotifyd_module + '.visible_messages',
+                        wraps=visible_messages) as visible_mock, \
+                mock.patch(mailnotifyd_module + '.get_connection',
+                           wraps=get_connection) as connection_mock:
+            mailnotify(pubmsg)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox),
+                         ['test_admin@example.com', 'test_user2@example.com',
+                          'test_user3@example.com', 'test_user@example.com'])
+        # The author of the question and the admin are checked separately,
+        # the other users share a single check of the message and the top
+        # reference.
+        self.assertEqual(visible_mock.call_count, 6)
+        self.assertEqual(connection_mock.call_count, 1)
+        user2_body = [m.body for m in mail.outbox
+                      if m.to[0] == 'test_user2@example.com'][0]
+        user3_body = [m.body for m in mail.outbox
+                      if m.to[0] == 'test_user3@example.com'][0]
+        self.assertEqual(user2_body, user3_body)
+
+    def test_mailnotify_teacher_checked_individually(self):
+        contest = Contest.objects.get()
+        user = User.objects.get(username='test_user3')
+        pubmsg = Message.objects.get(pk=4)
+        self.assertNotIn(user.id, _individual_user_ids(pubmsg))
+        teacher = Teacher.objects.create(user=user, is_active=True,
+                                         school='School')
+        ContestTeacher.objects.create(contest=contest, teacher=teacher)
+        self.assertIn(user.id, _individual_user_ids(pubmsg))
+
     def test_unseen_mail_notifications(self):
         """Test whether the notifications are correctly *not* sent for messages
         which are not visible to the user"""
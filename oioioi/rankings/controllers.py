@@ -1,9 +1,11 @@
+from bisect import bisect_left
 from collections import defaultdict
-from operator import itemgetter
+from operator import attrgetter, itemgetter
 import unicodecsv
 
 from django.conf import settings
 from django.core.urlresolvers import reverse
+from django.db.models import Q
 from django.http import HttpResponse
 from django.template import RequestContext
 from django.template.loader import render_to_string
@@ -18,15 +20,33 @@ from oioioi.base.utils import RegisteredSubclassesBase, ObjectWithMixins
 from oioioi.contests.models import ProblemInstance, UserResultForProblem
 from oioioi.contests.controllers import ContestController, \
         ContestControllerContext
+from oioioi.contests.scores import ScoreValue
 from oioioi.contests.utils import is_contest_admin, is_contest_observer
 from oioioi.filetracker.utils import make_content_disposition_header
 
-from oioioi.rankings.models import Ranking, RankingPage
+from oioioi.rankings.models import Ranking, RankingPage, RankingPosition
+from oioioi.rankings.serialization import encode_ranking
 
 
 CONTEST_RANKING_KEY = 'c'
 
 
+class _Reversed(object):
+    """Wraps a value reversing the order of comparisons."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __ne__(self, other):
+        return self.value != other.value
+
+    def __lt__(self, other):
+        return self.value > other.value
+
+
 class RankingMixinForContestController(object):
     """ContestController mixin that sets up rankings app.
     """
@@ -38,7 +58,8 @@ class RankingMixinForContestController(object):
     def update_user_results(self, user, problem_instance, *args, **kwargs):
         super(RankingMixinForContestController, self) \
             .update_user_results(user, problem_instance, *args, **kwargs)
-        Ranking.invalidate_contest(problem_instance.round.contest)
+        Ranking.invalidate_results(problem_instance.round.contest, user,
+                                   problem_instance)
 
 ContestController.mix_in(RankingMixinForContestController)
 
@@ -111,6 +132,17 @@ class RankingController(RegisteredSubclassesBase, ObjectWithMixins):
         """
         raise NotImplementedError
 
+    def get_user_hints(self, request, partial_key, substr):
+        """Returns a list of hints for users in the ranking matching
+           ``substr``, formatted like
+           :func:`~oioioi.base.utils.user_selection.get_user_hints_view`
+           does.
+
+           If the hints cannot be determined from the ranking (for example
+           it isn't generated yet), returns ``None``.
+        """
+        return None
+
     def get_rendered_ranking(self, request, partial_key):
         """Retrieves ranking generated by rankingsd.
 
@@ -169,6 +201,33 @@ class RankingController(RegisteredSubclassesBase, ObjectWithMixins):
             pages.append(self._render_ranking_page(key, data, i))
         return data, pages
 
+    def update_ranking(self, key, stored, changes):
+        """Updates previously stored ranking after results of some users
+           have changed and renders the pages which are affected.
+
+           ``stored`` is the
+           :class:`~oioioi.rankings.serialization.StoredRanking` saved after
+           the previous recalculation and ``changes`` is a set of
+           ``(user_id, problem_instance_id)`` pairs whose results have
+           changed since then.
+
+           Returns a tuple containing the new encoded ranking, a dictionary
+           mapping numbers of changed pages to their new html code and the
+           total number of pages. If the ranking cannot be updated
+           incrementally, returns ``None`` and the ranking will be built
+           from scratch using :meth:`build_ranking`.
+
+           The default implementation always returns ``None``.
+        """
+        return None
+
+    def encode_ranking(self, data):
+        """Converts data returned by :meth:`serialize_ranking` to the compact
+           format stored by rankingsd (see
+           :mod:`oioioi.rankings.serialization`).
+        """
+        raise NotImplementedError
+
     def _fake_request(self, page):
         """Creates a fake request used to render ranking.
 
@@ -239,21 +298,37 @@ class DefaultRankingController(RankingController):
         key = self.get_full_key(request, partial_key)
         if getattr(settings, 'MOCK_RANKINGSD', False):
             rows = self.serialize_ranking(key)['rows']
-        else:
-            try:
-                ranking = Ranking.objects.get(contest=self.contest, key=key)
-            except Ranking.DoesNotExist:
-                return None
-            serialized = ranking.serialized or {}
-            rows = serialized.get('rows')
-            if not rows:  # Ranking isn't ready yet
-                return None
-
-        for i, row in enumerate(rows):
-            if row['user'] == user:
-                return i + 1
-        # User not found
-        return None
+            for i, row in enumerate(rows):
+                if row['user'] == user:
+                    return i + 1
+            # User not found
+            return None
+
+        try:
+            return RankingPosition.objects.get(ranking__contest=self.contest,
+                    ranking__key=key, user=user).position
+        except RankingPosition.DoesNotExist:
+            # User not found or the ranking isn't ready yet
+            return None
+
+    def get_user_hints(self, request, partial_key, substr):
+        num_hints = getattr(settings, 'NUM_HINTS', 10)
+        key = self.get_full_key(request, partial_key)
+        if getattr(settings, 'MOCK_RANKINGSD', False) or not \
+                Ranking.objects.filter(contest=self.contest, key=key,
+                                       serialized_data__isnull=False) \
+                .exists():
+            return None
+        prefix = ' '.join(substr.split()).lower()
+        positions = RankingPosition.objects \
+                .filter(ranking__contest=self.contest, ranking__key=key) \
+                .filter(Q(username_key__startswith=prefix)
+                        | Q(name_key__startswith=prefix)
+                        | Q(last_name_key__startswith=prefix)) \
+                .order_by('position').select_related('user')
+        return ['%s (%s %s)' % (p.user.username, p.user.first_name,
+                                p.user.last_name)
+                for p in positions[:num_hints]]
 
     def _render_ranking_page(self, key, data, page):
         request = self._fake_request(page)
@@ -310,7 +385,11 @@ class DefaultRankingController(RankingController):
         users = users.filter(id__in=by_user.keys())
         data = []
         all_rounds_trial = all(r.is_trial for r in rounds)
-        for user in users.order_by('last_name', 'first_name', 'username'):
+        # Users are sorted in Python rather than by the database, so that
+        # the order of ties is the same as in :meth:`update_ranking`,
+        # regardless of the database collation.
+        for user in sorted(users, key=attrgetter('last_name', 'first_name',
+                                                 'username')):
             by_user_row = by_user[user.id]
             user_results = []
             user_data = {
@@ -360,6 +439,25 @@ class DefaultRankingController(RankingController):
                 prev_sum = extractor(row)
             row['place'] = place
 
+    def _assign_places_from(self, data, extractor, start):
+        """Assigns places to the rows of ``data`` starting from ``start``.
+
+           Unlike :meth:`_assign_places`, ``data`` must already be sorted
+           and the places of rows before ``start`` must be correct.
+        """
+        if start > 0:
+            prev_sum = extractor(data[start - 1])
+            place = data[start - 1]['place']
+        else:
+            prev_sum = None
+            place = None
+        for i in xrange(start, len(data)):
+            row = data[i]
+            if extractor(row) != prev_sum:
+                place = i + 1
+                prev_sum = extractor(row)
+            row['place'] = place
+
     def _is_problem_statement_visible(self, key, pi, timestamp):
         if self.is_admin_key(key):
             return True
@@ -373,22 +471,135 @@ class DefaultRankingController(RankingController):
         return [(pi, self._is_problem_statement_visible(key, pi, now))
                 for pi in pis]
 
-    def serialize_ranking(self, key):
+    def _get_ranking_scope(self, key):
+        """Returns a tuple of rounds, problem instances and a queryset of
+           users which should be included in the ranking.
+        """
         partial_key = self.get_partial_key(key)
         rounds = list(self._rounds_for_key(key))
         pis = list(self._filter_pis_for_ranking(partial_key,
             ProblemInstance.objects.filter(round__in=rounds)).
             select_related('problem').prefetch_related('round'))
         users = self.filter_users_for_ranking(key, User.objects.all())
-        results = UserResultForProblem.objects \
+        return rounds, pis, users
+
+    def _get_results(self, pis, users):
+        return UserResultForProblem.objects \
                 .filter(problem_instance__in=pis, user__in=users) \
                 .prefetch_related('problem_instance__round') \
                 .select_related('submission_report', 'problem_instance',
                         'problem_instance__contest')
 
+    def serialize_ranking(self, key):
+        rounds, pis, users = self._get_ranking_scope(key)
+        results = self._get_results(pis, users)
+
         data = self._get_users_results(pis, results, rounds, users)
         self._assign_places(data, itemgetter('sum'))
         return {'rows': data,
                 'problem_instances': self._get_pis_with_visibility(key, pis),
                 'participants_on_page': getattr(settings,
                     'PARTICIPANTS_ON_PAGE', 100)}
+
+    def _encode_row(self, row):
+        """Converts a row of serialized data to a JSON-serializable
+           dictionary, which is stored by rankingsd.
+        """
+        user = row['user']
+        return {
+            'user_id': user.id,
+            'username': user.username,
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'place': row.get('place'),
+            'sum': row['sum'].serialize(),
+            'results': [r.score.serialize()
+                        if r and r.score is not None else None
+                        for r in row['results']],
+        }
+
+    def encode_ranking(self, data):
+        return encode_ranking([self._encode_row(row) for row in data['rows']],
+                [(pi.id, visible)
+                 for pi, visible in data['problem_instances']],
+                data['participants_on_page'])
+
+    def _row_sort_key(self, row):
+        """Returns a key ordering encoded rows the same way as
+           :meth:`_get_users_results` followed by :meth:`_assign_places`
+           does, i.e. by descending sum and then by user's name.
+        """
+        return (_Reversed(ScoreValue.deserialize(row['sum'])),
+                row['last_name'], row['first_name'], row['username'])
+
+    def _page_layouts(self, rows, on_page):
+        """Returns a list of ``(user_id, place)`` sequences, one for every
+           page of the ranking.
+        """
+        layout = [(row['user_id'], row['place']) for row in rows]
+        return [layout[i:i + on_page]
+                for i in xrange(0, max(len(layout), 1), on_page)]
+
+    def update_ranking(self, key, stored, changes):
+        rounds, pis, users = self._get_ranking_scope(key)
+        pis_with_visibility = self._get_pis_with_visibility(key, pis)
+        if [(pi.id, visible) for pi, visible in pis_with_visibility] != \
+                stored.problem_instances:
+            # The columns of the ranking have changed.
+            return None
+
+        changed_user_ids = set(user_id for user_id, _pi_id in changes)
+        changed_users = users.filter(id__in=changed_user_ids)
+        results = self._get_results(pis, changed_users)
+        new_rows = self._get_users_results(pis, results, rounds,
+                                           changed_users)
+
+        old_rows = stored.rows()
+        on_page = stored.participants_on_page
+        old_layouts = self._page_layouts(old_rows, on_page)
+
+        rows = []
+        first_changed = len(old_rows)
+        for i, row in enumerate(old_rows):
+            if row['user_id'] in changed_user_ids:
+                first_changed = min(first_changed, i)
+            else:
+                rows.append(row)
+        sort_keys = [self._row_sort_key(row) for row in rows]
+        for new_row in new_rows:
+            row = self._encode_row(new_row)
+            sort_key = self._row_sort_key(row)
+            position = bisect_left(sort_keys, sort_key)
+            sort_keys.insert(position, sort_key)
+            rows.insert(position, row)
+            first_changed = min(first_changed, position)
+        self._assign_places_from(rows, itemgetter('sum'), first_changed)
+
+        new_layouts = self._page_layouts(rows, on_page)
+        changed_pages = [nr for nr, layout in enumerate(new_layouts, 1)
+                         if len(new_layouts) != len(old_layouts)
+                         or layout != old_layouts[nr - 1]
+                         or any(user_id in changed_user_ids
+                                for user_id, _place in layout)]
+
+        # Only the rows displayed on the changed pages are needed to render
+        # them, the remaining ones are left encoded.
+        page_user_ids = set(user_id for nr in changed_pages
+                            for user_id, _place in new_layouts[nr - 1])
+        page_users = users.filter(id__in=page_user_ids)
+        full_rows = dict((full_row['user'].id, full_row) for full_row in
+                self._get_users_results(pis,
+                    self._get_results(pis, page_users), rounds, page_users))
+        for row in rows:
+            if row['user_id'] in full_rows:
+                full_rows[row['user_id']]['place'] = row['place']
+        data = {
+            'rows': [full_rows.get(encoded['user_id'], encoded)
+                     for encoded in rows],
+            'problem_instances': pis_with_visibility,
+            'participants_on_page': on_page,
+        }
+        pages = dict((nr, self._render_ranking_page(key, data, nr))
+                     for nr in changed_pages)
+        return encode_ranking(rows, stored.problem_instances, on_page), \
+                pages, len(new_layouts)
@@ -1,5 +1,6 @@
 from django import forms
 from django.core.urlresolvers import reverse
+from django.utils.http import urlencode
 from django.utils.translation import ugettext_lazy as _
 from oioioi.base.utils.user_selection import UserSelectionField
 
@@ -7,9 +8,10 @@ from oioioi.base.utils.user_selection import UserSelectionField
 class FilterUsersInRankingForm(forms.Form):
     user = UserSelectionField(label=_("Username"), required=False)
 
-    def __init__(self, request, *args, **kwargs):
+    def __init__(self, request, key, *args, **kwargs):
         super(FilterUsersInRankingForm, self).__init__(*args, **kwargs)
         self.fields['user'].hints_url = reverse('get_users_in_ranking',
-            kwargs={'contest_id': request.contest.id})
+            kwargs={'contest_id': request.contest.id}) + '?' + \
+            urlencode({'key': key})
         self.fields['user'].widget.attrs['placeholder'] = \
                 _('Search for user...')
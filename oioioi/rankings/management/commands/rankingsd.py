@@ -1,10 +1,74 @@
+import logging
+import multiprocessing
 import time
+from optparse import make_option
+from Queue import Empty
 
 from django.core.management.base import BaseCommand
-from oioioi.rankings.models import choose_for_recalculation, recalculate
+from django.db import connections
+from oioioi.rankings.models import choose_for_recalculation, recalculate, \
+        recalculation_queue_stats
 from django.utils.translation import ugettext as _
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
+
+class RecalculationStats(object):
+    """Collects durations of finished recalculations and periodically
+       logs the throughput of rankingsd together with the state of the
+       recalculation queue.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.since = time.time()
+        self.count = 0
+        self.total_duration = 0.
+
+    def add(self, duration):
+        self.count += 1
+        self.total_duration += duration
+
+    def report_if_due(self):
+        elapsed = time.time() - self.since
+        if elapsed < settings.RANKINGSD_STATS_INTERVAL:
+            return
+        queue_length, queue_age = recalculation_queue_stats()
+        logger.info("rankingsd: %d recalculations in %.0fs "
+                    "(%.2f/s, %.2fs on average), %d rankings waiting, "
+                    "oldest invalidated %.0fs ago",
+                    self.count, elapsed, self.count / elapsed,
+                    self.total_duration / self.count if self.count else 0.,
+                    queue_length,
+                    queue_age.total_seconds() if queue_age else 0.)
+        self._reset()
+
+
+def recalculate_next(exclude_busy_contests=False):
+    """Recalculates a single ranking, if any needs it.
+
+       Returns the duration of the recalculation in seconds, or ``None``
+       if there was nothing to do.
+    """
+    recalc = choose_for_recalculation(exclude_busy_contests)
+    if recalc is None:
+        return None
+    start = time.time()
+    recalculate(recalc)
+    return time.time() - start
+
+
+def _worker_loop(durations):
+    while True:
+        duration = recalculate_next(exclude_busy_contests=True)
+        if duration is None:
+            time.sleep(settings.RANKINGSD_POLLING_INTERVAL)
+        else:
+            durations.put(duration)
+
 
 class Command(BaseCommand):
     help = _(
@@ -16,10 +80,56 @@ class Command(BaseCommand):
         "with cooldown."
     )
 
-    def handle(self, *args, **options):
+    option_list = BaseCommand.option_list + (
+        make_option('--workers',
+                    metavar='N',
+                    default=1,
+                    type=int,
+                    help=_("Number of worker processes recalculating "
+                           "rankings in parallel. Rankings of a single "
+                           "contest are recalculated by one worker at "
+                           "a time.")),
+        )
+
+    def _run_single(self):
+        stats = RecalculationStats()
         while True:
-            r = choose_for_recalculation()
-            if r:
-                recalculate(r)
-            else:
+            duration = recalculate_next()
+            if duration is None:
                 time.sleep(settings.RANKINGSD_POLLING_INTERVAL)
+            else:
+                stats.add(duration)
+            stats.report_if_due()
+
+    def _run_workers(self, num_workers):
+        stats = RecalculationStats()
+        durations = multiprocessing.Queue()
+        workers = []
+        while True:
+            for worker in workers:
+                if not worker.is_alive():
+                    logger.error("rankingsd: worker %d died with exit "
+                                 "code %s, restarting", worker.pid,
+                                 worker.exitcode)
+            workers = [worker for worker in workers if worker.is_alive()]
+            if len(workers) < num_workers:
+                # Database connections must not be shared with the workers.
+                connections.close_all()
+            while len(workers) < num_workers:
+                worker = multiprocessing.Process(target=_worker_loop,
+                                                 args=(durations,))
+                worker.daemon = True
+                worker.start()
+                workers.append(worker)
+            try:
+                stats.add(durations.get(
+                        timeout=settings.RANKINGSD_POLLING_INTERVAL))
+            except Empty:
+                pass
+            stats.report_if_due()
+
+    def handle(self, *args, **options):
+        if options['workers'] > 1:
+            self._run_workers(options['workers'])
+        else:
+            self._run_single()
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.conf import settings
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contests', '0009_filefield'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rankings', '0002_auto_20160618_1855'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rankingrecalc',
+            name='full',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='ranking',
+            name='needs_full_recalculation',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.CreateModel(
+            name='RankingChange',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('problem_instance', models.ForeignKey(to='contests.ProblemInstance')),
+                ('ranking', models.ForeignKey(related_name='changes', to='rankings.Ranking')),
+                ('recalc', models.ForeignKey(related_name='changes', to='rankings.RankingRecalc', null=True)),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rankings', '0003_incremental_recalculation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rankingrecalc',
+            name='start_date',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+def drop_pickled_rankings(apps, schema_editor):
+    # Rankings used to be stored as pickled Python objects. Instead of
+    # converting them, we let rankingsd rebuild them in the new format.
+    Ranking = apps.get_model('rankings', 'Ranking')
+    Ranking.objects.filter(serialized_data__isnull=False).update(
+        serialized_data=None, needs_recalculation=True,
+        needs_full_recalculation=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rankings', '0004_rankingrecalc_start_date'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_pickled_rankings,
+                             migrations.RunPython.noop),
+    ]
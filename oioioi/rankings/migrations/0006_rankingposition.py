@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.conf import settings
+
+
+def invalidate_rankings(apps, schema_editor):
+    # Positions are saved only when the ranking is recalculated.
+    Ranking = apps.get_model('rankings', 'Ranking')
+    Ranking.objects.update(needs_recalculation=True,
+                           needs_full_recalculation=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('rankings', '0005_drop_pickled_rankings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingPosition',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('position', models.IntegerField()),
+                ('place', models.IntegerField(null=True)),
+                ('page', models.IntegerField()),
+                ('username_key', models.CharField(max_length=255)),
+                ('name_key', models.CharField(max_length=255)),
+                ('last_name_key', models.CharField(max_length=255)),
+                ('ranking', models.ForeignKey(related_name='positions', to='rankings.Ranking')),
+                ('user', models.ForeignKey(to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='rankingposition',
+            unique_together=set([('ranking', 'user')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='rankingposition',
+            index_together=set([('ranking', 'username_key'), ('ranking', 'name_key'), ('ranking', 'last_name_key')]),
+        ),
+        migrations.RunPython(invalidate_rankings,
+                             migrations.RunPython.noop),
+    ]
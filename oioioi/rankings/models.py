@@ -1,15 +1,20 @@
-import pickle
 from datetime import timedelta
 
 from django.db import models, transaction
+from django.db.models import Count, Min, Q
 from django.utils import timezone
 from django.conf import settings
+from django.contrib.auth.models import User
 
-from oioioi.contests.models import Contest
+from oioioi.contests.models import Contest, ProblemInstance
+from oioioi.rankings.serialization import decode_ranking
 
 
 class RankingRecalc(models.Model):
-    pass
+    # whether the ranking has to be rebuilt from scratch, or only the
+    # changes attached to this recalculation need to be applied
+    full = models.BooleanField(default=True)
+    start_date = models.DateTimeField(default=timezone.now)
 
 
 class Ranking(models.Model):
@@ -29,6 +34,13 @@ class Ranking(models.Model):
        that something changed. Then the ranking is marked as invalid (not up
        to date) with the help of invalidate_* methods.
 
+       If the only thing that changed are results of some users for some
+       problem instances (see :meth:`invalidate_results`), the changed
+       (user, problem instance) pairs are recorded as :class:`RankingChange`
+       objects. In such a case rankingsd may update the ranking incrementally
+       (see :meth:`RankingController.update_ranking`) instead of rebuilding
+       it from scratch.
+
        We use _cooldown_ strategy of recalculation. Anytime we regenerate
        ranking we set a cooldown, based on how much time the previous
        recalculation took. If the ranking is invalidated during the cooldown
@@ -84,15 +96,18 @@ class Ranking(models.Model):
     # internal to ranking recalculation mechanism
     # use invalidate_* and is_up_to_date instead
     needs_recalculation = models.BooleanField(default=True)
+    needs_full_recalculation = models.BooleanField(default=True)
     cooldown_date = models.DateTimeField(auto_now_add=True)
     recalc_in_progress = models.ForeignKey(RankingRecalc, null=True)
 
     @property
     def serialized(self):
-        """Serialized data of this ranking"""
+        """Serialized data of this ranking, as a
+           :class:`~oioioi.rankings.serialization.StoredRanking`.
+        """
         if not self.serialized_data:
             return None
-        return pickle.loads(self.serialized_data)
+        return decode_ranking(self.serialized_data)
 
     def controller(self):
         """RankingController of the contest"""
@@ -102,6 +117,7 @@ class Ranking(models.Model):
     def invalidate_queryset(cls, qs):
         """Marks queryset of rankings as invalid"""
         qs.all().update(needs_recalculation=True,
+                        needs_full_recalculation=True,
                         invalidation_date=timezone.now())
 
     @classmethod
@@ -109,6 +125,23 @@ class Ranking(models.Model):
         """Marks all the keys in the constest as invalid"""
         return cls.invalidate_queryset(cls.objects.filter(contest=contest))
 
+    @classmethod
+    @transaction.atomic
+    def invalidate_results(cls, contest, user, problem_instance):
+        """Marks all the keys in the contest as invalid, because results of
+           ``user`` for ``problem_instance`` have changed.
+
+           Unlike :meth:`invalidate_contest`, this allows rankingsd to update
+           the rankings incrementally.
+        """
+        qs = cls.objects.filter(contest=contest)
+        RankingChange.objects.bulk_create([
+            RankingChange(ranking_id=ranking_id, user=user,
+                          problem_instance=problem_instance)
+            for ranking_id in qs.filter(needs_full_recalculation=False)
+                                .values_list('id', flat=True)])
+        qs.update(needs_recalculation=True, invalidation_date=timezone.now())
+
     def is_up_to_date(self):
         """Is all the data for this contest up to date (i.e. not invalidated
            since the last recalculation succeeded)?
@@ -130,17 +163,74 @@ class RankingPage(models.Model):
     data = models.TextField()
 
 
+class RankingPosition(models.Model):
+    """Position of ``user`` in ``ranking``.
+
+       Positions are saved by rankingsd together with the ranking, so that
+       users may be found in the ranking without decoding it. Lowercase
+       ``*_key`` fields are used for searching users by prefix.
+    """
+    ranking = models.ForeignKey(Ranking, related_name='positions')
+    user = models.ForeignKey(User)
+    position = models.IntegerField()  # 1-based number of the row
+    place = models.IntegerField(null=True)
+    page = models.IntegerField()
+    username_key = models.CharField(max_length=255)
+    name_key = models.CharField(max_length=255)
+    last_name_key = models.CharField(max_length=255)
+
+    class Meta(object):
+        unique_together = ('ranking', 'user')
+        index_together = [
+            ('ranking', 'username_key'),
+            ('ranking', 'name_key'),
+            ('ranking', 'last_name_key'),
+        ]
+
+
+class RankingChange(models.Model):
+    """Results of ``user`` for ``problem_instance`` have changed since
+       the last recalculation of ``ranking``.
+
+       When a recalculation starts, all the pending changes are attached
+       to it. They are deleted together with the recalculation, after its
+       results are saved.
+    """
+    ranking = models.ForeignKey(Ranking, related_name='changes')
+    user = models.ForeignKey(User)
+    problem_instance = models.ForeignKey(ProblemInstance)
+    recalc = models.ForeignKey(RankingRecalc, null=True,
+                               related_name='changes')
+
+
 def clamp(minimum, x, maximum):
     return max(minimum, min(x, maximum))
 
 
 @transaction.atomic
-def choose_for_recalculation():
+def choose_for_recalculation(exclude_busy_contests=False):
+    """Chooses a ranking for recalculation and marks it as being
+       recalculated.
+
+       Rankings which haven't been recalculated for the longest time are
+       chosen first. If ``exclude_busy_contests`` is set, rankings of
+       contests which already have a recalculation in progress are skipped,
+       so that concurrent rankingsd workers don't all end up working on
+       the same big contest. Recalculations started more than
+       ``RANKINGSD_MAX_RECALC_DURATION`` seconds ago are considered dead.
+    """
     now = timezone.now()
-    r = Ranking.objects.filter(
+    qs = Ranking.objects.filter(
         needs_recalculation=True,
         cooldown_date__lt=now
-    ).order_by('last_recalculation_date').select_for_update().first()
+    )
+    if exclude_busy_contests:
+        busy_contests = Ranking.objects.filter(
+            recalc_in_progress__start_date__gt=now - timedelta(
+                seconds=settings.RANKINGSD_MAX_RECALC_DURATION)
+        ).values('contest_id')
+        qs = qs.exclude(contest_id__in=busy_contests)
+    r = qs.order_by('last_recalculation_date').select_for_update().first()
     if r is None:
         return None
     cooldown_duration = clamp(
@@ -150,13 +240,31 @@ def choose_for_recalculation():
     )
     r.cooldown_date = now + cooldown_duration
     r.needs_recalculation = False
-    recalc = RankingRecalc()
+    # If the previous recalculation is still in progress, its results
+    # will be discarded, so we have to take over its changes.
+    previous = r.recalc_in_progress
+    recalc = RankingRecalc(full=r.needs_full_recalculation or
+                           (previous is not None and previous.full))
     recalc.save()
+    r.changes.update(recalc=recalc)
+    r.needs_full_recalculation = False
     r.recalc_in_progress = recalc
     r.save()
     return recalc
 
 
+def recalculation_queue_stats():
+    """Returns a tuple containing the number of rankings waiting for
+       recalculation and the time elapsed since the oldest of their latest
+       invalidations (or ``None`` if there are no such rankings).
+    """
+    stats = Ranking.objects.filter(needs_recalculation=True) \
+            .aggregate(count=Count('id'), oldest=Min('invalidation_date'))
+    if stats['oldest'] is None:
+        return stats['count'], None
+    return stats['count'], timezone.now() - stats['oldest']
+
+
 @transaction.atomic
 def save_pages(ranking, pages_list):
     ranking.pages.all().delete()
@@ -166,15 +274,72 @@ def save_pages(ranking, pages_list):
 
 
 @transaction.atomic
-def save_recalc_results(recalc, date_before, date_after, serialized,
-                        pages_list):
+def update_pages(ranking, pages, num_pages):
+    """Replaces the pages of the ranking whose numbers are keys of
+       ``pages`` and removes pages beyond ``num_pages``.
+    """
+    ranking.pages.filter(nr__gt=num_pages).delete()
+    for nr, page_data in pages.iteritems():
+        updated = ranking.pages.filter(nr=nr).update(data=page_data)
+        if not updated:
+            RankingPage(ranking=ranking, nr=nr, data=page_data).save()
+
+
+@transaction.atomic
+def save_positions(ranking, stored, pages=None):
+    """Replaces :class:`RankingPosition` objects of the ranking with ones
+       describing ``stored``
+       (a :class:`~oioioi.rankings.serialization.StoredRanking`).
+
+       If ``pages`` is given, only the positions on the pages with these
+       numbers are replaced, as the rows on the remaining pages haven't
+       changed since the previous recalculation.
+    """
+    if pages is None:
+        ranking.positions.all().delete()
+        pages = xrange(1, stored.num_pages + 1)
+    else:
+        ranking.positions.filter(Q(page__in=pages) |
+                                 Q(page__gt=stored.num_pages)).delete()
+    on_page = stored.participants_on_page
+    positions = []
+    for nr in pages:
+        for i, row in enumerate(stored.page(nr), (nr - 1) * on_page):
+            positions.append(RankingPosition(
+                ranking=ranking, user_id=row['user_id'], position=i + 1,
+                place=row['place'], page=nr,
+                username_key=row['username'].lower(),
+                name_key=(u'%s %s' % (row['first_name'], row['last_name']))
+                         .lower(),
+                last_name_key=row['last_name'].lower()))
+    RankingPosition.objects.bulk_create(positions, batch_size=1000)
+
+
+@transaction.atomic
+def save_recalc_results(recalc, date_before, date_after, serialized_data,
+                        pages_list, num_pages=None):
+    """Saves the results of the recalculation.
+
+       ``serialized_data`` is the ranking encoded with
+       :func:`~oioioi.rankings.serialization.encode_ranking`.
+
+       If ``num_pages`` is ``None``, ``pages_list`` is a list of all the
+       pages of the ranking. Otherwise it is a dictionary mapping numbers of
+       the pages which have changed to their new contents.
+    """
     try:
         r = Ranking.objects.filter(recalc_in_progress=recalc). \
             select_for_update().get()
     except Ranking.DoesNotExist:
         return
-    r.serialized_data = pickle.dumps(serialized)
-    save_pages(r, pages_list)
+    r.serialized_data = serialized_data
+    stored = decode_ranking(serialized_data)
+    if num_pages is None:
+        save_pages(r, pages_list)
+        save_positions(r, stored)
+    else:
+        update_pages(r, pages_list, num_pages)
+        save_positions(r, stored, sorted(pages_list))
     r.last_recalculation_date = date_before
     r.last_recalculation_duration = date_after - date_before
     old_recalc = r.recalc_in_progress
@@ -191,7 +356,20 @@ def recalculate(recalc):
     except Ranking.DoesNotExist:
         return
     ranking_controller = r.controller()
-    serialized, pages_list = ranking_controller.build_ranking(r.key)
+    update = None
+    stored = r.serialized
+    if not recalc.full and stored is not None:
+        changes = set(recalc.changes.values_list('user_id',
+                                                 'problem_instance_id'))
+        if len(changes) <= settings.RANKING_MAX_INCREMENTAL_CHANGES:
+            update = ranking_controller.update_ranking(r.key, stored,
+                                                       changes)
+    if update is not None:
+        serialized_data, pages, num_pages = update
+    else:
+        serialized, pages = ranking_controller.build_ranking(r.key)
+        serialized_data = ranking_controller.encode_ranking(serialized)
+        num_pages = None
     date_after = timezone.now()
-    save_recalc_results(recalc, date_before, date_after, serialized,
-                        pages_list)
+    save_recalc_results(recalc, date_before, date_after, serialized_data,
+                        pages, num_pages)
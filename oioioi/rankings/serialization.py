@@ -0,0 +1,132 @@
+"""Compact storage format of rankings generated by rankingsd.
+
+   A stored ranking consists of a format line, a header line and one line
+   per ranking row::
+
+       ORANKING <version>
+       <header JSON>
+       <row JSON>
+       <row JSON>
+       ...
+
+   Rows contain only ids, scores, places and strings needed to display them
+   (see :meth:`~oioioi.rankings.controllers.DefaultRankingController
+   ._encode_row`). The header describes the ranking and contains byte
+   offsets of all the rows, so that a single row or page may be read
+   without decoding the rest of the ranking.
+"""
+
+import json
+
+RANKING_FORMAT_MAGIC = 'ORANKING'
+RANKING_FORMAT_VERSION = 1
+
+_SEPARATORS = (',', ':')
+
+
+def encode_ranking(rows, problem_instances, participants_on_page):
+    """Encodes the ranking.
+
+       ``rows`` is a list of JSON-serializable dictionaries, each of them
+       containing a ``user_id`` key. ``problem_instances`` is a list of
+       ``(problem_instance_id, statement_visible)`` pairs.
+    """
+    lines = []
+    offsets = [0]
+    for row in rows:
+        line = json.dumps(row, separators=_SEPARATORS) + '\n'
+        lines.append(line)
+        offsets.append(offsets[-1] + len(line))
+    header = {
+        'problem_instances': [list(pi) for pi in problem_instances],
+        'participants_on_page': participants_on_page,
+        'user_ids': [row['user_id'] for row in rows],
+        'offsets': offsets,
+    }
+    return '%s %d\n%s\n%s' % (RANKING_FORMAT_MAGIC, RANKING_FORMAT_VERSION,
+            json.dumps(header, separators=_SEPARATORS), ''.join(lines))
+
+
+def decode_ranking(data):
+    """Returns a :class:`StoredRanking` for the encoded ``data``, or
+       ``None`` if ``data`` is in an unsupported format (for example it was
+       stored by an older version of rankingsd).
+    """
+    if isinstance(data, memoryview):
+        data = data.tobytes()
+    data = bytes(data)
+    format_end = data.find('\n')
+    if data[:format_end] != '%s %d' % (RANKING_FORMAT_MAGIC,
+                                      RANKING_FORMAT_VERSION):
+        return None
+    return StoredRanking(data, format_end + 1)
+
+
+class StoredRanking(object):
+    """A ranking in the compact storage format.
+
+       Rows are decoded lazily, only when they are accessed.
+    """
+
+    def __init__(self, data, header_start):
+        header_end = data.index('\n', header_start)
+        self._header = json.loads(data[header_start:header_end])
+        self._data = data
+        self._body_start = header_end + 1
+        self._user_positions = None
+
+    @property
+    def num_rows(self):
+        return len(self._header['user_ids'])
+
+    @property
+    def participants_on_page(self):
+        return self._header['participants_on_page']
+
+    @property
+    def num_pages(self):
+        on_page = self.participants_on_page
+        return max((self.num_rows + on_page - 1) // on_page, 1)
+
+    @property
+    def problem_instances(self):
+        """List of ``(problem_instance_id, statement_visible)`` pairs."""
+        return [tuple(pi) for pi in self._header['problem_instances']]
+
+    def rows(self, start=0, stop=None):
+        """Returns decoded rows with indices in range ``[start, stop)``."""
+        start, stop, _step = slice(start, stop).indices(self.num_rows)
+        if start >= stop:
+            return []
+        offsets = self._header['offsets']
+        chunk = self._data[self._body_start + offsets[start]:
+                           self._body_start + offsets[stop]]
+        return [json.loads(line) for line in chunk.splitlines()]
+
+    def row(self, position):
+        """Returns the row with the given (0-based) position."""
+        return self.rows(position, position + 1)[0]
+
+    def page(self, nr):
+        """Returns the rows displayed on the given (1-based) page."""
+        on_page = self.participants_on_page
+        return self.rows((nr - 1) * on_page, nr * on_page)
+
+    def user_position(self, user_id):
+        """Returns the (0-based) position of the user's row, or ``None`` if
+           the user is not in the ranking.
+        """
+        if self._user_positions is None:
+            self._user_positions = dict((user_id, position)
+                    for position, user_id
+                    in enumerate(self._header['user_ids']))
+        return self._user_positions.get(user_id)
+
+    def find_user(self, user_id):
+        """Returns the row of the user, or ``None`` if the user is not in
+           the ranking.
+        """
+        position = self.user_position(user_id)
+        if position is None:
+            return None
+        return self.row(position)
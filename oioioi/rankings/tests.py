@@ -1,8 +1,11 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+import json
+import pickle
 import re
 
 from django.test.utils import override_settings
 from django.core.urlresolvers import reverse
+from django.utils import timezone
 from django.utils.timezone import utc
 from django.contrib.auth.models import User
 from django.http import QueryDict
@@ -13,11 +16,12 @@ from oioioi.base.tests import TestCase, fake_time, fake_timezone_now, \
         check_not_accessible
 from oioioi.contests.models import Contest, UserResultForProblem, \
         ProblemInstance
-from oioioi.contests.scores import IntegerScore
+from oioioi.contests.scores import IntegerScore, ScoreValue
 from oioioi.pa.score import PAScore
 from oioioi.rankings.controllers import DefaultRankingController
 from oioioi.rankings.models import Ranking, RankingPage, recalculate, \
-        choose_for_recalculation, RankingRecalc
+        choose_for_recalculation, RankingRecalc, recalculation_queue_stats
+from oioioi.rankings.serialization import decode_ranking
 from oioioi.programs.controllers import ProgrammingContestController
 
 
@@ -246,7 +250,9 @@ class TestRankingViews(TestCase):
 
 
 class MockRankingController(DefaultRankingController):
-    recalculation_result = ('serialized', ['1st', '2nd', '3rd'])
+    recalculation_result = ({'rows': [], 'problem_instances': [],
+                             'participants_on_page': 100},
+                            ['1st', '2nd', '3rd'])
 
     def build_ranking(self, key):
         assert key == "key"
@@ -287,7 +293,7 @@ class TestRecalc(TestCase):
         recalculate(recalc)
         ranking.refresh_from_db()
         self.assertTrue(ranking.is_up_to_date())
-        self.assertEqual(ranking.serialized, 'serialized')
+        self.assertEqual(ranking.serialized.num_rows, 0)
         self.assertEqual([page.data for page in ranking.pages.all()],
                          ['1st', '2nd', '3rd'])
         self.assertEqual([page.nr for page in ranking.pages.all()],
@@ -310,6 +316,62 @@ class TestRecalc(TestCase):
         recalc = choose_for_recalculation()
         self.assertIsNotNone(recalc)
 
+    @override_settings(MOCK_RANKINGSD=False, PARTICIPANTS_ON_PAGE=1)
+    def test_ranking_positions(self):
+        contest = Contest.objects.get()
+        ranking = Ranking.objects.create(contest=contest, key='admin#c')
+        recalculate(choose_for_recalculation())
+        ranking.refresh_from_db()
+        rows = ranking.serialized.rows()
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(
+                [(p.user_id, p.place, p.page)
+                 for p in ranking.positions.order_by('position')],
+                [(row['user_id'], row['place'], i + 1)
+                 for i, row in enumerate(rows)])
+
+        self.client.login(username='test_admin')
+        url = reverse('get_users_in_ranking',
+                      kwargs={'contest_id': contest.id})
+        with fake_time(datetime(2015, 8, 5, tzinfo=utc)):
+            response = self.client.get(url, {'key': 'c', 'substr': 'TEST_u'})
+            self.assertEqual(len(json.loads(response.content)), 2)
+            response = self.client.get(url, {'key': 'c',
+                                             'substr': 'test  user 2'})
+            self.assertEqual(json.loads(response.content),
+                             ['test_user2 (Test User 2)'])
+
+            ranking_url = reverse('ranking',
+                    kwargs={'contest_id': contest.id, 'key': 'c'})
+            response = self.client.get(ranking_url, {'user': 'test_user2'})
+            position = ranking.positions.get(user__username='test_user2')
+            self.assertRedirects(response, ranking_url + '?page=%d#%d'
+                                 % (position.page, position.user_id))
+
+    def test_exclude_busy_contests(self):
+        contest = Contest.objects.get()
+        Ranking.objects.create(contest=contest, key='admin#c')
+        Ranking.objects.create(contest=contest, key='regular#c')
+        Ranking.objects.update(
+                cooldown_date=timezone.now() - timedelta(seconds=1))
+
+        self.assertIsNotNone(choose_for_recalculation(
+                exclude_busy_contests=True))
+        # The other ranking of this contest has to wait.
+        self.assertIsNone(choose_for_recalculation(
+                exclude_busy_contests=True))
+        self.assertIsNotNone(choose_for_recalculation())
+
+        # Stale recalculations don't block the contest.
+        Ranking.objects.update(needs_recalculation=True,
+                cooldown_date=timezone.now() - timedelta(seconds=1))
+        RankingRecalc.objects.update(start_date=timezone.now() -
+                timedelta(seconds=settings.RANKINGSD_MAX_RECALC_DURATION + 1))
+        self.assertIsNotNone(choose_for_recalculation(
+                exclude_busy_contests=True))
+
+        self.assertEqual(recalculation_queue_stats()[0], 1)
+
     def test_null_checking(self):
         contest = Contest.objects.get()
         ranking, _ = Ranking.objects.get_or_create(contest=contest, key='key')
@@ -329,6 +391,129 @@ class TestRecalc(TestCase):
             bool(ranking.recalc_in_progress)
         self.assertFalse(ranking.is_up_to_date())
 
+    @override_settings(PARTICIPANTS_ON_PAGE=2)
+    def test_incremental_recalc(self):
+        contest = Contest.objects.get()
+        pi = ProblemInstance.objects.get(id=1)
+        users = []
+        for i in xrange(5):
+            user = User.objects.create_user('incremental%d' % i)
+            UserResultForProblem(user=user, problem_instance=pi, status='OK',
+                                 score=IntegerScore(10 * i)).save()
+            users.append(user)
+
+        ranking, _ = Ranking.objects.get_or_create(contest=contest,
+                                                   key='admin#c')
+        recalculate(choose_for_recalculation())
+        ranking.refresh_from_db()
+        self.assertTrue(ranking.is_up_to_date())
+        self.assertFalse(ranking.needs_full_recalculation)
+
+        # Move the worst user to the top of the ranking.
+        result = UserResultForProblem.objects.get(user=users[0],
+                                                  problem_instance=pi)
+        result.score = IntegerScore(1000)
+        result.save()
+        Ranking.invalidate_results(contest, users[0], pi)
+        ranking.refresh_from_db()
+        self.assertFalse(ranking.is_up_to_date())
+        self.assertEqual(ranking.changes.count(), 1)
+
+        Ranking.objects.update(
+                cooldown_date=timezone.now() - timedelta(seconds=1))
+        recalc = choose_for_recalculation()
+        self.assertFalse(recalc.full)
+        self.assertEqual(recalc.changes.count(), 1)
+        recalculate(recalc)
+        ranking.refresh_from_db()
+        self.assertTrue(ranking.is_up_to_date())
+        self.assertFalse(ranking.changes.exists())
+
+        expected, expected_pages = \
+                contest.controller.ranking_controller().build_ranking(
+                    ranking.key)
+        self.assertEqual(
+                [(row['user_id'], row['place'])
+                 for row in ranking.serialized.rows()],
+                [(row['user'].id, row['place']) for row in expected['rows']])
+        self.assertEqual([page.data for page in
+                          ranking.pages.order_by('nr')], expected_pages)
+        self.assertEqual(
+                [(p.user_id, p.place, p.page)
+                 for p in ranking.positions.order_by('position')],
+                [(row['user'].id, row['place'], i // 2 + 1)
+                 for i, row in enumerate(expected['rows'])])
+
+        # Any other invalidation requires a full recalculation.
+        Ranking.invalidate_contest(contest)
+        Ranking.objects.update(
+                cooldown_date=timezone.now() - timedelta(seconds=1))
+        self.assertTrue(choose_for_recalculation().full)
+
+    def test_incremental_recalc_ties(self):
+        contest = Contest.objects.get()
+        pi = ProblemInstance.objects.get(id=1)
+        # The order of these names depends on the database collation.
+        users = [User.objects.create_user('tie%d' % i, last_name=last_name)
+                 for i, last_name in enumerate(['b', 'A', 'a', u'\u0105'])]
+        for user in users:
+            UserResultForProblem(user=user, problem_instance=pi, status='OK',
+                                 score=IntegerScore(10)).save()
+
+        ranking, _ = Ranking.objects.get_or_create(contest=contest,
+                                                   key='admin#c')
+        recalculate(choose_for_recalculation())
+        Ranking.invalidate_results(contest, users[2], pi)
+        Ranking.objects.update(
+                cooldown_date=timezone.now() - timedelta(seconds=1))
+        recalc = choose_for_recalculation()
+        self.assertFalse(recalc.full)
+        recalculate(recalc)
+        ranking.refresh_from_db()
+
+        expected, _pages = \
+                contest.controller.ranking_controller().build_ranking(
+                    ranking.key)
+        self.assertEqual(
+                [row['user_id'] for row in ranking.serialized.rows()],
+                [row['user'].id for row in expected['rows']])
+
+
+class TestRankingSerialization(TestCase):
+    fixtures = ['test_users', 'test_contest', 'test_full_package',
+            'test_problem_instance', 'test_submission', 'test_extra_rounds',
+            'test_ranking_data', 'test_permissions']
+
+    @override_settings(PARTICIPANTS_ON_PAGE=2)
+    def test_encode_decode(self):
+        contest = Contest.objects.get()
+        controller = contest.controller.ranking_controller()
+        data = controller.serialize_ranking('admin#c')
+        stored = decode_ranking(controller.encode_ranking(data))
+
+        self.assertEqual(stored.num_rows, len(data['rows']))
+        self.assertEqual(stored.num_pages,
+                         max((len(data['rows']) + 1) // 2, 1))
+        self.assertEqual(stored.problem_instances,
+                [(pi.id, visible) for pi, visible in data['problem_instances']])
+        for i, row in enumerate(data['rows']):
+            encoded = stored.row(i)
+            self.assertEqual(encoded['user_id'], row['user'].id)
+            self.assertEqual(encoded['username'], row['user'].username)
+            self.assertEqual(encoded['place'], row['place'])
+            self.assertEqual(ScoreValue.deserialize(encoded['sum']),
+                             row['sum'])
+            self.assertEqual(stored.user_position(row['user'].id), i)
+            self.assertEqual(stored.find_user(row['user'].id), encoded)
+        self.assertEqual([row['user_id'] for row in stored.page(1)],
+                         [row['user'].id for row in data['rows'][:2]])
+        self.assertEqual(stored.page(stored.num_pages + 1), [])
+        self.assertIsNone(stored.find_user(-1))
+
+    def test_legacy_format(self):
+        self.assertIsNone(decode_ranking(pickle.dumps({'rows': []})))
+
+
 class TestRankingsdFrontend(TestCase):
     fixtures = ['test_users', 'test_contest', 'test_full_package',
             'test_problem_instance', 'test_submission', 'test_extra_rounds',
@@ -8,7 +8,8 @@ from django.contrib import messages
 
 from oioioi.base.permissions import enforce_condition, make_request_condition
 from oioioi.base.menu import menu_registry
-from oioioi.base.utils.user_selection import get_user_hints_view
+from oioioi.base.utils import jsonify
+from oioioi.base.utils.user_selection import get_user_hints
 from oioioi.contests.models import Submission
 from oioioi.contests.utils import can_enter_contest, is_contest_admin, \
     contest_exists
@@ -23,9 +24,19 @@ def has_any_ranking_visible(request):
 
 @enforce_condition(contest_exists & can_enter_contest & is_contest_admin)
 @enforce_condition(has_any_ranking_visible)
+@jsonify
 def get_users_in_ranking_view(request):
-    queryset = Submission.objects
-    return get_user_hints_view(request, 'substr', queryset, 'user')
+    key = request.GET.get('key')
+    substr = request.GET.get('substr', '')
+    hints = None
+    if key is not None and len(substr) >= 2:
+        rcontroller = request.contest.controller.ranking_controller()
+        hints = rcontroller.get_user_hints(request, key, substr)
+    if hints is None:
+        hints = get_user_hints(substr, Submission.objects, 'user')
+    if hints is None:
+        raise Http404
+    return hints
 
 
 @menu_registry.register_decorator(_("Ranking"), lambda request:
@@ -47,7 +58,7 @@ def ranking_view(request, key=None):
     ranking = None
 
     if rcontroller.can_search_for_users():
-        form = FilterUsersInRankingForm(request, request.GET)
+        form = FilterUsersInRankingForm(request, key, request.GET)
         context['form'] = form
 
         if form.is_valid():
@@ -3,8 +3,12 @@ import logging
 import re
 import shutil
 import tempfile
+import time
 import os
 import zipfile
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
 import chardet
 
 from django.conf import settings
@@ -22,11 +26,11 @@ from oioioi.problems.models import Problem, ProblemAttachment, \
     ProblemPackage, ProblemSite, ProblemStatement
 from oioioi.problems.package import ProblemPackageBackend, ProblemPackageError
 from oioioi.programs.models import Test, OutputChecker, ModelSolution, \
-    LibraryProblemData
+    LibraryProblemData, invalidate_tests_cache
 from oioioi.sinolpack.models import ExtraConfig, ExtraFile, OriginalPackage
 from oioioi.sinolpack.utils import add_extra_files
 from oioioi.filetracker.utils import stream_file, django_to_filetracker_path, \
-    filetracker_to_django_file
+    filetracker_to_django_file, DeduplicatedFile
 from oioioi.filetracker.client import get_client
 from oioioi.sioworkers.jobs import run_sioworkers_job, run_sioworkers_jobs
 
@@ -69,6 +73,18 @@ def _make_filename_in_job_dir(env, base_name):
     return '%s/%s-%s' % (env['unpack_dir'], env['job_id'], base_name)
 
 
+def _store_file(storage, name, path):
+    with open(path, 'rb') as f:
+        return storage.save(name, DeduplicatedFile(f))
+
+
+def _store_file_from_filetracker(storage, name, ft_path, path):
+    get_client().get_file(ft_path, path)
+    name = _store_file(storage, name, path)
+    get_client().delete_file(ft_path)
+    return name
+
+
 def _remove_from_zip(zipfname, *filenames):
     """Removes files from zip file by creating new zip file with all
        the files except the files to remove. Then the old file is removed.
@@ -115,6 +131,9 @@ class SinolPackage(object):
                 {'c': C_EXTRA_ARGS, 'cpp': C_EXTRA_ARGS, 'pas': PAS_EXTRA_ARGS}
         self.use_make = settings.USE_SINOLPACK_MAKEFILES
         self.use_sandboxes = not settings.USE_UNSAFE_EXEC
+        self.upload_pool = None
+        self.pending_uploads = {}
+        self.stage_times = []
 
     def identify(self):
         return self._find_main_dir() is not None
@@ -149,11 +168,12 @@ class SinolPackage(object):
 
         return None
 
-    def _save_to_field(self, field, file):
+    def _save_to_field(self, field, file, file_class=File):
         basename = os.path.basename(filetracker_to_django_file(file).name)
         filename = os.path.join(self.rootdir, basename)
         get_client().get_file(file, filename)
-        field.save(os.path.basename(filename), File(open(filename, 'rb')))
+        field.save(os.path.basename(filename),
+                   file_class(open(filename, 'rb')))
         get_client().delete_file(file)
 
     def _find_and_compile(self, suffix, command=None, cwd=None,
@@ -318,9 +338,11 @@ class SinolPackage(object):
         tmpdir = tempfile.mkdtemp()
         logger.info("%s: tmpdir is %s", self.filename, tmpdir)
         try:
-            self.archive.extract(to_path=tmpdir)
+            with self._timed_stage('extraction'):
+                self.archive.extract(to_path=tmpdir)
             self.rootdir = os.path.join(tmpdir, self.short_name)
             self._process_package()
+            self._save_processing_times()
 
             return self.problem
         finally:
@@ -329,21 +351,48 @@ class SinolPackage(object):
                 get_client().delete_file(self.prog_archive)
 
     def _process_package(self):
-        self._process_config_yml()
-        self._detect_full_name()
-        self._detect_library()
-        self._process_extra_files()
-        if self.use_make:
-            self._extract_makefiles()
-        else:
-            self._save_prog_dir()
-        self._process_statements()
-        self._generate_tests()
-        self._process_checkers()
-        self._process_model_solutions()
-        self._process_attachments()
+        with self._timed_stage('config'):
+            self._process_config_yml()
+            self._detect_full_name()
+            self._detect_library()
+            self._process_extra_files()
+            if self.use_make:
+                self._extract_makefiles()
+            else:
+                self._save_prog_dir()
+        with self._timed_stage('statements'):
+            self._process_statements()
+        with self._timed_stage('tests'):
+            self._generate_tests()
+        with self._timed_stage('checkers'):
+            self._process_checkers()
+        with self._timed_stage('model solutions'):
+            self._process_model_solutions()
+        with self._timed_stage('attachments'):
+            self._process_attachments()
         self._save_original_package()
 
+    @contextmanager
+    def _timed_stage(self, stage):
+        start = time.time()
+        yield
+        self._add_stage_time(stage, time.time() - start)
+
+    def _add_stage_time(self, stage, duration):
+        logger.info("%s: %s took %.2fs", self.filename, stage, duration)
+        self.stage_times.append((stage, duration))
+
+    def _save_processing_times(self):
+        """Writes durations of the processing stages to the package
+           ``info``. Stages of the pipelined tests processing overlap,
+           so their durations may add up to more than the total time.
+        """
+        self.package.info = _("Processing times: %s") % ', '.join(
+                '%s %.1fs' % (stage, duration)
+                for stage, duration in self.stage_times)
+        ProblemPackage.objects.filter(id=self.package.id) \
+                .update(info=self.package.info)
+
     def _process_config_yml(self):
         """Parses config file from problem dir, saves its content to
            the current instance.
@@ -533,12 +582,15 @@ class SinolPackage(object):
         if self.use_make:
             self._find_and_compile('', command='outgen')
 
-        created_tests, outs_to_make, scored_groups = \
-            self._create_instances_for_tests()
+        if self.use_make or settings.SINOLPACK_UNPACK_THREADS <= 1:
+            created_tests, outs_to_make, scored_groups = \
+                self._create_instances_for_tests()
 
-        self._verify_time_limits(created_tests)
-        self._verify_inputs(created_tests)
-        self._generate_test_outputs(created_tests, outs_to_make)
+            self._verify_time_limits(created_tests)
+            self._verify_inputs(created_tests)
+            self._generate_test_outputs(created_tests, outs_to_make)
+        else:
+            created_tests, scored_groups = self._generate_tests_pipelined()
         self._validate_tests(created_tests)
         self._delete_non_existing_tests(created_tests)
 
@@ -618,28 +670,34 @@ class SinolPackage(object):
             jobs = {}
 
             for test in tests:
-                job = env.copy()
-                job['job_type'] = 'inwer'
-                job['task_priority'] = TASK_PRIORITY
-                job['exe_file'] = env['compiled_file']
-                job['in_file'] = django_to_filetracker_path(test.input_file)
-                job['use_sandboxes'] = self.use_sandboxes
-                jobs[test.name] = job
+                jobs[test.name] = self._make_inwer_job(env, test)
 
             jobs = run_sioworkers_jobs(jobs)
             get_client().delete_file(env['compiled_file'])
 
             for test_name, job in jobs.iteritems():
-                if job['result_code'] != 'OK':
-                    raise ProblemPackageError(_("Inwer failed on test "
-                        "%(test)s. Inwer output %(output)s") %
-                        {
-                            'test': test_name,
-                            'output': '\n'.join(job['stdout'])}
-                        )
+                self._check_inwer_result(test_name, job)
 
             logger.info("%s: inwer success", self.filename)
 
+    def _make_inwer_job(self, env, test):
+        job = env.copy()
+        job['job_type'] = 'inwer'
+        job['task_priority'] = TASK_PRIORITY
+        job['exe_file'] = env['compiled_file']
+        job['in_file'] = django_to_filetracker_path(test.input_file)
+        job['use_sandboxes'] = self.use_sandboxes
+        return job
+
+    def _check_inwer_result(self, test_name, job):
+        if job['result_code'] != 'OK':
+            raise ProblemPackageError(_("Inwer failed on test "
+                "%(test)s. Inwer output %(output)s") %
+                {
+                    'test': test_name,
+                    'output': '\n'.join(job['stdout'])}
+                )
+
     def _generate_test_outputs(self, tests, outs_to_make):
         if not self.use_make:
             outs = self._make_outs(outs_to_make)
@@ -647,7 +705,8 @@ class SinolPackage(object):
                 if instance.name in outs:
                     generated_out = outs[instance.name]
                     self._save_to_field(instance.output_file,
-                                        generated_out['out_file'])
+                                        generated_out['out_file'],
+                                        DeduplicatedFile)
 
     def _validate_tests(self, created_tests):
         """Check if all tests have output files and that
@@ -710,12 +769,13 @@ class SinolPackage(object):
         outname = os.path.join(outdir, outname_base)
 
         if test in collected_ins:
-            self._save_to_field(instance.input_file, collected_ins[test])
+            self._save_test_file(instance.input_file,
+                                 ft_path=collected_ins[test])
         else:
-            instance.input_file.save(inname_base, File(open(inname, 'rb')))
+            self._save_test_file(instance.input_file, path=inname)
 
         if os.path.isfile(outname):
-            instance.output_file.save(outname_base, File(open(outname), 'rb'))
+            self._save_test_file(instance.output_file, path=outname)
 
         outs_to_make.append((_make_filename_in_job_dir(self.env,
                 'out/%s' % (outname_base)), instance))
@@ -741,6 +801,135 @@ class SinolPackage(object):
         instance.save()
         return instance
 
+    def _save_test_file(self, field, path=None, ft_path=None):
+        """Saves a local file or a file from Filetracker to the ``field``
+           of a test.
+
+           When tests are processed concurrently, the file is only
+           scheduled for saving in the upload pool and the field is set by
+           :meth:`_finish_upload`.
+        """
+        if self.upload_pool is None:
+            if ft_path:
+                self._save_to_field(field, ft_path, DeduplicatedFile)
+            else:
+                field.save(os.path.basename(path),
+                           DeduplicatedFile(open(path, 'rb')))
+            return
+
+        if ft_path:
+            path = os.path.join(self.rootdir, os.path.basename(
+                    filetracker_to_django_file(ft_path).name))
+        name = field.field.generate_filename(field.instance,
+                                             os.path.basename(path))
+        if ft_path:
+            result = self.upload_pool.apply_async(
+                    _store_file_from_filetracker,
+                    (field.storage, name, ft_path, path))
+        else:
+            result = self.upload_pool.apply_async(_store_file,
+                    (field.storage, name, path))
+        self.pending_uploads[(field.instance.name, field.field.name)] = \
+                result
+
+    def _finish_upload(self, instance, field_name):
+        """Waits for the file scheduled by :meth:`_save_test_file` and sets
+           it in the field of the test (without saving the test).
+        """
+        result = self.pending_uploads.pop((instance.name, field_name), None)
+        if result is not None:
+            setattr(instance, field_name, result.get())
+
+    def _generate_tests_pipelined(self):
+        """Creates tests like :meth:`_create_instances_for_tests`, but
+           overlaps the processing stages.
+
+           Test files are uploaded to Filetracker by a pool of
+           ``SINOLPACK_UNPACK_THREADS`` threads, while inwer and outgen are
+           being compiled. Then inwer and outgen jobs are dispatched in
+           batches of ``SINOLPACK_UNPACK_BATCH_SIZE`` tests as soon as
+           inputs of the tests are uploaded.
+
+           :return: Pair (created tests instances,
+                          score groups (determined by test names))
+        """
+        threads = settings.SINOLPACK_UNPACK_THREADS
+        batch_size = settings.SINOLPACK_UNPACK_BATCH_SIZE
+        self.upload_pool = ThreadPool(threads)
+        jobs_pool = ThreadPool(threads)
+        try:
+            start = time.time()
+            created_tests, outs_to_make, scored_groups = \
+                self._create_instances_for_tests()
+            self._verify_time_limits(created_tests)
+
+            inwer_env = self._find_and_compile('inwer')
+            outgen_env = self._find_and_compile('', command='outgen')
+            outnames = dict((test.name, outname)
+                            for outname, test in outs_to_make)
+
+            jobs_start = time.time()
+            batches = []
+            jobs = {}
+            for test in created_tests:
+                self._finish_upload(test, 'input_file')
+                if inwer_env:
+                    jobs['inwer-' + test.name] = \
+                            self._make_inwer_job(inwer_env, test)
+                if outgen_env:
+                    jobs['outgen-' + test.name] = self._make_outgen_job(
+                            outgen_env, outnames[test.name], test)
+                if len(jobs) >= batch_size:
+                    batches.append(jobs_pool.apply_async(run_sioworkers_jobs,
+                                                         (jobs,)))
+                    jobs = {}
+            if jobs:
+                batches.append(jobs_pool.apply_async(run_sioworkers_jobs,
+                                                     (jobs,)))
+
+            for test in created_tests:
+                self._finish_upload(test, 'output_file')
+            self._add_stage_time('test files', time.time() - start)
+
+            results = {}
+            for batch in batches:
+                results.update(batch.get())
+            self._add_stage_time('inwer and outgen', time.time() - jobs_start)
+
+            for env in (inwer_env, outgen_env):
+                if env:
+                    get_client().delete_file(env['compiled_file'])
+
+            if inwer_env:
+                try:
+                    for test in created_tests:
+                        self._check_inwer_result(test.name,
+                                                 results['inwer-' + test.name])
+                except ProblemPackageError:
+                    if outgen_env:
+                        for test in created_tests:
+                            get_client().delete_file(
+                                results['outgen-' + test.name]['out_file'])
+                    raise
+                logger.info("%s: inwer success", self.filename)
+
+            if outgen_env:
+                for test in created_tests:
+                    self._save_test_file(test.output_file,
+                            ft_path=results['outgen-' + test.name]['out_file'])
+                for test in created_tests:
+                    self._finish_upload(test, 'output_file')
+
+            for test in created_tests:
+                test.save()
+            return created_tests, scored_groups
+        finally:
+            for pool in (self.upload_pool, jobs_pool):
+                pool.close()
+                pool.join()
+            self.upload_pool = None
+            self.pending_uploads = {}
+
     def _get_memory_limit(self, created, name):
         """If we find the memory limit specified anywhere in the package:
            either in the config.yml or in the problem statement, then we
@@ -771,19 +960,22 @@ class SinolPackage(object):
 
         jobs = {}
         for outname, test in outs_to_make:
-            job = env.copy()
-            job['job_type'] = 'exec' if self.use_sandboxes else 'unsafe-exec'
-            job['task_priority'] = TASK_PRIORITY
-            job['exe_file'] = env['compiled_file']
-            job['upload_out'] = True
-            job['in_file'] = django_to_filetracker_path(test.input_file)
-            job['out_file'] = outname
-            jobs[test.name] = job
+            jobs[test.name] = self._make_outgen_job(env, outname, test)
 
         jobs = run_sioworkers_jobs(jobs)
         get_client().delete_file(env['compiled_file'])
         return jobs
 
+    def _make_outgen_job(self, env, outname, test):
+        job = env.copy()
+        job['job_type'] = 'exec' if self.use_sandboxes else 'unsafe-exec'
+        job['task_priority'] = TASK_PRIORITY
+        job['exe_file'] = env['compiled_file']
+        job['upload_out'] = True
+        job['in_file'] = django_to_filetracker_path(test.input_file)
+        job['out_file'] = outname
+        return job
+
     def _check_scores_from_config(self, scored_groups, config_scores):
         """Makes sure that all scored tests are present in config
            and that nothing else is there.
@@ -852,6 +1044,7 @@ class SinolPackage(object):
         for group, score in scores.iteritems():
             Test.objects.filter(problem_instance=self.main_problem_instance,
                                 group=group).update(max_score=score)
+        invalidate_tests_cache(self.main_problem_instance.id)
 
     def _process_checkers(self):
         """Compiles output checker and saves its binary.
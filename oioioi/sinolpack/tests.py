@@ -340,6 +340,20 @@ class TestSinolPackage(TestCase):
         problem = Problem.objects.get()
         self._check_full_package(problem)
 
+    @attr('slow')
+    @override_settings(USE_SINOLPACK_MAKEFILES=False,
+                       SINOLPACK_UNPACK_THREADS=4,
+                       SINOLPACK_UNPACK_BATCH_SIZE=3)
+    def test_pipelined_unpack(self):
+        filename = get_test_filename('test_full_package.tgz')
+        call_command('addproblem', filename)
+        problem = Problem.objects.get()
+        self._check_full_package(problem)
+
+        info = ProblemPackage.objects.get().info
+        self.assertIn("Processing times", info)
+        self.assertIn("inwer and outgen", info)
+
     def _check_interactive_package(self, problem):
         self.assertEqual(problem.short_name, 'arc')
 
@@ -1,11 +1,17 @@
 import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
 import sio.workers.runner
 import sio.celery.job
 
 from django.db import transaction
 from django.conf import settings
 
-from xmlrpclib import Server
+from xmlrpclib import Server, Fault
 
 
 # This is a workaround for SIO-915. We assume that other parts of OIOIOI code
@@ -16,21 +22,68 @@ from threading import Lock
 
 from oioioi.evalmgr.tasks import delay_environ
 
+logger = logging.getLogger(__name__)
+
 _local_backend_lock = Lock()
 
+_local_pool = None
+_local_pool_lock = Lock()
+
+
+def _run_job_in_pool(job):
+    """Runs the job in a worker process of the local pool, in a separate
+       temporary working directory.
+    """
+    tmpdir = tempfile.mkdtemp(prefix='sioworkers-')
+    cwd = os.getcwd()
+    os.chdir(tmpdir)
+    try:
+        return sio.workers.runner.run(job)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def _get_local_pool():
+    # pylint: disable=global-statement
+    global _local_pool
+    processes = settings.SIOWORKERS_LOCAL_BACKEND_PROCESSES
+    with _local_pool_lock:
+        if _local_pool is None or _local_pool[0] != processes:
+            if _local_pool is not None:
+                _local_pool[1].close()
+            _local_pool = (processes, multiprocessing.Pool(processes))
+        return _local_pool[1]
+
 
 class LocalBackend(object):
     """A simple sioworkers backend which executes the work in the calling
        process.
 
+       If ``SIOWORKERS_LOCAL_BACKEND_PROCESSES`` is greater than 1, the jobs
+       are executed in a pool of that many processes instead, so that
+       independent jobs (e.g. tests of a submission) run in parallel.
+
        Perfect for tests or a single-machine OIOIOI setup.
     """
 
+    def _use_pool(self):
+        return settings.SIOWORKERS_LOCAL_BACKEND_PROCESSES > 1
+
     def run_job(self, job, **kwargs):
+        if self._use_pool():
+            return _get_local_pool().apply(_run_job_in_pool, (job,))
         with _local_backend_lock:
             return sio.workers.runner.run(job)
 
     def run_jobs(self, dict_of_jobs, **kwargs):
+        if self._use_pool():
+            pool = _get_local_pool()
+            async_results = [(key, pool.apply_async(_run_job_in_pool,
+                                                    (value,)))
+                             for key, value in dict_of_jobs.iteritems()]
+            return dict((key, result.get())
+                        for key, result in async_results)
         results = {}
         for key, value in dict_of_jobs.iteritems():
             results[key] = self.run_job(value, **kwargs)
@@ -47,42 +100,144 @@ class LocalBackend(object):
             delay_environ(env)
 
 
-class SioworkersdBackend(object):
-    """A backend which collaborates with sioworkersd"""
-    server = Server(settings.SIOWORKERSD_URL, allow_none=True)
+class _ServerProxyPool(object):
+    """A thread-safe pool of XML-RPC proxies to a single server.
 
-    def run_job(self, job, **kwargs):
-        env = {'workers_jobs': {'dummy_name': job}}
-        env['workers_jobs.extra_args'] = kwargs
-        env['oioioi_instance'] = settings.SITE_NAME
-        env['contest_priority'] = (settings.OIOIOI_INSTANCE_PRIORITY_BONUS +
-            settings.NON_CONTEST_PRIORITY)
-        env['contest_weight'] = (settings.OIOIOI_INSTANCE_WEIGHT_BONUS +
-            settings.NON_CONTEST_WEIGHT)
-        ans = SioworkersdBackend.server.sync_run_group(json.dumps(env))
-        if 'error' in ans:
-            raise RuntimeError('Error from workers:\n%s\nTB:\n%s' %
-                (ans['error']['message'], ans['error']['traceback']))
-        return ans['workers_jobs.results']['dummy_name']
+       Each proxy has its own transport, which keeps the HTTP connection
+       to the server alive between calls, so subsequent calls don't need
+       to open a new connection. A proxy is used by one thread at a time.
+       At most ``size`` idle proxies are kept in the pool.
+    """
 
-    def run_jobs(self, dict_of_jobs, **kwargs):
+    def __init__(self, url, size):
+        self.url = url
+        self.size = size
+        self._idle = []
+        self._lock = Lock()
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        return Server(self.url, allow_none=True)
+
+    def _release(self, proxy):
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(proxy)
+                return
+        proxy('close')()
+
+    def call(self, method, *args):
+        proxy = self._acquire()
+        try:
+            result = getattr(proxy, method)(*args)
+        except Fault:
+            self._release(proxy)
+            raise
+        except Exception:
+            # The connection may be broken, so the proxy is not reused.
+            proxy('close')()
+            raise
+        self._release(proxy)
+        return result
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for proxy in idle:
+            proxy('close')()
+
+
+_server_pools = {}
+_server_pools_lock = Lock()
+
+
+def _get_server_pool(url):
+    with _server_pools_lock:
+        pool = _server_pools.get(url)
+        if pool is None:
+            pool = _server_pools[url] = _ServerProxyPool(url,
+                    settings.SIOWORKERSD_CONNECTION_POOL_SIZE)
+        return pool
+
+
+class _CallStats(object):
+    """Thread-safe statistics of durations of calls to sioworkersd."""
+
+    def __init__(self):
+        self._lock = Lock()
+        self._stats = {}
+
+    def add(self, method, duration):
+        with self._lock:
+            count, total, longest = self._stats.get(method, (0, 0., 0.))
+            self._stats[method] = (count + 1, total + duration,
+                                   max(longest, duration))
+
+    def get(self):
+        """Returns a dictionary mapping names of the called methods to
+           ``(number of calls, total duration, longest duration)`` tuples,
+           where durations are in seconds.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+
+class SioworkersdBackend(object):
+    """A backend which collaborates with sioworkersd.
+
+       Connections to sioworkersd are pooled and kept alive (see
+       ``SIOWORKERSD_CONNECTION_POOL_SIZE``). Durations of the calls are
+       logged and collected in :attr:`call_stats`.
+    """
+    call_stats = _CallStats()
+
+    def _call(self, method, *args):
+        pool = _get_server_pool(settings.SIOWORKERSD_URL)
+        start = time.time()
+        try:
+            return pool.call(method, *args)
+        finally:
+            duration = time.time() - start
+            SioworkersdBackend.call_stats.add(method, duration)
+            logger.debug("sioworkersd call %s took %.3fs", method, duration)
+
+    def _make_sync_env(self, dict_of_jobs, extra_args):
         env = {'workers_jobs': dict_of_jobs,
-                'workers_jobs.extra_args': kwargs}
+                'workers_jobs.extra_args': extra_args}
         env['oioioi_instance'] = settings.SITE_NAME
         env['contest_priority'] = (settings.OIOIOI_INSTANCE_PRIORITY_BONUS +
             settings.NON_CONTEST_PRIORITY)
         env['contest_weight'] = (settings.OIOIOI_INSTANCE_WEIGHT_BONUS +
             settings.NON_CONTEST_WEIGHT)
-        ans = SioworkersdBackend.server.sync_run_group(json.dumps(env))
+        return env
+
+    def _sync_run_group(self, env):
+        ans = self._call('sync_run_group', json.dumps(env))
         if 'error' in ans:
             raise RuntimeError('Error from workers:\n%s\nTB:\n%s' %
                 (ans['error']['message'], ans['error']['traceback']))
         return ans['workers_jobs.results']
 
-    def send_async_jobs(self, env, **kwargs):
+    def run_job(self, job, **kwargs):
+        env = self._make_sync_env({'dummy_name': job}, kwargs)
+        return self._sync_run_group(env)['dummy_name']
+
+    def run_jobs(self, dict_of_jobs, **kwargs):
+        return self._sync_run_group(self._make_sync_env(dict_of_jobs, kwargs))
+
+    def _set_return_url(self, env):
         url = settings.SIOWORKERS_LISTEN_URL
         if url is None:
             url = 'http://' + settings.SIOWORKERS_LISTEN_ADDR + ':' \
                 + str(settings.SIOWORKERS_LISTEN_PORT)
         env['return_url'] = url
-        SioworkersdBackend.server.run_group(json.dumps(env))
+
+    def send_async_jobs(self, env, **kwargs):
+        self._set_return_url(env)
+        self._call('run_group', json.dumps(env))
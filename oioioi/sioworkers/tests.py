@@ -1,5 +1,11 @@
+import json
+import threading
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
 from django.test import TestCase
+from django.test.utils import override_settings
 
+from oioioi.sioworkers.backends import SioworkersdBackend, _get_server_pool
 from oioioi.sioworkers.jobs import run_sioworkers_job, run_sioworkers_jobs
 
 
@@ -13,3 +19,88 @@ class TestSioworkersBindings(TestCase):
         self.assertEqual(envs['key1'].get('pong'), 'e1')
         self.assertEqual(envs['key2'].get('pong'), 'e2')
         self.assertEqual(len(envs), 2)
+
+    @override_settings(SIOWORKERS_LOCAL_BACKEND_PROCESSES=2)
+    def test_local_backend_pool(self):
+        jobs = dict(('key%d' % i, dict(job_type='ping', ping='e%d' % i))
+                    for i in xrange(5))
+        envs = run_sioworkers_jobs(jobs)
+        self.assertEqual(sorted(envs.keys()), sorted(jobs.keys()))
+        for key, env in envs.iteritems():
+            self.assertEqual(env.get('pong'), jobs[key]['ping'])
+        env = run_sioworkers_job(dict(job_type='ping', ping='e1'))
+        self.assertEqual(env.get('pong'), 'e1')
+
+
+class _StubRequestHandler(SimpleXMLRPCRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        SimpleXMLRPCRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_POST(self):
+        self.server.requests += 1
+        SimpleXMLRPCRequestHandler.do_POST(self)
+
+
+class _StubSioworkersd(SimpleXMLRPCServer):
+    """Minimal XML-RPC server imitating sioworkersd."""
+
+    def __init__(self):
+        SimpleXMLRPCServer.__init__(self, ('127.0.0.1', 0),
+                requestHandler=_StubRequestHandler, logRequests=False,
+                allow_none=True)
+        self.connections = 0
+        self.requests = 0
+        self.groups = []
+        self.register_function(self.sync_run_group, 'sync_run_group')
+        self.register_function(self.run_group, 'run_group')
+
+    @property
+    def url(self):
+        return 'http://%s:%d/' % self.server_address
+
+    def sync_run_group(self, env):
+        env = json.loads(env)
+        results = {}
+        for name, job in env['workers_jobs'].iteritems():
+            results[name] = dict(job, pong=job['ping'])
+        return {'workers_jobs.results': results}
+
+    def run_group(self, env):
+        self.groups.append(json.loads(env))
+        return 'OK'
+
+
+class TestSioworkersdBackend(TestCase):
+    def setUp(self):
+        self.server = _StubSioworkersd()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        SioworkersdBackend.call_stats.reset()
+
+    def tearDown(self):
+        # Idle keep-alive connections would block the server's shutdown.
+        _get_server_pool(self.server.url).close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_connection_reuse(self):
+        with override_settings(SIOWORKERSD_URL=self.server.url):
+            backend = SioworkersdBackend()
+            for i in xrange(3):
+                result = backend.run_job(dict(job_type='ping', ping=str(i)))
+                self.assertEqual(result['pong'], str(i))
+            results = backend.run_jobs(
+                    dict(key1=dict(job_type='ping', ping='e1'),
+                         key2=dict(job_type='ping', ping='e2')))
+            self.assertEqual(results['key2']['pong'], 'e2')
+        self.assertEqual(self.server.requests, 4)
+        self.assertEqual(self.server.connections, 1)
+        count, total, longest = \
+                SioworkersdBackend.call_stats.get()['sync_run_group']
+        self.assertEqual(count, 4)
+        self.assertTrue(0 <= longest <= total)
@@ -11,7 +11,9 @@ from oioioi.statistics.plottypes import TablePlot, \
         BarPercentStaticHighchartsPlot
 from oioioi.statistics.plotfunctions import points_histogram_contest, \
         submissions_histogram_contest, points_histogram_problem, \
-        points_to_source_length_problem, test_scores
+        points_to_source_length_problem, test_scores, \
+        points_percentiles_contest, points_percentiles_problem, \
+        test_pass_rates
 from oioioi.statistics.models import StatisticsConfig
 
 statistics_categories = EnumRegistry()
@@ -23,14 +25,20 @@ statistics_plot_kinds.register('POINTS_HISTOGRAM_CONTEST',
     (points_histogram_contest, ColumnStaticHighchartsPlot()))
 statistics_plot_kinds.register('SUBMISSIONS_HISTOGRAM_CONTEST',
     (submissions_histogram_contest, ColumnStaticHighchartsPlot(),))
+statistics_plot_kinds.register('POINTS_PERCENTILES_CONTEST',
+    (points_percentiles_contest, TablePlot()))
 statistics_plot_kinds.register('POINTS_HISTOGRAM_PROBLEM',
     (points_histogram_problem, ColumnStaticHighchartsPlot()))
 statistics_plot_kinds.register('POINTS_TABLE_PROBLEM',
     (points_histogram_problem, TablePlot()))
+statistics_plot_kinds.register('POINTS_PERCENTILES_PROBLEM',
+    (points_percentiles_problem, TablePlot()))
 statistics_plot_kinds.register('POINTS_TO_SOURCE_LENGTH_PROBLEM',
     (points_to_source_length_problem, PointsToSourceLengthProblemPlot()))
 statistics_plot_kinds.register('TEST_SCORES_TABLE_PROBLEM',
     (test_scores, BarPercentStaticHighchartsPlot()))
+statistics_plot_kinds.register('TEST_PASS_RATES_PROBLEM',
+    (test_pass_rates, ColumnStaticHighchartsPlot()))
 
 
 class StatisticsMixinForContestController(object):
@@ -212,12 +220,16 @@ class StatisticsMixinForProgrammingContestController(object):
             if any(pi_results_visible(pi) and not pi.round.is_trial
                    for pi in pis):
                 result.append(plot_kind('POINTS_HISTOGRAM_CONTEST', object))
+                result.append(plot_kind('POINTS_PERCENTILES_CONTEST',
+                                        object))
 
         if category == 'PROBLEM':
             result.append(plot_kind('POINTS_HISTOGRAM_PROBLEM', object))
             result.append(plot_kind('POINTS_TABLE_PROBLEM', object))
+            result.append(plot_kind('POINTS_PERCENTILES_PROBLEM', object))
             result.append(plot_kind('POINTS_TO_SOURCE_LENGTH_PROBLEM', object))
             result.append(plot_kind('TEST_SCORES_TABLE_PROBLEM', object))
+            result.append(plot_kind('TEST_PASS_RATES_PROBLEM', object))
 
         return result
 
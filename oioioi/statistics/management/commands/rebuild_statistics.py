@@ -0,0 +1,29 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.utils.translation import ugettext as _
+
+from oioioi.statistics.models import rebuild_statistics
+
+
+class Command(BaseCommand):
+    args = ""
+    help = _("Recompute the statistics from scratch. Statistics are updated "
+             "incrementally when submissions get judged, so this is only "
+             "needed after the results were changed bypassing the models, "
+             "e.g. with bulk updates or after loading fixtures.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('-c', '--contest',
+                    action='store',
+                    type='string',
+                    dest='contest_id',
+                    help=_("Rebuild only statistics of this contest")),
+    )
+
+    def handle(self, *args, **options):
+        contest_ids = None
+        if options['contest_id']:
+            contest_ids = [options['contest_id']]
+        rebuild_statistics(contest_ids)
+        self.stdout.write(_("Statistics rebuilt.\n"))
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def rebuild_statistics(apps, schema_editor):
+    from oioioi.statistics.models import rebuild_statistics
+    rebuild_statistics(apps=apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contests', '0009_filefield'),
+        ('programs', '0005_filefield'),
+        ('statistics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContestScoreCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('score', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('contest', models.ForeignKey(to='contests.Contest')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ProblemScoreCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('score', models.IntegerField()),
+                ('count', models.IntegerField(default=0)),
+                ('problem_instance', models.ForeignKey(to='contests.ProblemInstance')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SubmissionStatusCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('status', models.CharField(max_length=64)),
+                ('count', models.IntegerField(default=0)),
+                ('problem_instance', models.ForeignKey(to='contests.ProblemInstance')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TestStatusCount',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('test_name', models.CharField(max_length=30)),
+                ('status', models.CharField(max_length=64)),
+                ('count', models.IntegerField(default=0)),
+                ('problem_instance', models.ForeignKey(to='contests.ProblemInstance')),
+                ('test', models.ForeignKey(on_delete=django.db.models.deletion.SET_NULL, blank=True, to='programs.Test', null=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='contestscorecount',
+            unique_together=set([('contest', 'score')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='problemscorecount',
+            unique_together=set([('problem_instance', 'score')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='submissionstatuscount',
+            unique_together=set([('problem_instance', 'status')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='teststatuscount',
+            unique_together=set([('problem_instance', 'test', 'test_name', 'status')]),
+        ),
+        migrations.RunPython(rebuild_statistics, migrations.RunPython.noop),
+    ]
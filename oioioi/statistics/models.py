@@ -1,7 +1,14 @@
-from django.db import models
+from django.apps import apps as global_apps
+from django.db import models, transaction, IntegrityError
+from django.db.models import Count, F
+from django.db.models.signals import class_prepared, post_init, \
+        pre_save, post_save, pre_delete
 from django.utils.translation import ugettext_lazy as _
-from oioioi.contests.models import Contest
+
+from oioioi.contests.models import Contest, ProblemInstance, Submission, \
+        UserResultForProblem, UserResultForContest
 from oioioi.contests.date_registration import date_registry
+from oioioi.programs.models import Test, TestReport
 
 
 @date_registry.register('visibility_date',
@@ -16,3 +23,319 @@ class StatisticsConfig(models.Model):
     class Meta(object):
         verbose_name = _("statistics configuration")
         verbose_name_plural = _("statistics configurations")
+
+
+# The models below are a materialized store of the data the statistics
+# plots are drawn from. They are updated incrementally whenever the results
+# or submissions change (see :func:`_track_changes`), so that the plots
+# don't need to scan all the submissions of a contest. The store may be
+# recomputed from scratch with the ``rebuild_statistics`` management command.
+
+class ContestScoreCount(models.Model):
+    """Number of users with the given (integer) score for the contest."""
+    contest = models.ForeignKey(Contest)
+    score = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta(object):
+        unique_together = ('contest', 'score')
+
+
+class ProblemScoreCount(models.Model):
+    """Number of users with the given (integer) score for the problem."""
+    problem_instance = models.ForeignKey(ProblemInstance)
+    score = models.IntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta(object):
+        unique_together = ('problem_instance', 'score')
+
+
+class SubmissionStatusCount(models.Model):
+    """Number of normal submissions to the problem with the given status."""
+    problem_instance = models.ForeignKey(ProblemInstance)
+    status = models.CharField(max_length=64)
+    count = models.IntegerField(default=0)
+
+    class Meta(object):
+        unique_together = ('problem_instance', 'status')
+
+
+class TestStatusCount(models.Model):
+    """Number of reports with the given status for the test, counting only
+       the reports the users' results for the problem are based on.
+    """
+    problem_instance = models.ForeignKey(ProblemInstance)
+    test = models.ForeignKey(Test, blank=True, null=True,
+            on_delete=models.SET_NULL)
+    test_name = models.CharField(max_length=30)
+    status = models.CharField(max_length=64)
+    count = models.IntegerField(default=0)
+
+    class Meta(object):
+        unique_together = ('problem_instance', 'test', 'test_name', 'status')
+
+
+def _int_score(score):
+    return score.to_int() if callable(getattr(score, 'to_int', None)) else 0
+
+
+def _add_count(model, delta, **key):
+    if model.objects.filter(**key).update(count=F('count') + delta) \
+            or delta <= 0:
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(count=delta, **key)
+    except IntegrityError:
+        # Someone else has just created the row.
+        model.objects.filter(**key).update(count=F('count') + delta)
+
+
+def _add_test_counts(problem_instance_id, submission_report_id, delta):
+    agg = TestReport.objects \
+            .filter(submission_report_id=submission_report_id) \
+            .values('test', 'test_name', 'status') \
+            .annotate(count=Count('id')).order_by()
+    for a in agg:
+        _add_count(TestStatusCount, delta * a['count'],
+                   problem_instance_id=problem_instance_id,
+                   test_id=a['test'], test_name=a['test_name'],
+                   status=a['status'])
+
+
+def _model_and_subclasses(model):
+    yield model
+    for subclass in model.__subclasses__():
+        for cls in _model_and_subclasses(subclass):
+            yield cls
+
+
+def _track_changes(model, fields, on_change, convert=tuple,
+                   delete_sender=None):
+    """Calls ``on_change(old, new)`` whenever an instance of ``model`` (or
+       of its subclass) is saved or deleted and the values of ``fields``
+       change. ``old`` and ``new`` are the values before and after
+       the change, passed through ``convert`` (which should return
+       something comparable), or ``None`` for a nonexistent instance.
+
+       The old values are remembered when an instance is loaded from the
+       database, so usually no additional queries are needed. Raw saves
+       (i.e. loading fixtures) are ignored.
+
+       When a subclass instance is deleted, the parent instances get deleted
+       as well, so only deletions with ``delete_sender`` (``model`` by
+       default) are taken into account.
+
+       Bulk operations, like :meth:`QuerySet.update`, send no signals, so
+       the code using them must update the store itself (see
+       :func:`bulk_update_submission_status`).
+    """
+    attr = '_statistics_old_values'
+    if delete_sender is None:
+        delete_sender = model
+
+    def current_values(instance):
+        return convert(getattr(instance, f) for f in fields)
+
+    def post_init_handler(sender, instance, **kwargs):
+        if instance.pk is not None:
+            values = instance.__dict__
+            if all(f in values for f in fields):
+                setattr(instance, attr, convert(values[f] for f in fields))
+
+    def pre_save_handler(sender, instance, raw=False, **kwargs):
+        if raw or hasattr(instance, attr):
+            return
+        old = None
+        if instance.pk is not None:
+            old = model._base_manager.filter(pk=instance.pk) \
+                    .values_list(*fields).first()
+        setattr(instance, attr, old and convert(old))
+
+    def post_save_handler(sender, instance, raw=False, **kwargs):
+        new = current_values(instance)
+        if not raw:
+            old = getattr(instance, attr, None)
+            if old != new:
+                on_change(old, new)
+        setattr(instance, attr, new)
+
+    def pre_delete_handler(sender, instance, **kwargs):
+        old = getattr(instance, attr, None) or current_values(instance)
+        on_change(old, None)
+        setattr(instance, attr, None)
+
+    def connect(cls):
+        for signal, handler in ((post_init, post_init_handler),
+                                (pre_save, pre_save_handler),
+                                (post_save, post_save_handler)):
+            signal.connect(handler, sender=cls, weak=False,
+                           dispatch_uid='statistics_%s_%s'
+                                % (cls._meta.label, handler.__name__))
+        if cls is delete_sender:
+            pre_delete.connect(pre_delete_handler, sender=cls, weak=False,
+                               dispatch_uid='statistics_%s_%s'
+                                    % (cls._meta.label,
+                                       pre_delete_handler.__name__))
+
+    # Signals are sent with the actual class of the instance as the sender,
+    # so the handlers are connected to ``model`` and to each of its
+    # subclasses, including the ones defined later (and the deferred
+    # classes Django creates for querysets with deferred fields).
+    def class_prepared_handler(sender, **kwargs):
+        if issubclass(sender, model):
+            connect(sender)
+
+    for cls in _model_and_subclasses(model):
+        connect(cls)
+    class_prepared.connect(class_prepared_handler, weak=False,
+                           dispatch_uid='statistics_%s_class_prepared'
+                                % (model._meta.label,))
+
+
+def _contest_result_changed(old, new):
+    for values, delta in ((old, -1), (new, 1)):
+        if values is not None:
+            contest_id, score = values
+            _add_count(ContestScoreCount, delta, contest_id=contest_id,
+                       score=score)
+
+
+def _problem_result_changed(old, new):
+    same_report = old is not None and new is not None \
+            and old[0] == new[0] and old[2] == new[2]
+    for values, delta in ((old, -1), (new, 1)):
+        if values is not None:
+            problem_instance_id, score, submission_report_id = values
+            _add_count(ProblemScoreCount, delta,
+                       problem_instance_id=problem_instance_id,
+                       score=score)
+            if submission_report_id is not None and not same_report:
+                _add_test_counts(problem_instance_id, submission_report_id,
+                                 delta)
+
+
+def _submission_changed(old, new):
+    for values, delta in ((old, -1), (new, 1)):
+        if values is not None:
+            problem_instance_id, kind, status = values
+            if kind == 'NORMAL':
+                _add_count(SubmissionStatusCount, delta,
+                           problem_instance_id=problem_instance_id,
+                           status=status)
+
+
+def _with_int_score(values):
+    # The score is the second field. Scores are converted to integers, as
+    # they are counted, and because score classes may not support
+    # comparing with other types or None.
+    return tuple(_int_score(value) if i == 1 else value
+                 for i, value in enumerate(values))
+
+
+def bulk_update_submission_status(submissions, status, **fields):
+    """Sets the status (and other ``fields``) of ``submissions`` with
+       :meth:`QuerySet.update` and updates :class:`SubmissionStatusCount`
+       accordingly, which wouldn't happen otherwise, as no signals are sent.
+    """
+    with transaction.atomic():
+        changed = submissions.filter(kind='NORMAL').exclude(status=status) \
+                .values('problem_instance', 'status') \
+                .annotate(count=Count('id')).order_by()
+        for a in list(changed):
+            _add_count(SubmissionStatusCount, -a['count'],
+                       problem_instance_id=a['problem_instance'],
+                       status=a['status'])
+            _add_count(SubmissionStatusCount, a['count'],
+                       problem_instance_id=a['problem_instance'],
+                       status=status)
+        return submissions.update(status=status, **fields)
+
+
+_track_changes(UserResultForContest, ('contest_id', 'score'),
+               _contest_result_changed, _with_int_score)
+_track_changes(UserResultForProblem,
+               ('problem_instance_id', 'score', 'submission_report_id'),
+               _problem_result_changed, _with_int_score)
+_track_changes(Submission, ('problem_instance_id', 'kind', 'status'),
+               _submission_changed)
+
+
+def _contest_filter(contest_ids, field):
+    if contest_ids is None:
+        return {}
+    return {field + '__in': contest_ids}
+
+
+def rebuild_statistics(contest_ids=None, apps=global_apps):
+    """Recomputes the statistics store of the given contests (or of all
+       problems, if ``contest_ids`` is ``None``) from scratch.
+
+       ``apps`` is the registry to take the models from, so that the
+       function may be used in migrations.
+    """
+    get_model = apps.get_model
+    result_for_contest = get_model('contests', 'UserResultForContest')
+    result_for_problem = get_model('contests', 'UserResultForProblem')
+    submission = get_model('contests', 'Submission')
+    test_report = get_model('programs', 'TestReport')
+    contest_score_count = get_model('statistics', 'ContestScoreCount')
+    problem_score_count = get_model('statistics', 'ProblemScoreCount')
+    submission_status_count = get_model('statistics',
+                                        'SubmissionStatusCount')
+    test_status_count = get_model('statistics', 'TestStatusCount')
+
+    with transaction.atomic():
+        pi_filter = _contest_filter(contest_ids, 'problem_instance__contest')
+
+        contest_score_count.objects \
+                .filter(**_contest_filter(contest_ids, 'contest')).delete()
+        counts = {}
+        for a in result_for_contest.objects \
+                .filter(**_contest_filter(contest_ids, 'contest')) \
+                .values('contest', 'score') \
+                .annotate(count=Count('id')).order_by():
+            key = (a['contest'], _int_score(a['score']))
+            counts[key] = counts.get(key, 0) + a['count']
+        contest_score_count.objects.bulk_create(
+                contest_score_count(contest_id=contest_id, score=score,
+                                    count=count)
+                for (contest_id, score), count in counts.iteritems())
+
+        problem_score_count.objects.filter(**pi_filter).delete()
+        counts = {}
+        for a in result_for_problem.objects.filter(**pi_filter) \
+                .values('problem_instance', 'score') \
+                .annotate(count=Count('id')).order_by():
+            key = (a['problem_instance'], _int_score(a['score']))
+            counts[key] = counts.get(key, 0) + a['count']
+        problem_score_count.objects.bulk_create(
+                problem_score_count(problem_instance_id=pi_id, score=score,
+                                    count=count)
+                for (pi_id, score), count in counts.iteritems())
+
+        submission_status_count.objects.filter(**pi_filter).delete()
+        submission_status_count.objects.bulk_create(
+                submission_status_count(
+                        problem_instance_id=a['problem_instance'],
+                        status=a['status'], count=a['count'])
+                for a in submission.objects.filter(kind='NORMAL',
+                                                   **pi_filter)
+                    .values('problem_instance', 'status')
+                    .annotate(count=Count('id')).order_by())
+
+        test_status_count.objects.filter(**pi_filter).delete()
+        result_pi = 'submission_report__userresultforproblem__' \
+                'problem_instance'
+        test_status_count.objects.bulk_create(
+                test_status_count(problem_instance_id=a[result_pi],
+                                  test_id=a['test'],
+                                  test_name=a['test_name'],
+                                  status=a['status'], count=a['count'])
+                for a in test_report.objects
+                    .filter(**_contest_filter(contest_ids,
+                                              result_pi + '__contest'))
+                    .filter(**{result_pi + '__isnull': False})
+                    .values(result_pi, 'test', 'test_name', 'status')
+                    .annotate(count=Count('id')).order_by())
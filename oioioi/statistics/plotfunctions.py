@@ -1,17 +1,18 @@
 # -*- coding: utf-8 -*-
-from itertools import groupby
+import math
 from operator import itemgetter
 from collections import defaultdict
 
 from nose.tools import nottest
 from django.utils.translation import ugettext as _
-from django.db.models import Count
+from django.db.models import Count, Sum
 from django.core.urlresolvers import reverse
 
 from oioioi.contests.utils import is_contest_admin, is_contest_observer
-from oioioi.contests.models import Submission, \
-        UserResultForProblem, UserResultForContest, ScoreReport
-from oioioi.programs.models import ProgramSubmission, TestReport
+from oioioi.contests.models import UserResultForProblem, ScoreReport
+from oioioi.programs.models import ProgramSubmission
+from oioioi.statistics.models import ContestScoreCount, ProblemScoreCount, \
+        SubmissionStatusCount, TestStatusCount
 
 
 def int_score(score, default=0):
@@ -29,10 +30,18 @@ def histogram(values, num_buckets=10, max_result=None):
            lower bounds of bucket limits; counts contain the numbers of
            elements going in particular buckets.
     """
+    return histogram_from_counts([(value, 1) for value in values],
+                                 num_buckets, max_result)
+
+
+def histogram_from_counts(counts, num_buckets=10, max_result=None):
+    """Like :func:`histogram`, but takes a list of ``(value, count)``
+       pairs, meaning that ``value`` occurs ``count`` times.
+    """
     assert num_buckets > 0, "Non positive number of buckets for histogram"
 
-    if max_result is None and values:
-        max_result = max(values)
+    if max_result is None and counts:
+        max_result = max(value for value, _count in counts)
 
     if max_result:
         if max_result < num_buckets:
@@ -42,23 +51,21 @@ def histogram(values, num_buckets=10, max_result=None):
         if (max_result % num_buckets) != 0:
             num_buckets += 1
 
-        counts = [0] * (num_buckets+1)
+        buckets = [0] * (num_buckets+1)
     else:
         bucket = 1
-        counts = [0]
+        buckets = [0]
 
-    for key, group in groupby(values, key=(lambda x: x / bucket)):
-        counts[key] += len(list(group))
+    for value, count in counts:
+        buckets[value / bucket] += count
 
     return [list(tup) for tup in
-            zip(*[[i*bucket, value] for i, value in enumerate(counts)])]
+            zip(*[[i*bucket, value] for i, value in enumerate(buckets)])]
 
 
-def results_histogram_for_queryset(request, qs, max_score=None):
-    scores = [int_score(r.score) for r in qs]
-
+def results_histogram_for_counts(request, counts, max_score=None):
     max_score = int_score(max_score, None)
-    keys_left, data = histogram(scores, max_result=max_score)
+    keys_left, data = histogram_from_counts(counts, max_result=max_score)
 
     keys = ['[%d;%d)' % p for p in zip(keys_left[:-1], keys_left[1:])]
     keys.append('[%d;∞)' % keys_left[-1])
@@ -73,28 +80,105 @@ def results_histogram_for_queryset(request, qs, max_score=None):
     }
 
 
+def int_score_counts(qs):
+    """Returns a list of ``(score, count)`` pairs for the results in
+       ``qs``, with scores converted by :func:`int_score`.
+
+       Counting is done by the database, so that only the distinct scores
+       are deserialized.
+    """
+    counts = defaultdict(int)
+    for a in qs.values('score').annotate(count=Count('id')).order_by():
+        counts[int_score(a['score'])] += a['count']
+    return counts.items()
+
+
+def results_histogram_for_queryset(request, qs, max_score=None):
+    return results_histogram_for_counts(request, int_score_counts(qs),
+            max_score)
+
+
+def percentiles_from_counts(counts, percents):
+    """Calculates percentiles of values given as a list of
+       ``(value, count)`` pairs, meaning that ``value`` occurs ``count``
+       times, using the nearest-rank method.
+
+       :param percents: List of percents (from 0 to 100) to compute the
+           percentiles for.
+       :returns: A list of values, one for every element of ``percents``,
+           or an empty list if there are no values.
+    """
+    counts = sorted((value, count) for value, count in counts if count > 0)
+    total = sum(count for _value, count in counts)
+    if not total:
+        return []
+    result = []
+    for percent in percents:
+        rank = max(1, int(math.ceil(percent * total / 100.)))
+        seen = 0
+        for value, count in counts:
+            seen += count
+            if seen >= rank:
+                result.append(value)
+                break
+    return result
+
+
+PERCENTS = (10, 25, 50, 75, 90)
+
+
+def results_percentiles_for_counts(request, counts, series_name):
+    percentiles = percentiles_from_counts(counts, PERCENTS)
+    return {
+        'plot_name': _("Results percentiles"),
+        'data': [percentiles] if percentiles else [],
+        'keys': ['%d%%' % percent for percent in PERCENTS],
+        'series': [series_name],
+    }
+
+
 def points_histogram_contest(request, contest):
-    results = UserResultForContest.objects.filter(contest=contest)
-    return results_histogram_for_queryset(request, results)
+    counts = ContestScoreCount.objects.filter(contest=contest, count__gt=0) \
+            .values_list('score', 'count')
+    return results_histogram_for_counts(request, list(counts))
 
 
 def points_histogram_problem(request, problem):
-    results = UserResultForProblem.objects.filter(problem_instance=problem)
+    counts = ProblemScoreCount.objects \
+            .filter(problem_instance=problem, count__gt=0) \
+            .values_list('score', 'count')
 
     # Check if user has any submissions for the specified problem
-    if results and results[0].submission_report is not None:
-        max_score = results[0].submission_report \
-                .score_report.max_score
+    result = UserResultForProblem.objects.filter(problem_instance=problem) \
+            .select_related('submission_report').first()
+    if result is not None and result.submission_report is not None:
+        max_score = result.submission_report.score_report.max_score
     else:
         max_score = None
 
-    return results_histogram_for_queryset(request, results,
+    return results_histogram_for_counts(request, list(counts),
             max_score=max_score)
 
 
-def submissions_by_problem_histogram_for_queryset(request, qs):
-    agg = qs.values('problem_instance', 'problem_instance__short_name',
-                    'status').annotate(count=Count('problem_instance'))
+def points_percentiles_contest(request, contest):
+    counts = ContestScoreCount.objects.filter(contest=contest, count__gt=0) \
+            .values_list('score', 'count')
+    return results_percentiles_for_counts(request, list(counts),
+            contest.name)
+
+
+def points_percentiles_problem(request, problem):
+    counts = ProblemScoreCount.objects \
+            .filter(problem_instance=problem, count__gt=0) \
+            .values_list('score', 'count')
+    return results_percentiles_for_counts(request, list(counts),
+            problem.short_name)
+
+
+def submissions_by_problem_histogram_for_counts(request, agg):
+    """``agg`` is a list of dictionaries with ``problem_instance``,
+       ``problem_instance__short_name``, ``status`` and ``count`` keys.
+    """
     agg = sorted(agg, key=itemgetter('status'))
     statuses = list(set(a['status'] for a in agg))
     pis = list(set((a['problem_instance'], a['problem_instance__short_name'])
@@ -114,11 +198,18 @@ def submissions_by_problem_histogram_for_queryset(request, qs):
     }
 
 
+def submissions_by_problem_histogram_for_queryset(request, qs):
+    agg = qs.values('problem_instance', 'problem_instance__short_name',
+                    'status').annotate(count=Count('problem_instance'))
+    return submissions_by_problem_histogram_for_counts(request, agg)
+
+
 def submissions_histogram_contest(request, contest):
-    subs = Submission.objects.filter(kind='NORMAL') \
-            .filter(problem_instance__contest=contest) \
-            .prefetch_related('problem_instance')
-    return submissions_by_problem_histogram_for_queryset(request, subs)
+    agg = SubmissionStatusCount.objects \
+            .filter(problem_instance__contest=contest, count__gt=0) \
+            .values('problem_instance', 'problem_instance__short_name',
+                    'status', 'count')
+    return submissions_by_problem_histogram_for_counts(request, agg)
 
 
 def points_to_source_length_problem(request, problem):
@@ -135,6 +226,7 @@ def points_to_source_length_problem(request, problem):
         visible_submissions = \
                 controller.filter_my_visible_submissions(request, submissions)
 
+    visible_ids = set(visible_submissions.values_list('id', flat=True))
     data = []
 
     for s in submissions:
@@ -144,7 +236,7 @@ def points_to_source_length_problem(request, problem):
 
         kwargs = {'submission_id': s.id,
                   'contest_id': contest.id}
-        if visible_submissions.filter(id=s.id).exists():
+        if s.id in visible_ids:
             record['url'] = reverse('submission', kwargs=kwargs)
         elif controller.can_see_source(request, s.submission_ptr):
             record['url'] = reverse('show_submission_source', kwargs=kwargs)
@@ -184,10 +276,10 @@ def test_scores(request, problem):
     # Why .order_by()? Just in case. More in the following link:
     # https://docs.djangoproject.com/en/dev/topics/db/
     #       aggregation/#interaction-with-default-ordering-or-order-by
-    agg = TestReport.objects.filter(
-        submission_report__userresultforproblem__problem_instance=problem) \
+    agg = TestStatusCount.objects.filter(problem_instance=problem,
+                                         count__gt=0) \
         .values('test', 'test__order', 'test_name', 'status') \
-        .annotate(status_count=Count('status')).order_by()
+        .annotate(status_count=Sum('count')).order_by()
 
     statuses = sorted(set(a['status'] for a in agg))
     tests = set((a['test'], a['test_name'], a['test__order']) for a in agg)
@@ -204,3 +296,35 @@ def test_scores(request, problem):
         'keys': [test_name for _x, test_name, _x in tests],
         'series': statuses,
     }
+
+
+@nottest
+def test_pass_rates(request, problem):
+    agg = TestStatusCount.objects.filter(problem_instance=problem,
+                                         count__gt=0) \
+        .values('test', 'test__order', 'test_name', 'status') \
+        .annotate(status_count=Sum('count')).order_by()
+
+    tests = set((a['test'], a['test_name'], a['test__order']) for a in agg)
+    tests = sorted(tests, key=lambda x: (x[2], x[1]))
+
+    all_count = defaultdict(int)
+    ok_count = defaultdict(int)
+    for a in agg:
+        key = (a['test'], a['test_name'])
+        all_count[key] += a['status_count']
+        if a['status'] == 'OK':
+            ok_count[key] += a['status_count']
+    data = [round(100. * ok_count[test, test_name]
+                  / all_count[test, test_name], 1)
+            for test, test_name, _x in tests]
+
+    return {
+        'plot_name': _("Test pass rates"),
+        'data': [data],
+        'keys': [test_name for _x, test_name, _x in tests],
+        'titles': {'yAxis': _("% of passed")},
+        'y_min': 0,
+        'y_max': 100,
+        'series': [_("passed")],
+    }
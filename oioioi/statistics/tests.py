@@ -5,15 +5,24 @@ from django.test import RequestFactory
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.utils.timezone import utc
+from nose.plugins.attrib import attr
 
 from oioioi.base.tests import TestCase, fake_time
 from oioioi.contests.models import Contest
 from oioioi.statistics.plotfunctions import histogram, \
-                points_to_source_length_problem, test_scores
+                points_to_source_length_problem, test_scores, \
+                points_histogram_contest, results_histogram_for_queryset, \
+                percentiles_from_counts, points_percentiles_problem, \
+                test_pass_rates
 from oioioi.contests.models import ProblemInstance
 from oioioi.statistics.controllers import statistics_categories, \
                                           statistics_plot_kinds
-from oioioi.statistics.models import StatisticsConfig
+from oioioi.contests.models import Submission, UserResultForProblem, \
+        UserResultForContest
+from oioioi.contests.scores import IntegerScore
+from oioioi.statistics.models import StatisticsConfig, ContestScoreCount, \
+        ProblemScoreCount, SubmissionStatusCount, TestStatusCount, \
+        rebuild_statistics, bulk_update_submission_status
 
 
 class TestStatisticsPlotFunctions(TestCase):
@@ -21,6 +30,7 @@ class TestStatisticsPlotFunctions(TestCase):
             'test_problem_instance', 'test_submission']
 
     def setUp(self):
+        rebuild_statistics()
         self.request = RequestFactory().request()
         self.request.user = User.objects.get(username='test_user')
         self.request.contest = Contest.objects.get()
@@ -58,6 +68,19 @@ class TestStatisticsPlotFunctions(TestCase):
         result4 = [[0], [1]]
         self.assertEqual(histogram(test4), result4)
 
+        test5 = [100, 0, 50, 0, 100, 50]
+        self.assertEqual(histogram(test5), result1)
+
+    def test_percentiles(self):
+        counts = [(100, 1), (0, 2), (50, 1), (30, 0)]
+        self.assertEqual(percentiles_from_counts(counts, [0, 25, 50, 75, 100]),
+                         [0, 0, 0, 50, 100])
+        self.assertEqual(percentiles_from_counts([], [50]), [])
+
+        pi = ProblemInstance.objects.get(short_name='zad1')
+        plot = points_percentiles_problem(self.request, pi)
+        self.assertSizes(plot['data'], [1, len(plot['keys'])])
+
     def test_points_to_source_length(self):
         pi = ProblemInstance.objects.get(short_name='zad1')
         plot = points_to_source_length_problem(self.request, pi)
@@ -73,12 +96,21 @@ class TestStatisticsPlotFunctions(TestCase):
         self.assertIn('OK', plot['series'])
         self.assertIn('WA', plot['series'])
 
+    def test_test_pass_rates(self):
+        pi = ProblemInstance.objects.get(short_name='zad1')
+        plot = test_pass_rates(self.request, pi)
+        self.assertEqual(len(plot['keys']), 4)
+        self.assertSizes(plot['data'], [1, 4])
+        for rate in plot['data'][0]:
+            self.assertTrue(0 <= rate <= 100)
+
 
 class TestHighchartsOptions(TestCase):
     fixtures = ['test_users', 'test_contest', 'test_full_package',
             'test_problem_instance', 'test_submission', 'test_extra_rounds']
 
     def setUp(self):
+        rebuild_statistics()
         self.request = RequestFactory().request()
         self.request.user = User.objects.get(username='test_user')
         self.request.contest = Contest.objects.get()
@@ -125,6 +157,9 @@ class TestStatisticsViews(TestCase):
     fixtures = ['test_users', 'test_contest', 'test_full_package',
             'test_problem_instance', 'test_submission', 'test_extra_rounds']
 
+    def setUp(self):
+        rebuild_statistics()
+
     def test_statistics_view(self):
         contest = Contest.objects.get()
         url = reverse('statistics_main', kwargs={'contest_id': contest.id})
@@ -164,3 +199,76 @@ class TestStatisticsViews(TestCase):
                               'category': statistics_categories['PROBLEM'][1],
                               'object_name': 'zad2'})
             self.assertContains(response, url)
+
+
+class TestStatisticsStore(TestCase):
+    fixtures = ['test_users', 'test_contest', 'test_full_package',
+            'test_problem_instance', 'test_submission']
+
+    def _stored(self):
+        return dict((model.__name__, sorted(model.objects.filter(count__gt=0)
+                        .values_list(*fields)))
+                    for model, fields in [
+                        (ContestScoreCount, ('contest', 'score', 'count')),
+                        (ProblemScoreCount,
+                            ('problem_instance', 'score', 'count')),
+                        (SubmissionStatusCount,
+                            ('problem_instance', 'status', 'count')),
+                        (TestStatusCount, ('problem_instance', 'test',
+                                           'test_name', 'status', 'count'))])
+
+    def assertStoreConsistent(self):
+        stored = self._stored()
+        rebuild_statistics()
+        self.assertEqual(stored, self._stored())
+
+    def test_incremental_updates(self):
+        rebuild_statistics()
+        self.assertIn((1, 34, 1), self._stored()['ProblemScoreCount'])
+
+        submission = Submission.objects.get(id=1)
+        submission.status = 'WA'
+        submission.save()
+        result = UserResultForProblem.objects.get()
+        result.score = IntegerScore(10)
+        result.submission_report_id = 1
+        result.save()
+        UserResultForContest.objects.get().delete()
+        self.assertStoreConsistent()
+        self.assertEqual(self._stored()['ProblemScoreCount'], [(1, 10, 1)])
+
+        Submission.objects.get(id=1).delete()
+        self.assertStoreConsistent()
+        self.assertEqual(self._stored()['TestStatusCount'], [])
+
+    def test_bulk_status_update(self):
+        rebuild_statistics()
+        bulk_update_submission_status(Submission.objects.filter(id=1), 'IGN',
+                                      score=None)
+        self.assertStoreConsistent()
+        self.assertIn((1, 'IGN', 1), self._stored()['SubmissionStatusCount'])
+
+        # Loading a subclass instance uses the handlers connected to it.
+        submission = Submission.objects.get(id=1).programsubmission
+        submission.status = 'OK'
+        submission.save()
+        self.assertStoreConsistent()
+
+    @attr('slow')
+    def test_large_contest(self):
+        contest = Contest.objects.get()
+        User.objects.bulk_create(User(username='synthetic%d' % i)
+                                 for i in xrange(100000))
+        UserResultForContest.objects.bulk_create(
+                UserResultForContest(user_id=user_id, contest=contest,
+                                     score=IntegerScore(user_id % 101))
+                for user_id in User.objects
+                    .filter(username__startswith='synthetic')
+                    .values_list('id', flat=True))
+        rebuild_statistics([contest.id])
+
+        request = RequestFactory().request()
+        with self.assertNumQueriesLessThan(2):
+            plot = points_histogram_contest(request, contest)
+        self.assertEqual(plot, results_histogram_for_queryset(request,
+                UserResultForContest.objects.filter(contest=contest)))